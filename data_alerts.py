@@ -0,0 +1,340 @@
+
+import os
+import json
+import math
+import queue
+import socket
+import threading
+import subprocess
+from collections import deque
+
+# longest rule name (in ascii characters) that fits the events dataset
+RULE_NAME_LENGTH = 64
+
+# rows of the ``events`` dataset of a logger file, ``active`` is 1 when the
+# rule became active and 0 when it cleared
+EVENT_DTYPE = [('timestamp', 'f8'), ('rule', 'S{}'.format(RULE_NAME_LENGTH)), ('active', 'i1'),
+    ('value', 'f8')]
+
+class Rule(object):
+    '''
+    Base class for alert rules on a single dataset, ``update(t, value)`` is
+    called with every sample and returns ``True`` when the rule becomes
+    active, ``False`` when it clears and ``None`` otherwise. ``value`` is the
+    quantity the rule last checked (e.g. the rate of change). Checking a
+    rule costs the same however long the logger runs (amortized, for
+    windows, see ``Rate``).
+
+    Names are stored in the ``events`` dataset, so they must be ascii and at
+    most ``RULE_NAME_LENGTH`` characters long.
+
+    '''
+
+    def __init__(self, dataset, name=None):
+        self.dataset = dataset
+        self.name = name or self.default_name()
+        if len(self.name) > RULE_NAME_LENGTH or not self.name.isascii():
+            raise ValueError('alert rule name {!r} should be at most {} ascii characters, '
+                'pass a shorter name'.format(self.name, RULE_NAME_LENGTH))
+        self.active = False
+        self.value = float('nan')
+
+    def default_name(self):
+        return '{} {}'.format(self.dataset, type(self).__name__.lower())
+
+    def check(self, t, value):
+        '''
+        Returns whether the rule is active after the sample ``value`` at
+        time ``t``
+
+        '''
+        raise NotImplementedError
+
+    def update(self, t, value):
+        active = self.check(t, value)
+        if active == self.active:
+            return None
+        self.active = active
+        return active
+
+class Limits(Rule):
+    '''
+    Base class for rules active while a quantity is ``above`` or ``below`` a
+    limit, which clear once it is back within the limits by more than
+    ``hysteresis``
+
+    '''
+
+    symbol = ''
+
+    def __init__(self, dataset, above=None, below=None, hysteresis=0., name=None):
+        if above is None and below is None:
+            raise ValueError('{} needs above and/or below'.format(type(self).__name__))
+        self.above = above
+        self.below = below
+        self.hysteresis = hysteresis
+        super(Limits, self).__init__(dataset, name)
+
+    def default_name(self):
+        limits = []
+        if self.above is not None:
+            limits.append('>{:g}'.format(self.above))
+        if self.below is not None:
+            limits.append('<{:g}'.format(self.below))
+        return '{}{}'.format(self.symbol.format(self.dataset), ','.join(limits))
+
+    def outside(self, x):
+        '''
+        Returns whether the rule is active for the quantity ``x``, ``None``
+        keeps the current state
+
+        '''
+        if x is None or math.isnan(x):
+            return self.active
+        if self.active:
+            return not ((self.above is None or x < self.above - self.hysteresis)
+                and (self.below is None or x > self.below + self.hysteresis))
+        return ((self.above is not None and x > self.above)
+            or (self.below is not None and x < self.below))
+
+class Threshold(Limits):
+    '''
+    Active while the value is above ``above`` or below ``below``
+
+    '''
+
+    symbol = '{}'
+
+    def check(self, t, value):
+        self.value = value
+        return self.outside(value)
+
+class Rate(Limits):
+    '''
+    Active while the rate of change (per second) of the value is above
+    ``above`` or below ``below``, the slope of a least squares fit to the
+    samples of the last ``window`` seconds. Not checked until ``window``
+    seconds after the first sample.
+
+    The samples of the window are kept in a deque, so the rule's memory
+    grows with the samples per window. The fit is kept as running sums over
+    the window, which are recomputed from the samples in the window once
+    every window's worth of samples so rounding errors don't build up, so an
+    update costs amortized constant time.
+
+    '''
+
+    symbol = 'd({})/dt'
+
+    def __init__(self, dataset, window, above=None, below=None, hysteresis=0., name=None):
+        self.window = float(window)
+        self.samples = deque()
+        self.start = None
+        self.reset(0.)
+        super(Rate, self).__init__(dataset, above, below, hysteresis, name)
+
+    def reset(self, t0):
+        '''
+        Recompute the sums of the samples in the window, relative to ``t0``
+
+        '''
+        self.t0 = t0
+        self.n_updates = 0
+        self.st = self.sx = self.stt = self.stx = 0.
+        for t, x in self.samples:
+            self.add(t, x, 1)
+
+    def add(self, t, x, sign):
+        t = t - self.t0
+        self.st += sign * t
+        self.sx += sign * x
+        self.stt += sign * t * t
+        self.stx += sign * t * x
+
+    def slope(self):
+        n = len(self.samples)
+        denominator = n * self.stt - self.st * self.st
+        if n < 2 or denominator <= 0:
+            return None
+        return (n * self.stx - self.st * self.sx) / denominator
+
+    def check(self, t, value):
+        if value is None or math.isnan(value):
+            return self.active
+        if self.start is None:
+            self.start = t
+            self.reset(t)
+        self.samples.append((t, value))
+        self.add(t, value, 1)
+        while self.samples[0][0] < t - self.window:
+            self.add(*self.samples.popleft(), sign=-1)
+        self.n_updates += 1
+        if self.n_updates >= len(self.samples):
+            self.reset(self.samples[0][0])
+        if t - self.start < self.window:
+            return self.active
+        slope = self.slope()
+        if slope is not None:
+            self.value = slope
+        return self.outside(slope)
+
+class Stale(Rule):
+    '''
+    Active when the value hasn't changed by more than ``tolerance`` for
+    ``timeout`` seconds, or is nan for that long, or there was a gap of more
+    than ``timeout`` seconds since the previous sample
+
+    '''
+
+    def __init__(self, dataset, timeout, tolerance=0., name=None):
+        self.timeout = float(timeout)
+        self.tolerance = tolerance
+        self.last_value = None
+        self.changed = None
+        self.last = None
+        super(Stale, self).__init__(dataset, name)
+
+    def default_name(self):
+        return '{} stale'.format(self.dataset)
+
+    def check(self, t, value):
+        if self.changed is None:
+            self.changed = t
+        if value is not None and not math.isnan(value) and (self.last_value is None
+                or abs(value - self.last_value) > self.tolerance):
+            self.last_value = value
+            self.changed = t
+        gap = t - self.last if self.last is not None else 0.
+        self.last = t
+        self.value = max(t - self.changed, gap)
+        return self.value > self.timeout
+
+RULES = {
+    'threshold': Threshold,
+    'rate': Rate,
+    'stale': Stale,
+}
+
+def make_rule(spec):
+    '''
+    Returns the rule for a ``{<rule name>: {<kwargs>}}`` spec, e.g.
+    ``{"threshold": {"dataset": "sP2_v", "above": 1.509, "hysteresis":
+    0.002}}`` or ``{"rate": {"dataset": "pressure", "window": 10, "above":
+    0.05}}``
+
+    '''
+    if len(spec) != 1:
+        raise ValueError('alert spec should have a single key, got {}'.format(spec))
+    (name, kwargs), = spec.items()
+    if name not in RULES:
+        raise ValueError('unknown alert rule {}, expected one of {}'.format(name, ', '.join(sorted(RULES))))
+    return RULES[name](**kwargs)
+
+class AlertEngine(object):
+    '''
+    Checks a list of rules (see ``make_rule``) against every sample
+
+    ``columns`` are the dataset names of the values of each row, in order,
+    and must include ``timestamp``. ``update(row)`` returns the events of
+    the rules that changed state as ``(timestamp, rule name, active,
+    value)`` tuples, as stored in the ``events`` dataset, with the value the
+    rule checked.
+
+    '''
+
+    def __init__(self, specs, columns):
+        columns = list(columns)
+        self.rules = [make_rule(spec) for spec in specs]
+        names = [rule.name for rule in self.rules]
+        for rule in self.rules:
+            if rule.dataset not in columns:
+                raise ValueError('alert rule {} on unknown dataset {}'.format(rule.name, rule.dataset))
+            if names.count(rule.name) > 1:
+                raise ValueError('more than one alert rule named {}'.format(rule.name))
+        self.indices = [columns.index(rule.dataset) for rule in self.rules]
+        self.timestamp = columns.index('timestamp')
+
+    def update(self, row):
+        t = row[self.timestamp]
+        events = []
+        for rule, i in zip(self.rules, self.indices):
+            active = rule.update(t, float(row[i]))
+            if active is not None:
+                events.append((t, rule.name, active, rule.value))
+        return events
+
+    def active(self):
+        '''
+        Returns the names of the active rules
+
+        '''
+        return [rule.name for rule in self.rules if rule.active]
+
+class AlertHooks(object):
+    '''
+    Passes events to local hooks from a background thread, so the sampling
+    loop never waits on them
+
+    For each event ``script`` is run with ``ALERT_LOGGER``, ``ALERT_RULE``,
+    ``ALERT_ACTIVE`` (1 or 0), ``ALERT_TIMESTAMP`` and ``ALERT_VALUE`` set in
+    its environment, and a json object of the same fields is sent as one
+    datagram to the unix socket ``socket_path``, if anything is listening
+    there (e.g. ``socat UNIX-RECV:<path> -``), with nan (or infinite) values
+    as ``null`` so it is valid json. Errors are printed and don't stop the
+    thread.
+
+    '''
+
+    def __init__(self, logger_name, script=None, socket_path=None, timeout=30.):
+        self.logger_name = logger_name
+        self.script = script
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.queue = queue.Queue()
+        self.socket = None
+        if socket_path:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def put(self, event):
+        self.queue.put(event)
+
+    def run(self):
+        while True:
+            event = self.queue.get()
+            if event is None:
+                return
+            timestamp, rule, active, value = event
+            fields = dict(logger=self.logger_name, rule=rule, active=int(active),
+                timestamp=timestamp, value=value)
+            if self.socket is not None:
+                message = dict((key, None if isinstance(value, float) and not math.isfinite(value)
+                    else value) for key, value in fields.items())
+                try:
+                    self.socket.sendto(json.dumps(message, allow_nan=False).encode(), self.socket_path)
+                except OSError:
+                    # nothing is listening
+                    pass
+            if self.script:
+                env = dict(os.environ)
+                env.update(('ALERT_{}'.format(key.upper()), str(value)) for key, value in fields.items())
+                try:
+                    subprocess.run([self.script], env=env, stdin=subprocess.DEVNULL,
+                        timeout=self.timeout, check=True)
+                except (OSError, subprocess.SubprocessError) as e:
+                    print('alert script {} failed: {}'.format(self.script, e))
+
+    def stop(self):
+        '''
+        Pass the events still queued to the hooks and stop the thread
+
+        '''
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        if self.socket is not None:
+            self.socket.close()
@@ -0,0 +1,497 @@
+import os
+import sys
+import json
+import time
+import argparse
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+
+# numpy and h5py are imported where they are first needed, see data_logging
+from data_logging import DataLogger, H5Writer, open_swmr, get_n_rows, read_rows, Columns, storage_profile
+from data_query import FileIndex, find_files, parse_time, default_data_dir
+
+# formats the compacted data can also be exported to, next to the compacted
+# file, parquet and arrow need pyarrow
+EXPORT_FORMATS = ('parquet', 'arrow', 'csv')
+
+def file_dtypes(file):
+    '''
+    Returns an OrderedDict of dataset:dtype of the datasets of a logger file
+    of either layout, with ``timestamp`` first, as passed to ``H5Writer``
+
+    '''
+    import numpy as np
+    if 'records' in file:
+        dtype = file['records'].dtype
+        dtypes = OrderedDict((name, dtype[name]) for name in dtype.names)
+    else:
+        dtypes = OrderedDict()
+        for dataset in Columns(file).keys():
+            dset = file[dataset]
+            dtypes[dataset] = np.dtype((dset.dtype, dset.shape[1:])) if dset.shape[1:] else dset.dtype
+    dtypes.move_to_end('timestamp', last=False)
+    return dtypes
+
+def sorted_runs(timestamps, n, t0, t1, block_size=65536):
+    '''
+    Split the first ``n`` rows of an on-disk timestamp dataset into runs of
+    increasing timestamps (e.g. each restart that replayed earlier samples
+    starts a new run), reading ``block_size`` rows at a time
+    Returns a list of ``[start, stop, first, last]`` of the rows of each run
+    with ``t0 <= timestamp < t1``, leaving out runs with no such rows
+
+    '''
+    import numpy as np
+    runs = []
+    run = None
+    previous = -np.inf
+    for offset in range(0, n, block_size):
+        t = timestamps[offset:min(n, offset + block_size)]
+        # a nan ends a run as well, and is never in the time range
+        breaks = np.flatnonzero(~(t >= np.concatenate([[previous], t[:-1]])))
+        bounds = [0] + [int(i) for i in breaks] + [len(t)]
+        for i, (a, b) in enumerate(zip(bounds[:-1], bounds[1:])):
+            if run is None or i > 0:
+                run = [None, None, None, None]
+                runs.append(run)
+            # rows of a run in the time range are contiguous
+            inside = np.flatnonzero((t[a:b] >= t0) & (t[a:b] < t1))
+            if len(inside):
+                if run[0] is None:
+                    run[0], run[2] = offset + a + int(inside[0]), float(t[a + inside[0]])
+                run[1], run[3] = offset + a + int(inside[-1]) + 1, float(t[a + inside[-1]])
+        previous = t[-1]
+    return [run for run in runs if run[0] is not None]
+
+class Run(object):
+    '''
+    Rows ``start`` to ``stop`` of a logger file with increasing timestamps,
+    read into ``buffer`` ``block_size`` rows at a time. Datasets of
+    ``dtypes`` that the file doesn't have are filled with nan (or 0 for
+    integers). The file is only kept open from the first ``fill()`` until
+    the last row is read.
+
+    '''
+
+    def __init__(self, filename, start, stop, first, last, dtypes):
+        self.filename = filename
+        self.start = start
+        self.stop = stop
+        self.first = first
+        self.last = last
+        self.dtypes = dtypes
+        self.file = None
+        self.position = start
+        self.buffer = None
+
+    def __len__(self):
+        return len(self.buffer['timestamp']) if self.buffer is not None else 0
+
+    def exhausted(self):
+        return self.position >= self.stop
+
+    def buffer_last(self):
+        return self.buffer['timestamp'][-1]
+
+    def fill(self, block_size):
+        '''
+        Read the next ``block_size`` rows onto the end of the buffer
+
+        '''
+        import numpy as np
+        if self.file is None:
+            self.file = open_swmr(self.filename)
+            self.datasets = [dataset for dataset in self.dtypes if dataset in Columns(self.file)]
+        stop = min(self.stop, self.position + block_size)
+        data = read_rows(self.file, self.datasets, start=self.position, stop=stop)
+        for dataset, dtype in self.dtypes.items():
+            if dataset not in data:
+                dtype = np.dtype(dtype)
+                fill = np.nan if dtype.base.kind in 'fc' else 0
+                data[dataset] = np.full((stop - self.position,) + dtype.shape, fill, dtype=dtype.base)
+        if self.buffer is not None:
+            data = dict((dataset, np.concatenate([self.buffer[dataset], values]))
+                for dataset, values in data.items())
+        self.buffer = data
+        self.position = stop
+        if self.exhausted():
+            self.close()
+
+    def take(self, bound):
+        '''
+        Remove the buffered rows with timestamps before ``bound``
+        Returns them as a dict of dataset_name:array
+
+        '''
+        import numpy as np
+        i = int(np.searchsorted(self.buffer['timestamp'], bound, side='left'))
+        rows = dict((dataset, values[:i]) for dataset, values in self.buffer.items())
+        self.buffer = dict((dataset, values[i:]) for dataset, values in self.buffer.items())
+        return rows
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+def merge(runs, block_size=65536, stats=None):
+    '''
+    Merge ``Run``s into a single sequence of rows sorted by timestamp,
+    keeping only the first row (in order of the runs' first timestamps) of
+    each timestamp. Runs are only read once the merge reaches their first
+    timestamp, and at most about two blocks of each are held in memory.
+    Yields blocks of rows as dicts of dataset_name:array, and counts the
+    rows read and duplicates dropped in the ``stats`` dict if given
+
+    '''
+    import numpy as np
+    stats = stats if stats is not None else {}
+    stats.setdefault('rows_read', 0)
+    stats.setdefault('duplicates', 0)
+    pending = deque(sorted(runs, key=lambda run: run.first))
+    active = []
+    while pending or active:
+        # unread rows of a run are at or after its last buffered row, and
+        # those of pending runs at or after their first, so every row
+        # before the bound has been read
+        limits = [run.buffer_last() for run in active if not run.exhausted()]
+        if pending:
+            limits.append(pending[0].first)
+        bound = min(limits) if limits else np.inf
+        blocks = [run.take(bound) for run in active]
+        n = sum(len(block['timestamp']) for block in blocks)
+        if not n and pending and pending[0].first == bound:
+            run = pending.popleft()
+            run.fill(block_size)
+            active.append(run)
+        elif n:
+            data = dict((dataset, np.concatenate([block[dataset] for block in blocks]))
+                for dataset in blocks[0])
+            order = np.argsort(data['timestamp'], kind='stable')
+            timestamps = data['timestamp'][order]
+            keep = np.ones(n, dtype=bool)
+            keep[1:] = timestamps[1:] != timestamps[:-1]
+            order = order[keep]
+            stats['rows_read'] += n
+            stats['duplicates'] += n - len(order)
+            yield dict((dataset, values[order]) for dataset, values in data.items())
+        for run in active:
+            # every buffered row is at the bound (e.g. a block of repeated
+            # timestamps) so read further
+            stuck = not n and not run.exhausted() and run.buffer_last() == bound
+            if not run.exhausted() and (len(run) < block_size or stuck):
+                run.fill(block_size)
+        active = [run for run in active if len(run) or not run.exhausted()]
+
+def rechunk(blocks, rows):
+    '''
+    Regroup blocks of rows into blocks of exactly ``rows`` rows (but the last)
+
+    '''
+    import numpy as np
+    pending = []
+    n = 0
+    for block in blocks:
+        pending.append(block)
+        n += len(block['timestamp'])
+        if n < rows:
+            continue
+        data = dict((dataset, np.concatenate([block[dataset] for block in pending]))
+            for dataset in block)
+        for start in range(0, n - rows + 1, rows):
+            yield dict((dataset, values[start:start + rows]) for dataset, values in data.items())
+        start += rows
+        pending = [dict((dataset, values[start:]) for dataset, values in data.items())]
+        n -= start
+    if n:
+        yield dict((dataset, np.concatenate([block[dataset] for block in pending]))
+            for dataset in pending[0])
+
+def flat_columns(dtypes):
+    '''
+    Returns a list of (column name, dataset, index) of the scalar columns of
+    ``dtypes`` for tabular formats, datasets with more than one value per
+    row are split into ``<dataset>_<i>`` columns
+
+    '''
+    import numpy as np
+    columns = []
+    for dataset, dtype in dtypes.items():
+        dtype = np.dtype(dtype)
+        if not dtype.shape:
+            columns.append((dataset, dataset, None))
+            continue
+        for index in np.ndindex(*dtype.shape):
+            name = '_'.join([dataset] + [str(i) for i in index])
+            columns.append((name, dataset, (slice(None),) + index))
+    return columns
+
+class TableExport(object):
+    '''
+    Streams blocks of rows to a csv, parquet or arrow (IPC file) file, one
+    parquet row group or arrow record batch per block
+
+    '''
+
+    def __init__(self, filename, dtypes, format):
+        if format not in EXPORT_FORMATS:
+            raise ValueError('unknown export format {}, expected one of {}'.format(
+                format, ', '.join(EXPORT_FORMATS)))
+        self.filename = filename
+        self.format = format
+        self.columns = flat_columns(dtypes)
+        if format == 'csv':
+            import numpy as np
+            self.fmt = ','.join('%d' if np.dtype(dtypes[dataset]).base.kind in 'iub' else '%.17g'
+                for _, dataset, _ in self.columns)
+            self.file = open(filename, 'w')
+            self.file.write(','.join(name for name, _, _ in self.columns) + '\n')
+            return
+        import pyarrow as pa
+        import numpy as np
+        self.schema = pa.schema([(name, pa.from_numpy_dtype(np.dtype(dtypes[dataset]).base))
+            for name, dataset, _ in self.columns])
+        if format == 'parquet':
+            import pyarrow.parquet as pq
+            self.file = pq.ParquetWriter(filename, self.schema)
+        else:
+            self.file = pa.ipc.new_file(filename, self.schema)
+
+    def column(self, dataset, index, data):
+        return data[dataset] if index is None else data[dataset][index]
+
+    def write(self, data):
+        if self.format == 'csv':
+            import numpy as np
+            values = np.column_stack([self.column(dataset, index, data)
+                for _, dataset, index in self.columns])
+            np.savetxt(self.file, values, fmt=self.fmt)
+            return
+        import pyarrow as pa
+        self.file.write_table(pa.Table.from_arrays([self.column(dataset, index, data)
+            for _, dataset, index in self.columns], schema=self.schema))
+
+    def close(self):
+        self.file.close()
+
+def compact(name, t0, t1, outdir, data_dir=None, storage='lzf', chunk_size=16384,
+        block_size=65536, summary_levels=DataLogger.summary_levels, exports=(), overwrite=False):
+    '''
+    Merge the data of logger ``name`` with ``t0 <= timestamp < t1`` from all
+    files in ``data_dir`` (see ``data_query.find_files``) into one file,
+    sorted by timestamp with duplicate timestamps dropped, and optionally
+    export it as each of ``exports`` (see ``EXPORT_FORMATS``)
+
+    The file is written by ``H5Writer``, so it reads like any logger file,
+    to ``<outdir>/YYYY_MM_DD/<name>_<first timestamp>.h5``, the same layout
+    as the data directory, and is added to that directory's index. It is
+    written a whole chunk of ``chunk_size`` rows at a time with the storage
+    profile ``storage``, so compressed chunks are written once, and the
+    first timestamp of every chunk is kept in the ``timestamp_index``
+    dataset. The events of the input files are merged as well.
+
+    The input is read ``block_size`` rows at a time from each file (and each
+    run of increasing timestamps within a file), so memory use doesn't grow
+    with the amount of data. Outputs are written to a temporary file and
+    moved into place when complete, existing outputs are kept unless
+    ``overwrite``.
+    Returns a dict describing the result, or None if there was no data
+
+    '''
+    import h5py
+    import numpy as np
+    start_time = time.perf_counter()
+    files = [filename for filename, entry in find_files(name, t0, t1, data_dir=data_dir)
+        if entry['first'] < t1]
+    if not files:
+        return None
+    dtypes = OrderedDict()
+    runs = []
+    events = []
+    for filename in files:
+        with open_swmr(filename) as infile:
+            for dataset, dtype in file_dtypes(infile).items():
+                if dtypes.setdefault(dataset, dtype) != dtype:
+                    raise ValueError('{} of {} is {}, expected {}'.format(
+                        dataset, filename, dtype, dtypes[dataset]))
+            runs += [Run(filename, *run, dtypes=dtypes) for run in sorted_runs(
+                Columns(infile)['timestamp'], get_n_rows(infile), t0, t1, block_size)]
+            if 'events' in infile:
+                events.append(infile['events'][:])
+    if not runs:
+        return None
+
+    first = min(run.first for run in runs)
+    directory = os.path.join(outdir, datetime.fromtimestamp(first).strftime('%Y_%m_%d'))
+    path = os.path.join(directory, datetime.fromtimestamp(first).strftime(
+        '{}_%Y-%m-%d_%H-%M-%S.h5'.format(name)))
+    outputs = [path] + [os.path.splitext(path)[0] + '.' + format for format in exports]
+    if not overwrite and any(os.path.exists(output) for output in outputs):
+        raise ValueError('{} already exists'.format(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp = '.tmp.{}'.format(os.getpid())
+
+    events = np.concatenate(events) if events else None
+    if events is not None:
+        events = events[(events['timestamp'] >= t0) & (events['timestamp'] < t1)]
+        events = events[np.argsort(events['timestamp'], kind='stable')]
+        seen = set()
+        unique = []
+        for i, key in enumerate(zip(events['timestamp'], events['rule'])):
+            if key not in seen:
+                seen.add(key)
+                unique.append(i)
+        events = events[unique]
+
+    try:
+        writer = H5Writer(outputs[0] + tmp, dtypes, chunk_size=chunk_size, storage=storage,
+            append_rows=chunk_size, summary_levels=summary_levels,
+            events=events.dtype if events is not None else None).open()
+        tables = [TableExport(output + tmp, dtypes, format)
+            for output, format in zip(outputs[1:], exports)]
+        index = []
+        stats = {}
+        for data in rechunk(merge(runs, block_size, stats), chunk_size):
+            index.append(data['timestamp'][0])
+            writer.append(data)
+            for table in tables:
+                table.write(data)
+        if events is not None and len(events):
+            writer.append_events(events)
+        n_rows = writer.n_rows
+        writer.close()
+        for table in tables:
+            table.close()
+        with h5py.File(outputs[0] + tmp, 'a', libver='latest') as outfile:
+            dset = outfile.create_dataset('timestamp_index', data=np.array(index, dtype='f8'))
+            dset.attrs['step'] = chunk_size
+            outfile.attrs['source_files'] = json.dumps([os.path.basename(filename) for filename in files])
+            outfile.attrs['duplicates'] = stats['duplicates']
+    except BaseException:
+        for output in outputs:
+            if os.path.exists(output + tmp):
+                os.remove(output + tmp)
+        raise
+    finally:
+        for run in runs:
+            run.close()
+    for output in outputs:
+        os.replace(output + tmp, output)
+    index = FileIndex(directory)
+    index.add(path)
+    index.save()
+
+    return OrderedDict([
+        ('name', name),
+        ('path', path),
+        ('files', len(files)),
+        ('runs', len(runs)),
+        ('rows_read', stats['rows_read']),
+        ('rows', n_rows),
+        ('duplicates', stats['duplicates']),
+        ('bytes_in', sum(os.path.getsize(filename) for filename in files)),
+        ('bytes_out', os.path.getsize(path)),
+        ('seconds', time.perf_counter() - start_time),
+    ])
+
+def compact_task(kwargs):
+    '''
+    ``compact(**kwargs)`` for a process pool, errors are returned (as
+    ``{'name': .., 'error': ..}``) rather than raised, so one bad day
+    doesn't stop the others
+
+    '''
+    try:
+        return compact(**kwargs)
+    except (OSError, KeyError, ValueError) as e:
+        return OrderedDict([('name', kwargs['name']), ('t0', kwargs['t0']), ('error', str(e))])
+
+def day_ranges(t0, t1):
+    '''
+    Split ``t0`` to ``t1`` at local midnights, like the daily data directories
+    Returns a list of (start, end)
+
+    '''
+    ranges = []
+    start = t0
+    day = datetime.fromtimestamp(t0).date()
+    while start < t1:
+        day += timedelta(days=1)
+        end = min(t1, datetime.combine(day, datetime.min.time()).timestamp())
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+def logger_names(data_dir=None):
+    '''
+    Returns the names of the loggers with files in the daily data directories
+
+    '''
+    from glob import glob
+    data_dir = data_dir or default_data_dir()
+    names = set()
+    for path in glob(os.path.join(data_dir, '[0-9]'*4 + '_[0-9][0-9]_[0-9][0-9]', '*_*.h5')):
+        names.add(os.path.basename(path).split('_')[0])
+    return sorted(names)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Merge the logged files of each logger into '
+        'one sorted, de-duplicated and compressed file per day (or per time range), and '
+        'optionally export them to parquet, arrow or csv')
+    parser.add_argument('t0', type=parse_time,
+        help='''start time (unix timestamp or "YYYY-mm-dd HH:MM:SS")''')
+    parser.add_argument('t1', type=parse_time,
+        help='''end time, exclusive (unix timestamp or "YYYY-mm-dd HH:MM:SS")''')
+    parser.add_argument('--names', nargs='+', default=None,
+        help='''loggers to compact, e.g. RTD PG ADC (default is all)''')
+    parser.add_argument('--data_dir', default=None,
+        help='''directory containing the daily data directories (default is $LARBO_DIR/data)''')
+    parser.add_argument('--outdir', default=None,
+        help='''directory to write the daily directories of compacted files to (default is <data_dir>/compacted)''')
+    parser.add_argument('--split', choices=('day', 'none'), default='day',
+        help='''one file per logger per day, or one for the whole time range (default=%(default)s)''')
+    parser.add_argument('--storage', type=storage_profile, default='lzf',
+        help='''storage profile, a name or json dict, see data_logging.storage_options (default=%(default)s)''')
+    parser.add_argument('--chunk_size', type=int, default=16384,
+        help='''rows per chunk of the compacted files (default=%(default)s)''')
+    parser.add_argument('--block_size', type=int, default=65536,
+        help='''rows read at a time from each input file, bounds the memory used (default=%(default)s)''')
+    parser.add_argument('--export', nargs='+', choices=EXPORT_FORMATS, default=[],
+        help='''also write each compacted file in these formats, parquet and arrow need pyarrow (optional)''')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+        help='''number of files to compact in parallel (default=%(default)s)''')
+    parser.add_argument('--overwrite', action='store_true',
+        help='''replace existing compacted files''')
+    args = parser.parse_args()
+
+    if set(args.export) & {'parquet', 'arrow'}:
+        try:
+            import pyarrow
+        except ImportError:
+            parser.error('--export parquet/arrow needs pyarrow (pip install pyarrow)')
+    data_dir = args.data_dir or default_data_dir()
+    outdir = args.outdir or os.path.join(data_dir, 'compacted')
+    names = args.names or logger_names(data_dir)
+    ranges = day_ranges(args.t0, args.t1) if args.split == 'day' else [(args.t0, args.t1)]
+    tasks = [dict(name=name, t0=t0, t1=t1, outdir=outdir, data_dir=data_dir, storage=args.storage,
+        chunk_size=args.chunk_size, block_size=args.block_size, exports=args.export,
+        overwrite=args.overwrite) for name in names for t0, t1 in ranges]
+
+    import multiprocessing
+    # the pool pickles functions by module name, and this script runs as
+    # __main__ (or from larbo), so use the function of the imported module
+    from data_compact import compact_task
+    failed = False
+    with multiprocessing.Pool(max(1, min(args.jobs, len(tasks)))) as pool:
+        for result in pool.imap_unordered(compact_task, tasks):
+            if result is None:
+                continue
+            if 'error' in result:
+                print('FAILED {} from {}: {}'.format(result['name'],
+                    datetime.fromtimestamp(result['t0']), result['error']))
+                failed = True
+                continue
+            print('{path}: {rows} rows from {files} files ({duplicates} duplicates dropped, '
+                '{runs} sorted runs), {bytes_in} -> {bytes_out} bytes in {seconds:.1f}s'.format(**result))
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,248 @@
+
+import time
+import math
+import errno
+import random
+
+import numpy as np
+
+from data_logging import open_swmr, read_rows
+
+class Signal(object):
+    '''
+    Synthetic signal, the value at unix time ``t`` is::
+
+        offset + amplitude * sin(2 pi t / period) + drift * (t - t0) + gaussian noise
+
+    plus, with probability ``spike_rate`` per call, a spike of size ``spike``
+
+    '''
+
+    def __init__(self, offset=0., amplitude=0., period=60., drift=0., noise=0.,
+            spike_rate=0., spike=0.):
+        self.offset = offset
+        self.amplitude = amplitude
+        self.period = period
+        self.drift = drift
+        self.noise = noise
+        self.spike_rate = spike_rate
+        self.spike = spike
+        self.t0 = time.time()
+
+    def __call__(self, t):
+        value = self.offset + self.drift * (t - self.t0)
+        if self.amplitude:
+            value += self.amplitude * math.sin(2 * math.pi * t / self.period)
+        if self.noise:
+            value += random.gauss(0, self.noise)
+        if self.spike_rate and random.random() < self.spike_rate:
+            value += self.spike
+        return value
+
+class ReplaySignal(object):
+    '''
+    Replays ``dataset`` of a logger file, the value at unix time ``t`` is the
+    last value logged before ``speed * (t - t_start)`` seconds into the file,
+    where ``t_start`` is the time of the first call. With ``loop=True`` the
+    file is replayed from the start once the end is reached
+
+    '''
+
+    def __init__(self, filename, dataset, speed=1., loop=True):
+        with open_swmr(filename) as infile:
+            data = read_rows(infile, ['timestamp', dataset])
+        if not len(data['timestamp']):
+            raise ValueError('no data in {}'.format(filename))
+        self.timestamps = data['timestamp'] - data['timestamp'][0]
+        self.values = data[dataset]
+        self.speed = speed
+        self.loop = loop
+        self.t_start = None
+
+    def __call__(self, t):
+        if self.t_start is None:
+            self.t_start = t
+        elapsed = self.speed * (t - self.t_start)
+        if self.loop and self.timestamps[-1] > 0:
+            elapsed = elapsed % (self.timestamps[-1] + np.median(np.diff(self.timestamps)))
+        i = max(np.searchsorted(self.timestamps, elapsed, side='right') - 1, 0)
+        return float(self.values[i])
+
+class SimulatedDevice(object):
+    '''
+    Base class for simulated devices, each ``conversion()`` takes ``latency``
+    seconds and fails with an ``OSError`` with probability ``fault_rate``
+
+    '''
+
+    def __init__(self, latency=0., fault_rate=0.):
+        self.latency = latency
+        self.fault_rate = fault_rate
+
+    def conversion(self):
+        '''
+        Returns the time of the conversion
+
+        '''
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fault_rate and random.random() < self.fault_rate:
+            raise OSError(errno.EIO, 'simulated {} fault'.format(type(self).__name__))
+        return time.time()
+
+class SimulatedAnalogIn(SimulatedDevice):
+    '''
+    Stands in for an ``adafruit_ads1x15.analog_in.AnalogIn`` channel of an
+    ADS1115 at ``gain``, ``signal`` gives the voltage
+
+    '''
+
+    def __init__(self, signal, gain=1, **kwargs):
+        super(SimulatedAnalogIn, self).__init__(**kwargs)
+        self.signal = signal
+        self.gain = gain
+
+    @property
+    def value(self):
+        full_scale = 4.096 / self.gain
+        code = int(round(self.signal(self.conversion()) / full_scale * 32767))
+        return max(min(code, 32767), -32768)
+
+    @property
+    def voltage(self):
+        return self.value * 4.096 / self.gain / 32767
+
+class SimulatedMAX31865(SimulatedDevice):
+    '''
+    Stands in for an ``adafruit_max31865.MAX31865`` with a pt100 RTD,
+    ``signal`` gives the temperature in C
+
+    '''
+
+    A = 3.9083e-3
+    B = -5.775e-7
+
+    def __init__(self, signal, rtd_nominal=100., **kwargs):
+        super(SimulatedMAX31865, self).__init__(**kwargs)
+        self.signal = signal
+        self.rtd_nominal = rtd_nominal
+
+    @property
+    def temperature(self):
+        return self.signal(self.conversion())
+
+    @property
+    def resistance(self):
+        t = self.temperature
+        return self.rtd_nominal * (1 + self.A * t + self.B * t**2)
+
+class FakeOmegaSerial(SimulatedDevice):
+    '''
+    Stands in for the ``serial.Serial`` connection to an Omega pressure
+    gauge, ``pressure`` and ``temperature`` are signals in psi and C
+
+    Understands the commands used by ``PGLogger``: ``*IDN?``, ``FAULT?``,
+    ``*CLS``, ``PRES_UNIT?``, ``TEMP_UNIT?``, ``TARE?``, ``TEMP?``,
+    ``MAX?``, ``MIN?``, ``MINMAX_RST``, ``HC_AUTO_ON``/``HC_AUTO_OFF`` and
+    ``STREAM_ON``/``STREAM_OFF``. While streaming a reading is sent every
+    ``1/stream_rate`` seconds, and every response takes the time it would to
+    send at ``baudrate``. Reads time out after ``timeout`` seconds like the
+    real port.
+
+    '''
+
+    def __init__(self, pressure, temperature, stream_rate=50., baudrate=9600, timeout=1, **kwargs):
+        super(FakeOmegaSerial, self).__init__(**kwargs)
+        self.pressure = pressure
+        self.temperature = temperature
+        self.stream_rate = stream_rate
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.is_open = True
+        self.streaming = False
+        self.next_stream = 0
+        self.responses = []
+        self.pressure_max = None
+        self.pressure_min = None
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def flushInput(self):
+        self.responses = []
+
+    def flushOutput(self):
+        pass
+
+    reset_input_buffer = flushInput
+    reset_output_buffer = flushOutput
+
+    @property
+    def in_waiting(self):
+        if self.streaming and time.time() >= self.next_stream:
+            return len(self.stream_line())
+        return sum(len(resp) for resp in self.responses)
+
+    def transfer(self, data):
+        time.sleep(10. * len(data) / self.baudrate)
+        return data
+
+    def measure(self):
+        t = self.conversion()
+        pressure = self.pressure(t)
+        if self.pressure_max is None or pressure > self.pressure_max:
+            self.pressure_max = pressure
+        if self.pressure_min is None or pressure < self.pressure_min:
+            self.pressure_min = pressure
+        return pressure, self.temperature(t)
+
+    def stream_line(self):
+        return '{:.4f},PSI {:.2f},C'.format(*self.measure()).encode('utf-8') + b'\r'
+
+    def write(self, data):
+        self.transfer(data)
+        for command in data.split(b'\r'):
+            self.command(command)
+        return len(data)
+
+    def command(self, command):
+        responses = {
+            b'*IDN?': 'OMEGA PX409-USBH SIMULATED',
+            b'FAULT?': '',
+            b'PRES_UNIT?': 'PSI',
+            b'TEMP_UNIT?': 'C',
+            b'TARE?': '0.0000,PSI',
+        }
+        if command in responses:
+            self.responses.append(responses[command].encode('utf-8') + b'\r')
+        elif command == b'TEMP?':
+            self.responses.append('{:.2f},C'.format(self.measure()[1]).encode('utf-8') + b'\r')
+        elif command in (b'MAX?', b'MIN?'):
+            if self.pressure_max is None:
+                self.measure()
+            value = self.pressure_max if command == b'MAX?' else self.pressure_min
+            self.responses.append('{:.4f},PSI'.format(value).encode('utf-8') + b'\r')
+        elif command == b'MINMAX_RST':
+            self.pressure_max = self.pressure_min = None
+        elif command == b'STREAM_ON':
+            self.streaming = True
+            self.next_stream = time.time() + 1. / self.stream_rate
+        elif command == b'STREAM_OFF':
+            self.streaming = False
+
+    def read_until(self, terminator=b'\r', expected=None):
+        if self.responses:
+            return self.transfer(self.responses.pop(0))
+        if self.streaming:
+            wait = self.next_stream - time.time()
+            if wait > self.timeout:
+                time.sleep(self.timeout)
+                return b''
+            time.sleep(max(wait, 0))
+            self.next_stream = max(self.next_stream + 1. / self.stream_rate, time.time())
+            return self.transfer(self.stream_line())
+        time.sleep(self.timeout)
+        return b''
@@ -0,0 +1,236 @@
+
+import math
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+class Filter(object):
+    '''
+    Base class for filters of a column, ``__call__`` returns the filtered
+    values of a batch of rows. Filters with a window keep the end of the
+    previous batch, so filtering consecutive batches gives the same result
+    as filtering them all at once. Filters that combine several samples skip
+    nan samples (e.g. failed reads), so one nan doesn't spread to later
+    values.
+
+    '''
+
+    def __call__(self, values):
+        raise NotImplementedError
+
+class WindowFilter(Filter):
+    '''
+    Base class for filters of the last ``n`` values, before the first value
+    the window is filled with copies of it
+
+    '''
+
+    def __init__(self, n):
+        self.n = int(n)
+        if self.n < 1:
+            raise ValueError('window must be at least 1')
+        self.history = None
+
+    def window(self, values):
+        '''
+        Returns the previous ``n - 1`` values followed by ``values``
+
+        '''
+        if self.history is None:
+            self.history = np.repeat(values[:1], self.n - 1)
+        values = np.concatenate([self.history, values])
+        self.history = values[len(values) - (self.n - 1):]
+        return values
+
+class MovingAverage(WindowFilter):
+    '''
+    Mean of the valid values of the last ``n``, nan if there are none
+
+    '''
+
+    def __call__(self, values):
+        values = np.asarray(values, dtype='f8')
+        if not len(values):
+            return values
+        values = self.window(values)
+        valid = ~np.isnan(values)
+        sums = np.concatenate([[0.], np.cumsum(np.where(valid, values, 0.))])
+        counts = np.concatenate([[0], np.cumsum(valid)])
+        counts = counts[self.n:] - counts[:-self.n]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (sums[self.n:] - sums[:-self.n]) / counts
+
+class Median(WindowFilter):
+    '''
+    Median of the valid values of the last ``n``, nan if there are none
+
+    '''
+
+    def __call__(self, values):
+        values = np.asarray(values, dtype='f8')
+        if not len(values):
+            return values
+        windows = sliding_window_view(self.window(values), self.n)
+        if not np.isnan(windows).any():
+            return np.median(windows, axis=1)
+        with warnings.catch_warnings():
+            # windows of only nan give nan
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return np.nanmedian(windows, axis=1)
+
+class EMA(Filter):
+    '''
+    Exponential moving average ``y[i] = alpha * x[i] + (1 - alpha) * y[i-1]``,
+    starting from the first value. A nan sample repeats the previous
+    average (nan before the first valid sample).
+
+    Evaluated in closed form in blocks short enough that the powers of
+    ``1 - alpha`` don't overflow.
+
+    '''
+
+    def __init__(self, alpha):
+        self.alpha = float(alpha)
+        if not 0 < self.alpha <= 1:
+            raise ValueError('alpha must be in (0, 1]')
+        self.last = None
+        if self.alpha < 1:
+            self.block = max(1, int(100 * math.log(10) / -math.log(1 - self.alpha)))
+
+    def __call__(self, values):
+        values = np.asarray(values, dtype='f8')
+        if not len(values) or self.alpha == 1:
+            return values
+        valid = np.flatnonzero(~np.isnan(values))
+        # samples before the first valid one repeat the previous average
+        out = np.full(len(values), self.last if self.last is not None else np.nan)
+        if not len(valid):
+            return out
+        x = values[valid]
+        if self.last is None:
+            self.last = x[0]
+        averages = np.empty(len(x))
+        for start in range(0, len(x), self.block):
+            block = x[start:start + self.block]
+            decay = (1 - self.alpha) ** np.arange(1, len(block) + 1)
+            averages[start:start + len(block)] = decay * (self.last + self.alpha * np.cumsum(block / decay))
+            self.last = averages[start + len(block) - 1]
+        # later samples get the average up to their last valid sample
+        last_valid = np.searchsorted(valid, np.arange(valid[0], len(values)), side='right') - 1
+        out[valid[0]:] = averages[last_valid]
+        return out
+
+class Polynomial(Filter):
+    '''
+    ``c0 + c1 * x + c2 * x**2 + ...``
+
+    '''
+
+    def __init__(self, *coefficients):
+        self.coefficients = np.array(coefficients, dtype='f8')
+
+    def __call__(self, values):
+        return np.polynomial.polynomial.polyval(np.asarray(values, dtype='f8'), self.coefficients)
+
+class Calibration(Filter):
+    '''
+    ``(x - offset) * scale``, e.g. the level sensor's ``ls_calib_0`` and
+    ``ls_calib_1``
+
+    '''
+
+    def __init__(self, offset, scale):
+        self.offset = offset
+        self.scale = scale
+
+    def __call__(self, values):
+        return (np.asarray(values, dtype='f8') - self.offset) * self.scale
+
+FILTERS = {
+    'moving_average': MovingAverage,
+    'median': Median,
+    'ema': EMA,
+    'polynomial': Polynomial,
+    'calibration': Calibration,
+}
+
+def make_filter(spec):
+    '''
+    Returns the filter for a ``{<filter name>: <argument or list of
+    arguments>}`` spec, e.g. ``{"median": 5}`` or ``{"calibration": [963,
+    0.153]}``
+
+    '''
+    if len(spec) != 1:
+        raise ValueError('filter spec should have a single key, got {}'.format(spec))
+    (name, args), = spec.items()
+    if name not in FILTERS:
+        raise ValueError('unknown filter {}, expected one of {}'.format(name, ', '.join(sorted(FILTERS))))
+    if isinstance(args, (list, tuple)):
+        return FILTERS[name](*args)
+    return FILTERS[name](args)
+
+class FilterChain(object):
+    '''
+    Adds derived columns to batches of rows, and optionally keeps only
+    every ``decimate``-th row
+
+    ``specs`` is a list of derived columns::
+
+        [{"input": <dataset>, "output": <new dataset>, "chain": [<filter spec>, ...]}, ...]
+
+    where each filter spec is as in ``make_filter``. Each output is the
+    result of applying its chain of filters in turn to its input, which can
+    be an earlier output. Filters see every row, decimation is applied
+    after filtering to all columns. Filter and decimation state carries over
+    from one batch to the next.
+
+    ``columns`` are the datasets available as inputs, if given.
+
+    '''
+
+    def __init__(self, specs, columns=None, decimate=1):
+        self.outputs = []
+        columns = set(columns) if columns is not None else None
+        outputs = set()
+        for spec in specs:
+            # derived columns are stored next to the raw ones, never in place
+            if spec['output'] in outputs or (columns is not None and spec['output'] in columns):
+                raise ValueError('filter output {} is already a dataset'.format(spec['output']))
+            outputs.add(spec['output'])
+            if columns is not None:
+                if spec['input'] not in columns:
+                    raise ValueError('filter input {} is not a dataset'.format(spec['input']))
+                columns.add(spec['output'])
+            self.outputs.append((spec['output'], spec['input'],
+                [make_filter(filter_spec) for filter_spec in spec.get('chain', [])]))
+        self.decimate = int(decimate)
+        self.n_rows = 0
+
+    def dtypes(self):
+        '''
+        Returns a dict of dataset name:dtype of the derived columns
+
+        '''
+        return OrderedDict((output, 'f8') for output, _, _ in self.outputs)
+
+    def __call__(self, data_dict):
+        '''
+        Returns ``data_dict`` (dict of dataset_name:array) with the derived
+        columns added, decimated
+
+        '''
+        data_dict = OrderedDict(data_dict)
+        for output, dataset, filters in self.outputs:
+            values = np.asarray(data_dict[dataset], dtype='f8')
+            for filter in filters:
+                values = filter(values)
+            data_dict[output] = values
+        if self.decimate > 1:
+            n = len(next(iter(data_dict.values())))
+            rows = np.arange((-self.n_rows) % self.decimate, n, self.decimate)
+            self.n_rows += n
+            data_dict = OrderedDict((dataset, values[rows]) for dataset, values in data_dict.items())
+        return data_dict
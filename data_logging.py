@@ -1,19 +1,807 @@
 
+import re
 import time
-from datetime import datetime
+import json
+from datetime import datetime, timedelta
 import argparse
-import h5py
 import os
 import errno
-import filelock
+import threading
+import queue
+from collections import OrderedDict
+
+# h5py, numpy and the other heavy modules are imported where they are first
+# needed, so that scripts start (and print --help) without waiting for them
 
 def file_locking(func):
     def new_func(*args, **kwargs):
+        import filelock
         lock = kwargs['filename'] + '.lock'
         with filelock.FileLock(lock):
             return func(*args, **kwargs)
     return new_func
 
+def open_swmr(filename):
+    '''
+    Open a file written by ``H5Writer`` read-only in single-writer/multiple-
+    reader mode. No file lock is needed, use ``get_n_rows`` and
+    ``read_rows`` to read data that was flushed after the file was opened
+
+    '''
+    import h5py
+    return h5py.File(filename, 'r', libver='latest', swmr=True)
+
+def lookup3(data, initval=0):
+    '''
+    Bob Jenkins' lookup3 hash (``hashlittle``) of ``data``, the checksum
+    used by hdf5 metadata
+
+    '''
+    M = 0xffffffff
+    def rot(x, k):
+        return ((x << k) | (x >> (32 - k))) & M
+    length = len(data)
+    a = b = c = (0xdeadbeef + length + initval) & M
+    i = 0
+    while length > 12:
+        a = (a + int.from_bytes(data[i:i+4], 'little')) & M
+        b = (b + int.from_bytes(data[i+4:i+8], 'little')) & M
+        c = (c + int.from_bytes(data[i+8:i+12], 'little')) & M
+        a = (a - c) & M; a ^= rot(c, 4);  c = (c + b) & M
+        b = (b - a) & M; b ^= rot(a, 6);  a = (a + c) & M
+        c = (c - b) & M; c ^= rot(b, 8);  b = (b + a) & M
+        a = (a - c) & M; a ^= rot(c, 16); c = (c + b) & M
+        b = (b - a) & M; b ^= rot(a, 19); a = (a + c) & M
+        c = (c - b) & M; c ^= rot(b, 4);  b = (b + a) & M
+        length -= 12
+        i += 12
+    if length == 0:
+        return c
+    tail = data[i:i+length].ljust(12, b'\0')
+    a = (a + int.from_bytes(tail[0:4], 'little')) & M
+    b = (b + int.from_bytes(tail[4:8], 'little')) & M
+    c = (c + int.from_bytes(tail[8:12], 'little')) & M
+    c ^= b; c = (c - rot(b, 14)) & M
+    a ^= c; a = (a - rot(c, 11)) & M
+    b ^= a; b = (b - rot(a, 25)) & M
+    c ^= b; c = (c - rot(b, 16)) & M
+    a ^= c; a = (a - rot(c, 4)) & M
+    b ^= a; b = (b - rot(a, 14)) & M
+    c ^= b; c = (c - rot(b, 24)) & M
+    return c
+
+def clear_status_flags(filename):
+    '''
+    Clear the "open for writing" flags a crashed ``H5Writer`` leaves in the
+    superblock, so the file can be opened for writing again (what
+    ``h5clear -s`` does). Only use this when the writer is known to be dead
+
+    '''
+    with open(filename, 'r+b') as f:
+        superblock = bytearray(f.read(64))
+        if superblock[:8] != b'\x89HDF\r\n\x1a\n' or superblock[8] < 2:
+            raise ValueError('{} does not have a version 2+ hdf5 superblock'.format(filename))
+        # signature, version, offset size, length size, flags, 4 addresses
+        size = 12 + 4 * superblock[9]
+        superblock[11] = 0
+        superblock[size:size+4] = lookup3(bytes(superblock[:size])).to_bytes(4, 'little')
+        f.seek(0)
+        f.write(superblock[:size+4])
+
+def get_n_rows(file, dataset='timestamp'):
+    '''
+    Returns the number of valid rows in an open file. Files written by
+    ``H5Writer`` may be preallocated beyond the last written row, so
+    readers should only use ``file[dataset][:get_n_rows(file)]``
+
+    '''
+    if 'n_rows' in file:
+        file['n_rows'].refresh()
+        return int(file['n_rows'][0])
+    file[dataset].refresh()
+    return len(file[dataset])
+
+def read_rows(file, datasets, start=0, stop=None):
+    '''
+    Read the valid rows from ``start`` up to ``stop`` (default is all rows)
+    of each of ``datasets``, from a file of either layout (see ``H5Writer``)
+    Returns a dict of dataset_name:array
+
+    '''
+    n = get_n_rows(file)
+    if stop is not None:
+        n = min(n, stop)
+    data = dict()
+    if 'records' in file:
+        file['records'].refresh()
+        records = file['records'].fields(list(datasets))[start:n]
+        for dataset in datasets:
+            data[dataset] = records[dataset]
+        return data
+    for dataset in datasets:
+        file[dataset].refresh()
+        data[dataset] = file[dataset][start:n]
+    return data
+
+class Columns(object):
+    '''
+    Dict-like access to the datasets of a file of either layout (see
+    ``H5Writer``), so that ``Columns(file)[dataset][start:stop]`` reads rows
+    of a single dataset whether it is stored on its own or as a field of the
+    ``records`` dataset
+
+    '''
+
+    def __init__(self, file):
+        self.file = file
+        self.compound = 'records' in file
+
+    def keys(self):
+        import h5py
+        if self.compound:
+            return list(self.file['records'].dtype.names)
+        return [key for key in self.file
+            if key not in ('n_rows', 'events', 'timestamp_index') and isinstance(self.file[key], h5py.Dataset)]
+
+    def __contains__(self, dataset):
+        return dataset in self.keys()
+
+    def __getitem__(self, dataset):
+        if self.compound:
+            return self.file['records'].fields(dataset)
+        return self.file[dataset]
+
+class TailReader(object):
+    '''
+    Keeps a logger file open in SWMR mode and reads only the rows of
+    ``datasets`` appended since the previous ``read()``
+
+    '''
+
+    def __init__(self, filename, datasets):
+        self.filename = filename
+        self.datasets = list(datasets)
+        self.file = open_swmr(filename)
+        self.n_read = 0
+
+    def read(self):
+        '''
+        Returns a dict of dataset_name:array of the new rows
+
+        '''
+        data = read_rows(self.file, self.datasets, start=self.n_read)
+        self.n_read += len(data[self.datasets[0]])
+        return data
+
+    def close(self):
+        self.file.close()
+
+# h5py dataset creation options of the named storage profiles, see
+# storage_options()
+STORAGE_PROFILES = {
+    'none': {},
+    'lzf': {'shuffle': True, 'compression': 'lzf'},
+    'gzip': {'shuffle': True, 'compression': 'gzip', 'compression_opts': 4},
+    'archive': {'shuffle': True, 'compression': 'gzip', 'compression_opts': 9},
+}
+
+STORAGE_OPTIONS = ('profile', 'chunk_size', 'shuffle', 'compression', 'compression_opts',
+    'scaleoffset', 'fletcher32')
+
+def storage_options(profile, chunk_size=4096, append_rows=None):
+    '''
+    Returns the h5py ``create_dataset`` kwargs, including ``chunks``, of a
+    storage profile
+
+    ``profile`` is the name of one of ``STORAGE_PROFILES``, or a dict of
+    ``create_dataset`` options (``shuffle``, ``compression`` (``'gzip'`` or
+    ``'lzf'``), ``compression_opts``, ``scaleoffset``, ``fletcher32``), a
+    ``chunk_size`` in rows and optionally the name of a ``profile`` it
+    extends, e.g. ``{"profile": "gzip", "scaleoffset": 3}`` keeps 3 decimal
+    places of a float dataset. ``None`` is the ``'none'`` profile.
+
+    Datasets are chunked by the profile's ``chunk_size`` in rows, or
+    ``'append'`` for ``append_rows``, the expected number of rows per
+    append, which is the default of profiles with any filter (``chunk_size``
+    otherwise). A filtered chunk is compressed again every time rows are
+    appended to it, and in SWMR mode the space of its previous version is
+    not reused, so ``H5Writer`` writes filtered datasets a whole chunk at a
+    time. Rewriting partial scale-offset chunks could also lose more
+    precision than was asked for.
+
+    '''
+    if profile is None:
+        profile = 'none'
+    if not isinstance(profile, dict):
+        if profile not in STORAGE_PROFILES:
+            raise ValueError('unknown storage profile {}, expected one of {}'.format(
+                profile, ', '.join(sorted(STORAGE_PROFILES))))
+        profile = STORAGE_PROFILES[profile]
+    unknown = set(profile) - set(STORAGE_OPTIONS)
+    if unknown:
+        raise ValueError('unknown storage options {}, expected some of {}'.format(
+            ', '.join(sorted(unknown)), ', '.join(STORAGE_OPTIONS)))
+    if 'profile' in profile:
+        options = storage_options(profile['profile'], chunk_size, append_rows)
+        options.update(storage_options(dict((key, value) for key, value in profile.items()
+            if key != 'profile'), options['chunks'][0], append_rows))
+        return options
+    options = dict((key, value) for key, value in profile.items() if key != 'chunk_size')
+    rows = profile.get('chunk_size', 'append' if any(options.values()) else chunk_size)
+    if rows == 'append':
+        rows = append_rows or chunk_size
+    options['chunks'] = (max(1, int(rows)),)
+    return options
+
+def is_filtered(dset):
+    '''
+    Returns whether any filter is applied to the chunks of h5py dataset
+    ``dset``
+
+    '''
+    return bool(dset.compression or dset.shuffle or dset.fletcher32
+        or dset.scaleoffset is not None)
+
+def storage_profile(value):
+    '''
+    Parse a storage profile given on the command line, the name of a
+    profile or a json dict (see ``storage_options``)
+
+    '''
+    if value.lstrip().startswith('{'):
+        return json.loads(value)
+    return value
+
+def add_logger_arguments(parser):
+    '''
+    Add the command line options shared by all loggers (device, filters,
+    storage, alerts, metrics and rollover) to an ``argparse`` parser, see
+    ``logger_kwargs``
+
+    '''
+    parser.add_argument('--device', choices=['hardware', 'sim', 'replay'], default='hardware',
+        help='''log from the hardware, simulated devices or a replayed file (default=%(default)s)''')
+    parser.add_argument('--device_config', type=json.loads, default='{}',
+        help='''simulated/replay device configuration as a json string, see DataLogger for more details''')
+    parser.add_argument('--filters', type=json.loads, default=None,
+        help='''derived datasets to store as a json list of {"input": <dataset>, "output": <name>, "chain": [<filter>, ...]}, see data_filters.FilterChain (optional)''')
+    parser.add_argument('--decimate', type=int, default=1,
+        help='''store every n-th sample, after filtering (default=%(default)s)''')
+    parser.add_argument('--layout', choices=['columns', 'compound'], default='columns',
+        help='''store each dataset separately or all datasets as fields of a single compound dataset, see H5Writer (default=%(default)s)''')
+    parser.add_argument('--storage', type=storage_profile, default=None,
+        help='''storage profile of the datasets, one of none, lzf, gzip, archive or a json dict of h5py options, see data_logging.storage_options (default is none)''')
+    parser.add_argument('--dataset_storage', type=json.loads, default='{}',
+        help='''storage profiles of individual datasets as a json dict of {<dataset>: <profile>}, e.g. '{"temperature": {"profile": "gzip", "scaleoffset": 3}}', needs --layout columns (optional)''')
+    parser.add_argument('--alerts', type=json.loads, default=None,
+        help='''alert rules checked on every sample as a json list of {"threshold"|"rate"|"stale": {"dataset": <dataset>, ...}}, see data_alerts (optional)''')
+    parser.add_argument('--alert_script', default=None,
+        help='''script run with the ALERT_* environment variables set for every alert event (optional)''')
+    parser.add_argument('--alert_socket', default=None,
+        help='''unix datagram socket each alert event is sent to as json (optional)''')
+    parser.add_argument('--metrics_address', default=None,
+        help='''serve logger metrics at [host]:port or a unix socket path (optional)''')
+    parser.add_argument('--rollover_interval', type=float, default=None,
+        help='''start a new file at every multiple of this many seconds since midnight, e.g. 3600 for hourly files (optional)''')
+    parser.add_argument('--rollover_rows', type=int, default=None,
+        help='''start a new file after this many rows (optional)''')
+    parser.add_argument('--rollover_bytes', type=int, default=None,
+        help='''start a new file once the file has this many bytes of (uncompressed) data (optional)''')
+
+def logger_kwargs(args, parser=None):
+    '''
+    Returns the keyword arguments of a ``DataLogger`` from parsed command
+    line ``args``, the logger's own options as well as those added by
+    ``add_logger_arguments``. Inconsistent options are reported with
+    ``parser.error`` if given, otherwise raise a ValueError
+
+    '''
+    kwargs = dict(vars(args))
+    if kwargs.get('layout') == 'compound' and kwargs.get('dataset_storage'):
+        message = '--dataset_storage needs --layout columns'
+        if parser is not None:
+            parser.error(message)
+        raise ValueError(message)
+    return kwargs
+
+class H5Writer(object):
+    '''
+    Keeps a single hdf5 file open in single-writer/multiple-reader (SWMR)
+    mode for the duration of a run and appends to a set of 1D datasets
+
+    Datasets are chunked with ``chunk_size`` rows per chunk and their extent
+    is grown ``grow_chunks`` chunks at a time, so most flushes only write
+    into already allocated space. The number of valid rows is kept in the
+    ``n_rows`` dataset and the datasets are trimmed to that length on
+    ``close()``.
+
+    Each ``append()`` flushes the new data before updating and flushing
+    ``n_rows``, so readers using ``open_swmr`` never see unwritten rows and
+    never need to take a lock.
+
+    Datasets with any filter (compression, shuffle, scale-offset, checksum)
+    are only written in whole chunks, since rewriting a filtered chunk
+    leaves its previous copy as wasted space in SWMR mode (see
+    ``storage_options``). The rows of a partly filled chunk are held back
+    until the chunk is complete or the file is closed, and the ``n_rows``
+    dataset only counts the rows written to every dataset. ``n_rows`` is
+    the number of rows appended, ``pending()`` the number held back.
+
+    With ``layout='columns'`` each dataset is stored separately. With
+    ``layout='compound'`` all datasets are stored as fields of a single
+    ``records`` dataset, so each append is a single resize and write. Use
+    ``read_rows`` or ``Columns`` to read either layout.
+
+    Datasets are created with the storage profile ``storage`` (e.g.
+    ``'lzf'``, see ``storage_options``) unless ``dataset_storage`` has a
+    profile for them, ``append_rows`` is the expected number of rows per
+    append. With ``layout='compound'`` only ``storage`` is used.
+
+    If ``summary_levels`` is given, a ``SummaryPyramid`` of all scalar datasets
+    but ``timestamp`` at those bin widths (in seconds) is updated with each
+    append.
+
+    If ``events`` is given, an ``events`` dataset of that dtype, with its
+    own number of rows, is created for ``append_events()``.
+
+    ``close()`` finalizes the file: datasets are trimmed and the
+    ``first_timestamp``, ``last_timestamp`` and ``n_rows`` attributes are
+    set, with ``finalized=True``. Until then ``finalized`` is ``False``.
+
+    '''
+
+    def __init__(self, filename, dtypes, chunk_size=4096, grow_chunks=4, layout='columns',
+            summary_levels=None, storage=None, dataset_storage=None, append_rows=None,
+            events=None):
+        if layout not in ('columns', 'compound'):
+            raise ValueError('layout must be one of columns, compound')
+        import numpy as np
+        self.filename = filename
+        self.dtypes = dtypes
+        self.chunk_size = chunk_size
+        self.grow_chunks = grow_chunks
+        self.layout = layout
+        self.dtype = np.dtype(list(dtypes.items()))
+        dataset_storage = dataset_storage or {}
+        for dataset in dataset_storage:
+            if dataset not in dtypes:
+                raise ValueError('storage profile given for unknown dataset {}'.format(dataset))
+        if dataset_storage and layout == 'compound':
+            raise ValueError('per dataset storage profiles need layout=columns')
+        self.storage = dict((dataset, storage_options(dataset_storage.get(dataset, storage),
+            chunk_size, append_rows)) for dataset in dtypes)
+        self.storage['records'] = storage_options(storage, chunk_size, append_rows)
+        self.events = events
+        self.summary = None
+        if summary_levels:
+            from data_summary import SummaryPyramid
+            self.summary = SummaryPyramid(summary_levels,
+                [dataset for dataset, dtype in dtypes.items()
+                    if dataset != 'timestamp' and not np.dtype(dtype).shape])
+        self.file = None
+        self.n_rows = 0
+        self.written = {}
+        self.held = {}
+
+    def open(self):
+        import h5py
+        if os.path.isfile(self.filename):
+            self.file = h5py.File(self.filename, 'a', libver='latest')
+            self.n_rows = get_n_rows(self.file)
+        else:
+            self.file = h5py.File(self.filename, 'w', libver='latest')
+            self.n_rows = 0
+        if 'records' in self.file:
+            self.layout = 'compound'
+        if self.layout == 'compound':
+            if 'records' not in self.file:
+                self.file.create_dataset('records', shape=(self.n_rows,), maxshape=(None,),
+                    dtype=self.dtype, **self.storage['records'])
+        else:
+            for dataset, dtype in self.dtypes.items():
+                if dataset not in self.file:
+                    self.file.create_dataset(dataset, shape=(self.n_rows,), maxshape=(None,),
+                        dtype=dtype, **self.storage[dataset])
+        if 'n_rows' not in self.file:
+            self.file.create_dataset('n_rows', data=[self.n_rows], dtype='i8')
+        if self.events is not None and 'events' not in self.file:
+            self.file.create_dataset('events', shape=(0,), maxshape=(None,), chunks=(64,),
+                dtype=self.events)
+        if self.summary is not None:
+            self.summary.create(self.file)
+        self.written = dict((dataset, self.n_rows) for dataset in list(self.dtypes) + ['records']
+            if dataset in self.file)
+        self.held = {}
+        # attributes are created before switching to SWMR mode and only
+        # modified after
+        for attr, value in (('first_timestamp', float('nan')), ('last_timestamp', float('nan')), ('n_rows', 0)):
+            if attr not in self.file.attrs:
+                self.file.attrs[attr] = value
+        self.file.attrs['finalized'] = False
+        self.file.swmr_mode = True
+        return self
+
+    def append(self, data_dict):
+        '''
+        Append a dict of ``dataset name:values`` to the file
+
+        '''
+        if self.file is None:
+            self.open()
+        n = len(next(iter(data_dict.values())))
+        end = self.n_rows + n
+        if self.summary is not None:
+            self.summary.append(data_dict)
+        if self.layout == 'compound':
+            import numpy as np
+            records = np.zeros(n, dtype=self.dtype)
+            for dataset, values in data_dict.items():
+                records[dataset] = values
+            data_dict = {'records': records}
+        for dataset, values in data_dict.items():
+            dset = self.file[dataset]
+            stop = end
+            if is_filtered(dset):
+                # the end of the last whole chunk, a partial chunk left by an
+                # earlier file is completed rather than held back
+                stop = max(self.written[dataset], end // dset.chunks[0] * dset.chunks[0])
+            self.write_rows(dataset, values, stop)
+        self.file.flush()
+        self.n_rows = end
+        self.file['n_rows'][0] = min(self.written.values())
+        self.file.flush()
+
+    def write_rows(self, dataset, values, stop):
+        '''
+        Write the held back rows of ``dataset`` followed by ``values`` up to
+        row ``stop``, and hold back the rest
+
+        '''
+        import numpy as np
+        start = self.written[dataset]
+        if dataset in self.held:
+            values = np.concatenate([self.held.pop(dataset), values])
+        dset = self.file[dataset]
+        if stop > start:
+            if len(dset) < stop:
+                grow = dset.chunks[0] * self.grow_chunks
+                dset.resize(((stop // grow + 1) * grow,))
+            dset[start:stop] = values[:stop - start]
+        if stop - start < len(values):
+            # copy, values may be a view of the journal
+            self.held[dataset] = np.array(values[stop - start:])
+        self.written[dataset] = stop
+
+    def pending(self):
+        '''
+        Returns the number of appended rows not yet written to every dataset
+
+        '''
+        return self.n_rows - min(self.written.values()) if self.written else 0
+
+    def write_held(self):
+        '''
+        Write the rows held back from partly filled chunks
+
+        '''
+        for dataset in list(self.held):
+            self.write_rows(dataset, self.held[dataset][:0], self.n_rows)
+        if self.written:
+            self.file.flush()
+            self.file['n_rows'][0] = self.n_rows
+            self.file.flush()
+
+    def append_events(self, events):
+        '''
+        Append a list of event tuples to the ``events`` dataset
+
+        '''
+        if self.file is None:
+            self.open()
+        dset = self.file['events']
+        n = len(dset)
+        dset.resize((n + len(events),))
+        dset[n:] = events
+        self.file.flush()
+
+    def trim(self):
+        '''
+        Resize all datasets to the number of rows written
+
+        '''
+        for dataset in list(self.dtypes) + ['records']:
+            if dataset in self.file:
+                self.file[dataset].resize((self.n_rows,))
+        if self.summary is not None:
+            self.summary.trim()
+
+    def finalize(self):
+        '''
+        Write any held back rows, trim the datasets and set the summary
+        attributes of the file
+
+        '''
+        self.write_held()
+        self.trim()
+        if self.n_rows:
+            timestamps = Columns(self.file)['timestamp']
+            self.file.attrs['first_timestamp'] = timestamps[0:1][0]
+            self.file.attrs['last_timestamp'] = timestamps[self.n_rows-1:self.n_rows][0]
+        self.file.attrs['n_rows'] = self.n_rows
+        self.file.attrs['finalized'] = True
+
+    def close(self):
+        if self.file is None:
+            return
+        self.finalize()
+        self.file.close()
+        self.file = None
+
+class SampleBuffer(object):
+    '''
+    Preallocated sample buffer
+
+    Holds a numpy record array with one field per dataset, split into
+    ``n_segments`` segments of ``size`` rows. Rows are appended to the
+    current segment and ``take()`` returns the filled part of it as a dict of
+    ``dataset name:array`` column views (no copy) before moving on to the
+    next segment, so a taken segment stays valid until ``n_segments - 1``
+    more segments have been taken.
+
+    If a ``Journal`` is given its memory-mapped records are used as the
+    array, so every appended row is also persisted to the journal file.
+
+    '''
+
+    def __init__(self, dtypes, size, n_segments=1, journal=None):
+        import numpy as np
+        self.dtype = np.dtype(list(dtypes.items()))
+        self.size = size
+        self.n_segments = n_segments
+        self.journal = journal
+        if journal is None:
+            self.data = np.zeros(size * n_segments, dtype=self.dtype)
+        else:
+            self.data = journal.data
+        self.segment = 0
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def append(self, row):
+        '''
+        Store a tuple of values, ordered as in ``dtypes``
+
+        '''
+        if self.journal is not None and self.n == 0:
+            self.journal.begin(self.segment)
+        self.data[self.segment * self.size + self.n] = row
+        self.n += 1
+        if self.journal is not None:
+            self.journal.update(self.segment, self.n)
+
+    def full(self):
+        return self.n >= self.size
+
+    def take(self):
+        '''
+        Returns the current segment as a dict of dataset_name:array and starts
+        the next segment
+
+        '''
+        start = self.segment * self.size
+        segment = self.data[start:start + self.n]
+        data = OrderedDict((name, segment[name]) for name in self.dtype.names)
+        self.segment = (self.segment + 1) % self.n_segments
+        self.n = 0
+        return data
+
+class Journal(object):
+    '''
+    Append-only memory-mapped journal of the rows of a ``SampleBuffer``, so
+    that samples not yet written to the hdf5 file survive a crash
+
+    The journal file holds a json header (the target ``filename``, the row
+    dtype and the buffer geometry), the number of pending rows and a
+    sequence number for each buffer segment, and the rows themselves. A
+    segment's rows are pending from its first ``begin()``/``update()`` until
+    ``commit()`` is called once they have been written to the hdf5 file.
+    Rows are written to the page cache by the mapping, so they survive the
+    process dying, and are synced to disk at most every ``sync_interval``
+    seconds so they also survive a power cut.
+
+    Use ``Journal.read`` to get the pending rows of an existing journal.
+
+    '''
+
+    header_size = 4096
+    sync_interval = 1.
+
+    def __init__(self, path, filename, dtypes, size, n_segments, sync_interval=None):
+        self.path = path
+        if sync_interval is not None:
+            self.sync_interval = sync_interval
+        import numpy as np
+        dtype = np.dtype(list(dtypes.items()))
+        header = json.dumps(dict(filename=filename, dtype=dtype.descr, size=size,
+            n_segments=n_segments)).encode('utf-8')
+        if len(header) > self.header_size:
+            raise ValueError('journal header too long')
+        data_offset = self.header_size + 16 * n_segments
+        with open(path, 'wb') as outfile:
+            outfile.write(header.ljust(self.header_size))
+            outfile.truncate(data_offset + dtype.itemsize * size * n_segments)
+        self.state = np.memmap(path, dtype='i8', mode='r+', offset=self.header_size,
+            shape=(2, n_segments))
+        self.data = np.memmap(path, dtype=dtype, mode='r+', offset=data_offset,
+            shape=(size * n_segments,))
+        self.counts, self.seqs = self.state
+        self.seq = 0
+        self.next_sync = time.monotonic() + self.sync_interval
+
+    @staticmethod
+    def read(path):
+        '''
+        Returns the target filename and a record array of the pending rows
+        of the journal at ``path``, in the order they were taken
+
+        '''
+        import numpy as np
+        with open(path, 'rb') as infile:
+            header = json.loads(infile.read(Journal.header_size).decode('utf-8'))
+        dtype = np.dtype([tuple(field) for field in header['dtype']])
+        size, n_segments = header['size'], header['n_segments']
+        counts, seqs = np.fromfile(path, dtype='i8', count=2 * n_segments,
+            offset=Journal.header_size).reshape(2, n_segments)
+        data = np.fromfile(path, dtype=dtype, count=size * n_segments,
+            offset=Journal.header_size + 16 * n_segments)
+        segments = sorted((seq, segment) for segment, seq in enumerate(seqs) if counts[segment] > 0)
+        rows = [data[segment * size:segment * size + min(counts[segment], size)]
+            for _, segment in segments]
+        return header['filename'], np.concatenate(rows) if rows else data[:0]
+
+    def begin(self, segment):
+        self.counts[segment] = 0
+        self.seq += 1
+        self.seqs[segment] = self.seq
+
+    def update(self, segment, n):
+        self.counts[segment] = n
+        if self.sync_interval is not None and time.monotonic() >= self.next_sync:
+            self.sync()
+
+    def commit(self, segment):
+        self.counts[segment] = 0
+
+    def set_filename(self, filename):
+        '''
+        Change the file pending rows are replayed into
+
+        '''
+        with open(self.path, 'rb') as infile:
+            header = json.loads(infile.read(self.header_size).decode('utf-8'))
+        header['filename'] = filename
+        header = json.dumps(header).encode('utf-8')
+        if len(header) > self.header_size:
+            raise ValueError('journal header too long')
+        with open(self.path, 'r+b') as outfile:
+            outfile.write(header.ljust(self.header_size))
+
+    def pending(self):
+        return int(self.counts.sum())
+
+    def sync(self):
+        self.data.flush()
+        self.state.flush()
+        self.next_sync = time.monotonic() + self.sync_interval
+
+    def close(self):
+        '''
+        Close the journal, removing it if no rows are pending
+
+        '''
+        pending = self.pending()
+        self.sync()
+        del self.data, self.state, self.counts, self.seqs
+        if not pending:
+            os.remove(self.path)
+
+class WriterThread(threading.Thread):
+    '''
+    Calls ``write(item)`` for each item put on a bounded queue in a separate
+    thread. Items can be put with their own ``write``, so several loggers
+    can share one writer thread
+
+    When the queue is full ``put()`` either waits for space
+    (``backpressure='block'``) or discards the oldest queued item and counts
+    it in ``dropped`` (``backpressure='drop'``). ``stop()`` writes everything
+    still queued before returning. An exception raised by ``write`` stops the
+    thread and is re-raised by the next ``put()``, ``sync()`` or ``stop()``,
+    including one already waiting for space in the queue.
+
+    '''
+
+    # seconds between checks for a failed writer while waiting for space
+    poll_interval = 0.1
+
+    def __init__(self, write=None, queue_size=4, backpressure='block'):
+        super(WriterThread, self).__init__(daemon=True)
+        if backpressure not in ('block', 'drop'):
+            raise ValueError('backpressure must be one of block, drop')
+        self.write = write
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.backpressure = backpressure
+        self.dropped = 0
+        self.error = None
+
+    def put(self, item, write=None):
+        self.check()
+        item = (write or self.write, item)
+        if self.backpressure == 'block':
+            self.wait_put(item)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def wait_put(self, item):
+        '''
+        Put ``item`` on the queue, waiting for space for as long as the
+        writer is running
+
+        '''
+        while True:
+            try:
+                self.queue.put(item, timeout=self.poll_interval)
+                return
+            except queue.Full:
+                if not self.is_alive():
+                    self.check()
+                    raise RuntimeError('writer thread is not running')
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            write, item = item
+            try:
+                write(item)
+            except Exception as e:
+                self.error = e
+                return
+
+    def sync(self):
+        '''
+        Wait until everything put so far has been written
+
+        '''
+        done = threading.Event()
+        self.put(None, lambda item: done.set())
+        while not done.wait(self.poll_interval):
+            self.check()
+            if not self.is_alive():
+                break
+        self.check()
+
+    def stop(self):
+        if self.is_alive():
+            self.wait_put(None)
+            self.join()
+        self.check()
+
 class DataLogger(object):
     '''
     Base class for data logger
@@ -22,8 +810,112 @@ class DataLogger(object):
 
         - ``dtype`` -> dict of dataset name, numpy type desc
         - ``init()`` -> (optional) put any setup code here
-        - ``read()`` -> generates ``tuple`` of data values to store
-        - ``parse()`` - > converts ``tuple`` of data values to dict of ``dataset name:value``
+        - ``read()`` -> generates ``tuple`` of data values to store, in the same order as ``dtypes``
+        - ``parse()`` - > (optional) converts dict of ``dataset name:array`` to the dict of ``dataset name:values`` to store
+
+    Samples are kept in a preallocated ``SampleBuffer`` with one field per
+    dataset, which is written to file as views of those fields.
+
+    Data is written through a persistent ``H5Writer`` which keeps the output
+    file open in SWMR mode while logging, use ``open_swmr`` to read it. Set
+    ``persistent=False`` to instead reopen the file on every write (the
+    original behavior). The time taken by each write is kept in
+    ``flush_times``.
+
+    Samples are scheduled against a monotonic clock deadline, so the sample
+    rate is held regardless of the time spent in ``read()`` or writing. The
+    time each sample was taken after its deadline is stored in the
+    ``lateness`` dataset. If a sample overruns by more than one period the
+    missed slots are skipped and counted in the ``skipped`` dataset, unless
+    ``catch_up=True`` in which case samples are taken back-to-back until the
+    schedule is recovered.
+
+    By default full buffers are handed to a ``WriterThread`` so that sampling
+    never waits on disk. At most ``queue_size`` buffers are queued, beyond
+    that ``backpressure='block'`` pauses sampling until there is space and
+    ``backpressure='drop'`` discards the oldest buffer (counted in
+    ``writer_thread.dropped``). Set ``background_writer=False`` to write in
+    the sampling loop instead.
+
+    If ``shared_writer`` is set to a running ``WriterThread`` buffers are
+    written by it instead of a writer thread of the logger's own, so that
+    several loggers in one process share a single writer stage.
+
+    ``stop()`` (e.g. from another thread) ends ``run()`` after the current
+    sample, closing the device and writing out the buffer.
+
+    Set ``layout='compound'`` to store all datasets as fields of a single
+    ``records`` dataset (see ``H5Writer``).
+
+    ``storage`` is the storage profile (compression, shuffle, scale-offset
+    and chunk size) of the datasets and ``dataset_storage`` a dict of
+    dataset name:profile overriding it for some of them, e.g.
+    ``storage='lzf', dataset_storage={'temperature': {'profile': 'gzip',
+    'scaleoffset': 3}}`` (see ``storage_options``). Compressed profiles are
+    chunked by the rows per flush, ``buffer_size // decimate``, by default.
+
+    Set ``device='sim'`` to log from simulated devices instead of hardware,
+    or ``device='replay'`` to replay an existing logger file. Loggers build
+    their devices from ``signal()`` and ``device_options()``, which are
+    configured by ``device_config`` (see ``data_devices``)::
+
+        {'latency': <s per conversion>, 'fault_rate': <probability>,
+         '<dataset>': {<Signal kwargs>},      # device='sim'
+         'file': <h5 file>, 'speed': <factor>} # device='replay'
+
+    The output file is rolled over to a new one, named by the time of its
+    first sample, once it has ``rollover_rows`` rows or ``rollover_bytes``
+    bytes of data (the uncompressed size of its rows, see
+    ``file_row_limit``), or when the samples cross a multiple of
+    ``rollover_interval`` seconds since local midnight (e.g. 3600 for hourly
+    files, 86400 to roll over at midnight). Buffers are split exactly at the
+    limit or boundary. If ``outdir`` is a daily ``YYYY_MM_DD`` directory new files go
+    in the directory of the day they start. Each file is finalized when it
+    is closed (see ``H5Writer``) and recorded in its directory's
+    ``index.json`` (see ``data_query.FileIndex``).
+
+    Buffered samples are also kept in a memory-mapped ``Journal``
+    (``.<name>.journal`` in ``outdir``) until they have been written, and a
+    journal left by a crashed run is written to its file by ``run()`` before
+    logging starts (see ``replay_journal()``), so large buffers can be used
+    without risking the data. Set ``use_journal=False`` to disable.
+
+    Instead of printing every sample, a status line with the achieved rate,
+    latencies, buffer fill and file size is printed every
+    ``status_interval`` seconds (``None`` to disable). The same metrics, with
+    histograms of ``read()``, lateness and flush latency, are kept in
+    ``metrics`` (see ``LoggerMetrics``) and, if ``metrics_address`` is set
+    to ``[host]:port`` or a unix socket path, served there in the Prometheus
+    text format.
+
+    ``filters`` adds derived datasets computed from each buffer of samples
+    as it is written, stored alongside the raw datasets, e.g.::
+
+        [{'input': 'sP2_v', 'output': 'sP2_v_avg', 'chain': [{'moving_average': 10}]},
+         {'input': 'rise_time', 'output': 'level', 'chain': [{'median': 5}, {'calibration': [963, 0.153]}]}]
+
+    and with ``decimate`` > 1 only every ``decimate``-th row is stored, so
+    devices can be sampled at full rate and smoothed on the way to disk (see
+    ``data_filters.FilterChain``).
+
+    ``alerts`` is a list of rules checked against every sample as it is
+    taken, e.g.::
+
+        [{'threshold': {'dataset': 'sP2_v', 'above': 1.509, 'hysteresis': 0.002}},
+         {'rate': {'dataset': 'pressure', 'window': 10, 'above': 0.05}},
+         {'stale': {'dataset': 'temperature', 'timeout': 60}}]
+
+    Every time a rule becomes active or clears the event is printed, passed
+    to ``alert_script`` and ``alert_socket`` (see ``data_alerts.AlertHooks``)
+    and stored in the ``events`` dataset of the file with the next flush.
+    Rules see the raw samples, not the ``filters`` outputs.
+
+    Running count, mean, min, max and standard deviation of every dataset in
+    bins of each of ``summary_levels`` seconds are kept in the ``summary/``
+    group of the file (see ``SummaryPyramid``). They are only written when a
+    bin of the finest level is complete, so updating them adds a fraction of
+    a millisecond of numpy work to each flush (see
+    ``larbo-bench/flush-latency.py``). Set ``summary_levels=None`` to disable.
 
     A valid script using the custom data logger would then be:
 
@@ -35,6 +927,36 @@ class DataLogger(object):
     '''
 
     dtypes = {}
+    schedule_dtypes = {
+        'lateness': 'f8',
+        'skipped': 'i8'
+    }
+    catch_up = False
+    persistent = True
+    chunk_size = 4096
+    grow_chunks = 4
+    layout = 'columns'
+    summary_levels = (1, 60, 3600)
+    background_writer = True
+    queue_size = 4
+    backpressure = 'block'
+    device = 'hardware'
+    device_config = {}
+    status_interval = 5.
+    metrics_address = None
+    use_journal = True
+    journal_sync_interval = 1.
+    rollover_rows = None
+    rollover_bytes = None
+    rollover_interval = None
+    shared_writer = None
+    filters = None
+    decimate = 1
+    storage = None
+    dataset_storage = {}
+    alerts = None
+    alert_script = None
+    alert_socket = None
 
     def __init__(self, name, outdir='./', buffer_size=1, sample_rate=1e6, **kwargs):
         self.name = name
@@ -43,8 +965,24 @@ class DataLogger(object):
         self.filename = self.gen_filename(self.outdir)
         print('Storing data at {}...'.format(self.filename))
         self.buffer_size = buffer_size
-        self.buffer = []
+        self.buffer = None
         self.sample_rate = sample_rate
+        self.writer = None
+        self.writer_thread = None
+        self.journal = None
+        self.written_segments = []
+        self.rollover_time = None
+        self.file_rows = 0
+        self.stopping = threading.Event()
+        self.write_error = None
+        self.flush_times = []
+        from data_metrics import LoggerMetrics
+        self.metrics = LoggerMetrics(self)
+        self.metrics_server = None
+        self.filter_chain = None
+        self.alert_engine = None
+        self.alert_hooks = None
+        self.events = []
         print('buffer_size = {}'.format(self.buffer_size))
         print('sample_rate = {}Hz'.format(self.sample_rate))
         for arg,val in kwargs.items():
@@ -59,6 +997,29 @@ class DataLogger(object):
         '''
         raise NotImplementedError
 
+    def signal(self, dataset, **defaults):
+        '''
+        Signal for a simulated device measuring ``dataset``, ``defaults`` are
+        ``Signal`` kwargs overridden by ``device_config[dataset]``
+        Returns a ``Signal``, or a ``ReplaySignal`` if ``device='replay'``
+
+        '''
+        from data_devices import Signal, ReplaySignal
+        if self.device == 'replay':
+            return ReplaySignal(self.device_config['file'], dataset,
+                speed=self.device_config.get('speed', 1.), loop=self.device_config.get('loop', True))
+        params = dict(defaults)
+        params.update(self.device_config.get(dataset, {}))
+        return Signal(**params)
+
+    def device_options(self):
+        '''
+        Returns the kwargs common to all simulated devices
+
+        '''
+        return dict(latency=self.device_config.get('latency', 0.),
+            fault_rate=self.device_config.get('fault_rate', 0.))
+
     def read(self):
         '''
         Method to run each time you request a read
@@ -70,12 +1031,12 @@ class DataLogger(object):
 
     def parse(self, data):
         '''
-        Method to run to convert list of tupled data to datasets
-        Returns a dict of dataset_name:list
+        Method to run to convert a buffer of samples to datasets, data is a
+        dict of dataset_name:array
+        Returns a dict of dataset_name:array
 
         '''
-        raise NotImplementedError
-        return dict()
+        return data
 
     def close(self):
         '''
@@ -89,41 +1050,522 @@ class DataLogger(object):
         Collect data in a loop
 
         '''
+        from data_metrics import MetricsServer, StatusLine
+        self.replay_journal()
+        # filter state doesn't carry over from the replayed rows
+        self.filter_chain = self.new_filter_chain()
+        # check the storage profiles before logging starts
+        for dataset in self.dataset_storage:
+            if dataset not in self.file_dtypes():
+                raise ValueError('storage profile given for unknown dataset {}'.format(dataset))
+        self.new_writer(self.filename, self.file_dtypes())
+        self.buffer = self.new_buffer()
+        if self.alerts:
+            from data_alerts import AlertEngine, AlertHooks
+            self.alert_engine = AlertEngine(self.alerts, self.all_dtypes())
+            if self.alert_script or self.alert_socket:
+                self.alert_hooks = AlertHooks(self.name, self.alert_script, self.alert_socket).start()
+        if self.metrics_address:
+            self.metrics_server = MetricsServer(self.metrics, self.metrics_address).start()
+        status = StatusLine(self.status_interval)
+        period = 1./self.sample_rate
+        deadline = time.monotonic()
+        skipped = 0
         try:
-            while True:
-                self.buffer += [self.read()]
-                print('\t'.join(['{}']*len(self.buffer[-1])).format(*self.buffer[-1]))
-                if len(self.buffer) >= self.buffer_size:
-                    print('updating {}...'.format(self.filename))
-                    self.write(self.buffer, filename=self.filename)
-                    self.buffer = []
-                time.sleep(1./self.sample_rate)
+            while not self.stopping.is_set():
+                wait = deadline - time.monotonic()
+                if wait > 0 and self.stopping.wait(wait):
+                    break
+                start = time.monotonic()
+                lateness = start - deadline
+                row = self.read()
+                self.metrics.sample(time.monotonic() - start, lateness, skipped)
+                row = row + (lateness, skipped)
+                self.buffer.append(row)
+                if self.alert_engine is not None:
+                    self.check_alerts(row)
+                status.update(self.metrics.status)
+                if self.buffer.full():
+                    self.flush()
+
+                deadline += period
+                skipped = 0
+                overrun = time.monotonic() - deadline
+                if overrun > period and not self.catch_up:
+                    skipped = int(overrun // period)
+                    deadline += skipped * period
         except:
             self.close()
             raise
+        else:
+            self.close()
+        finally:
+            status.close()
+            self.close_file()
+
+    def check_alerts(self, row):
+        '''
+        Check the alert rules against a sample, and pass on any events
+
+        '''
+        for event in self.alert_engine.update(row):
+            timestamp, rule, active, value = event
+            print('ALERT {} {} at {} (value {:g})'.format(rule, 'active' if active else 'cleared',
+                datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3], value))
+            self.events.append(event)
+            self.metrics.alert(event)
+            if self.alert_hooks is not None:
+                self.alert_hooks.put(event)
+
+    def stop(self):
+        '''
+        Ask ``run()`` to return
+
+        '''
+        self.stopping.set()
+
+    def flush(self):
+        '''
+        Write the current buffer to the output file, or queue it for the
+        writer thread, and start a new buffer
+
+        '''
+        if not self.buffer and not self.events:
+            return
+        data, segment = None, None
+        if self.buffer:
+            segment = self.buffer.segment
+            data = self.buffer.take()
+        events, self.events = self.events, []
+        item = (data, segment, events)
+        if self.shared_writer is not None:
+            if self.write_error is not None:
+                raise self.write_error
+            self.shared_writer.put(item, self.write_shared)
+        elif self.background_writer:
+            if self.writer_thread is None:
+                self.writer_thread = WriterThread(self.write_segment,
+                    queue_size=self.queue_size, backpressure=self.backpressure)
+                self.writer_thread.start()
+            self.writer_thread.put(item)
+        else:
+            self.write_segment(item)
+
+    def write_shared(self, item):
+        '''
+        ``write_segment`` for a shared writer thread, errors are raised by
+        the logger's next ``flush()`` rather than stopping the thread
+
+        '''
+        try:
+            self.write_segment(item)
+        except Exception as e:
+            self.write_error = e
+
+    def new_buffer(self):
+        '''
+        Returns an empty ``SampleBuffer`` with room for every buffer that can
+        be waiting on the writer thread, or written but partly held back by
+        the writer (see ``commit_segments``)
+
+        '''
+        if self.shared_writer is not None:
+            n_segments = self.shared_writer.queue.maxsize + 2
+        else:
+            n_segments = self.queue_size + 2 if self.background_writer else 1
+        n_segments += self.held_segments()
+        self.written_segments = []
+        if self.use_journal:
+            self.journal = Journal(self.journal_path(), self.filename, self.all_dtypes(),
+                self.buffer_size, n_segments, sync_interval=self.journal_sync_interval)
+        return SampleBuffer(self.all_dtypes(), self.buffer_size, n_segments, journal=self.journal)
+
+    def journal_path(self):
+        return os.path.join(self.outdir, '.{}.journal'.format(self.name))
+
+    def replay_journal(self):
+        '''
+        Write the rows left in this logger's journal by a previous run to the
+        file they were meant for, skipping any already in the file, and
+        remove the journal
+        Returns the number of rows written
+
+        '''
+        path = self.journal_path()
+        if not os.path.isfile(path):
+            return 0
+        filename, rows = Journal.read(path)
+        if len(rows):
+            self.filter_chain = self.new_filter_chain(rows.dtype.names)
+            dtypes = OrderedDict((name, rows.dtype[name]) for name in rows.dtype.names)
+            if self.filter_chain is not None:
+                dtypes.update(self.filter_chain.dtypes())
+            writer = self.new_writer(filename, dtypes)
+            try:
+                writer.open()
+            except OSError:
+                if not os.path.isfile(filename):
+                    raise
+                # the crashed writer left the file marked as open for writing
+                clear_status_flags(filename)
+                writer.open()
+            try:
+                if writer.n_rows and 'timestamp' in dtypes:
+                    # rows written before the journal was committed
+                    last = Columns(writer.file)['timestamp'][writer.n_rows-1:writer.n_rows][0]
+                    rows = rows[rows['timestamp'] > last]
+                if len(rows):
+                    writer.append(self.parse_buffer(
+                        OrderedDict((name, rows[name]) for name in rows.dtype.names)))
+            finally:
+                writer.close()
+            self.index_file(filename)
+            print('replayed {} rows from {} into {}'.format(len(rows), path, filename))
+        os.remove(path)
+        return len(rows)
+
+    def write_segment(self, item):
+        '''
+        Write a ``(data, segment, events)`` item taken from the buffer and
+        the pending alert events, then commit the segment in the journal
+
+        '''
+        data, segment, events = item
+        rows = 0
+        if data is not None:
+            rows = self.write_buffer(data)
+        if events:
+            self.write_events(events)
+        if self.journal is not None and segment is not None:
+            self.written_segments.append((segment, self.journal.seqs[segment], rows))
+            self.commit_segments()
+
+    def commit_segments(self):
+        '''
+        Commit the written journal segments whose rows are all in the output
+        file. The rows held back by the writer from a partly filled chunk
+        (see ``H5Writer``) are the last ones written, so the latest segments
+        with at least that many rows stay pending
+
+        '''
+        pending = self.writer.pending() if self.writer is not None else 0
+        while self.written_segments and sum(rows for _, _, rows in self.written_segments[1:]) >= pending:
+            segment, seq, _ = self.written_segments.pop(0)
+            # the segment may have been reused if the journal was too small
+            if self.journal is not None and self.journal.seqs[segment] == seq:
+                self.journal.commit(segment)
+
+    def held_segments(self):
+        '''
+        Returns the number of written journal segments that can be pending
+        while the writer holds back the rows of a partly filled chunk
+
+        '''
+        profiles = [self.storage] + list(self.dataset_storage.values())
+        chunks = [options['chunks'][0] for options in
+            (storage_options(profile, self.chunk_size, self.rows_per_flush()) for profile in profiles)
+            if any(value for option, value in options.items() if option != 'chunks')]
+        if not chunks:
+            return 0
+        return -(-max(chunks) * max(1, self.decimate) // self.buffer_size) + 1
+
+    def write_events(self, events):
+        '''
+        Append alert events to the ``events`` dataset of the output file
+
+        '''
+        if self.persistent:
+            if self.writer is None:
+                self.writer = self.new_writer(self.filename, self.file_dtypes()).open()
+            self.writer.append_events(events)
+            return
+        import h5py
+        from data_alerts import EVENT_DTYPE
+        with h5py.File(self.filename, 'a') as file:
+            if 'events' not in file:
+                file.create_dataset('events', shape=(0,), maxshape=(None,), chunks=(64,),
+                    dtype=EVENT_DTYPE)
+            dset = file['events']
+            dset.resize((len(dset) + len(events),))
+            dset[-len(events):] = events
 
-    def gen_filename(self, directory):
-        now = datetime.now()
-        filename = now.strftime('{}_%Y-%m-%d_%H-%M-%S.h5'.format(self.name))
-        return os.path.join(directory, filename)
+    def parse_buffer(self, data):
+        '''
+        Returns the datasets to store for a buffer of samples, with the
+        outputs of ``filter_chain``
+
+        '''
+        data_dict = self.parse(data)
+        for dataset in self.schedule_dtypes:
+            data_dict[dataset] = data[dataset]
+        if self.filter_chain is not None:
+            data_dict = self.filter_chain(data_dict)
+        return data_dict
+
+    def new_filter_chain(self, columns=None):
+        '''
+        Returns a new ``FilterChain`` of ``filters`` and ``decimate`` for
+        samples of ``columns`` (default is ``all_dtypes()``), or None if
+        neither is set
+
+        '''
+        if not self.filters and self.decimate <= 1:
+            return None
+        if columns is None:
+            columns = self.all_dtypes()
+        from data_filters import FilterChain
+        return FilterChain(self.filters or [], columns=columns, decimate=self.decimate)
+
+    def write_buffer(self, data):
+        '''
+        Write a buffer of samples (dict of dataset_name:array) to the output
+        file
+        Returns the number of rows written
+
+        '''
+        start = time.time()
+        data_dict = self.parse_buffer(data)
+        n = len(data_dict['timestamp'])
+        if not len(data_dict['timestamp']):
+            # every row was decimated
+            return 0
+        if self.rollover_interval and self.rollover_time is None:
+            self.rollover_time = self.next_rollover_time(data_dict['timestamp'][0])
+        limit = self.file_row_limit(data_dict)
+        while len(data_dict['timestamp']):
+            timestamps = data_dict['timestamp']
+            if self.rollover_time is not None and timestamps[0] >= self.rollover_time:
+                self.rollover(self.rollover_time)
+            elif limit is not None and self.file_rows >= limit:
+                self.rollover(timestamps[0])
+            # split the buffer at the next boundary or file limit
+            i = len(timestamps)
+            if self.rollover_time is not None:
+                i = int(timestamps.searchsorted(self.rollover_time))
+            if limit is not None:
+                i = min(i, limit - self.file_rows)
+            if i:
+                self.append_rows(dict((dataset, values[:i]) for dataset, values in data_dict.items()))
+                data_dict = dict((dataset, values[i:]) for dataset, values in data_dict.items())
+        self.flush_times.append(time.time() - start)
+        self.metrics.flush(self.flush_times[-1])
+        return n
+
+    def file_row_limit(self, data_dict):
+        '''
+        Returns the number of rows of an output file after which it is
+        rolled over by ``rollover_rows`` or ``rollover_bytes``, or None. The
+        size of a file is estimated as its rows times the size of a row of
+        ``data_dict``, as the size on disk grows by whole preallocated
+        chunks (and less than that with compression)
+
+        '''
+        limits = []
+        if self.rollover_rows:
+            limits.append(self.rollover_rows)
+        if self.rollover_bytes:
+            row_bytes = sum(values[:1].nbytes for values in data_dict.values())
+            limits.append(max(1, self.rollover_bytes // row_bytes))
+        return min(limits) if limits else None
+
+    def append_rows(self, data_dict):
+        '''
+        Append datasets to the current output file
+
+        '''
+        if self.persistent:
+            if self.writer is None:
+                self.writer = self.new_writer(self.filename, self.file_dtypes()).open()
+            self.writer.append(data_dict)
+        else:
+            self.write(data_dict, filename=self.filename)
+        self.file_rows += len(data_dict['timestamp'])
+
+    def next_rollover_time(self, t):
+        '''
+        Returns the first multiple of ``rollover_interval`` seconds since
+        local midnight after unix time ``t``, or the next midnight if that is
+        sooner
+
+        '''
+        day = datetime.fromtimestamp(t).replace(hour=0, minute=0, second=0, microsecond=0)
+        midnight = day.timestamp()
+        next_midnight = (day + timedelta(days=1)).timestamp()
+        return min(midnight + (int((t - midnight) // self.rollover_interval) + 1) * self.rollover_interval,
+            next_midnight)
+
+    def rollover(self, t):
+        '''
+        Finalize the current output file and start a new one at unix time
+        ``t``
+
+        '''
+        self.close_writer()
+        self.outdir = self.rollover_dir(t)
+        self.filename = self.gen_filename(self.outdir, t)
+        self.file_rows = 0
+        if self.rollover_interval:
+            self.rollover_time = self.next_rollover_time(t)
+        if self.journal is not None:
+            self.journal.set_filename(self.filename)
+        print('rolled over to {}'.format(self.filename))
+
+    def rollover_dir(self, t):
+        '''
+        Returns the directory for a file starting at unix time ``t``, which
+        is the daily directory of that day if ``outdir`` is a daily
+        ``YYYY_MM_DD`` directory, otherwise ``outdir``
+
+        '''
+        outdir = os.path.normpath(self.outdir)
+        if not re.match(r'^\d{4}_\d{2}_\d{2}$', os.path.basename(outdir)):
+            return self.outdir
+        directory = os.path.join(os.path.dirname(outdir), datetime.fromtimestamp(t).strftime('%Y_%m_%d'))
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def close_writer(self):
+        '''
+        Finalize and close the current output file and add it to its
+        directory's index
+
+        '''
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            self.commit_segments()
+        if os.path.isfile(self.filename):
+            self.index_file(self.filename)
+
+    def index_file(self, filename):
+        '''
+        Add or update ``filename`` in its directory's index
+
+        '''
+        from data_query import FileIndex
+        index = FileIndex(os.path.dirname(filename) or '.')
+        index.add(filename)
+        index.save()
+
+    def all_dtypes(self):
+        '''
+        Returns a dict of dataset name:numpy type desc for all datasets
+        of a sample, i.e. ``dtypes`` plus the scheduling statistics
+
+        '''
+        dtypes = dict(self.dtypes)
+        dtypes.update(self.schedule_dtypes)
+        return dtypes
+
+    def new_writer(self, filename, dtypes):
+        '''
+        Returns an (unopened) ``H5Writer`` of ``dtypes`` to ``filename`` with
+        this logger's layout and storage profiles
+
+        '''
+        # a replayed journal may not have all of the current datasets
+        dataset_storage = dict((dataset, profile) for dataset, profile in
+            self.dataset_storage.items() if dataset in dtypes)
+        events = None
+        if self.alerts:
+            from data_alerts import EVENT_DTYPE
+            events = EVENT_DTYPE
+        return H5Writer(filename, dtypes, chunk_size=self.chunk_size,
+            grow_chunks=self.grow_chunks, layout=self.layout,
+            summary_levels=self.summary_levels, storage=self.storage,
+            dataset_storage=dataset_storage, append_rows=self.rows_per_flush(),
+            events=events)
+
+    def rows_per_flush(self):
+        '''
+        Returns the number of rows written to file per flush
+
+        '''
+        return max(1, self.buffer_size // max(1, self.decimate))
+
+    def file_dtypes(self):
+        '''
+        Returns a dict of dataset name:numpy type desc for all datasets
+        written to file, i.e. ``all_dtypes()`` plus the filter outputs
+
+        '''
+        dtypes = self.all_dtypes()
+        if self.filter_chain is not None:
+            dtypes.update(self.filter_chain.dtypes())
+        return dtypes
+
+    def close_file(self):
+        '''
+        Write the current and any queued buffers then trim and close the
+        output file, if it is open. The journal is kept if any rows could not
+        be written
+
+        '''
+        try:
+            try:
+                self.flush()
+            finally:
+                if self.shared_writer is not None:
+                    self.shared_writer.sync()
+                    if self.write_error is not None:
+                        raise self.write_error
+                if self.writer_thread is not None:
+                    writer_thread, self.writer_thread = self.writer_thread, None
+                    writer_thread.stop()
+                    if writer_thread.dropped:
+                        print('dropped {} buffers'.format(writer_thread.dropped))
+        finally:
+            self.close_writer()
+            if self.metrics_server is not None:
+                self.metrics_server.stop()
+                self.metrics_server = None
+            if self.alert_hooks is not None:
+                self.alert_hooks.stop()
+                self.alert_hooks = None
+            if self.journal is not None:
+                if self.journal.pending():
+                    print('{} rows kept in {}'.format(self.journal.pending(), self.journal.path))
+                self.journal.close()
+                self.journal = None
+                self.buffer = None
+        if self.flush_times:
+            print('mean write time {:.1f} ms over {} writes'.format(
+                1e3 * sum(self.flush_times) / len(self.flush_times), len(self.flush_times)))
+
+    def gen_filename(self, directory, t=None):
+        start = datetime.fromtimestamp(t) if t is not None else datetime.now()
+        filename = start.strftime('{}_%Y-%m-%d_%H-%M-%S'.format(self.name))
+        path = os.path.join(directory, filename + '.h5')
+        i = 1
+        while os.path.exists(path):
+            # more than one file started in the same second
+            path = os.path.join(directory, '{}_{}.h5'.format(filename, i))
+            i += 1
+        return path
 
     @file_locking
-    def write(self, data, filename):
+    def write(self, data_dict, filename):
         if not os.path.isfile(filename):
-            return self.create_new_file(data, filename)
-        return self.append_to_file(data, filename)
+            return self.create_new_file(data_dict, filename)
+        return self.append_to_file(data_dict, filename)
 
-    def create_new_file(self, data, filename):
+    def create_new_file(self, data_dict, filename):
+        import h5py
         with h5py.File(filename,'w') as file:
-            data_dict = self.parse(data)
-            for dataset, dtype in self.dtypes.items():
-                file.create_dataset(dataset, shape=(0,), maxshape=(None,), dtype=dtype)
+            for dataset, dtype in self.file_dtypes().items():
+                if dataset not in data_dict:
+                    continue
+                options = {}
+                if self.storage or dataset in self.dataset_storage:
+                    options = storage_options(self.dataset_storage.get(dataset, self.storage),
+                        self.chunk_size, self.rows_per_flush())
+                file.create_dataset(dataset, shape=(0,), maxshape=(None,), dtype=dtype, **options)
                 file[dataset].resize(len(data_dict[dataset]), axis=0)
                 file[dataset][:] = data_dict[dataset]
 
-    def append_to_file(self, data, filename):
+    def append_to_file(self, data_dict, filename):
+        import h5py
         with h5py.File(filename,'a') as file:
-            data_dict = self.parse(data)
             for dataset, values in data_dict.items():
                 file[dataset].resize(len(file[dataset]) + len(values), axis=0)
                 file[dataset][-len(values):] = values
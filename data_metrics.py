@@ -0,0 +1,293 @@
+
+import os
+import sys
+import stat
+import time
+import bisect
+import threading
+import socketserver
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class Histogram(object):
+    '''
+    Cumulative histogram of observed values with fixed bucket upper bounds,
+    as exposed by Prometheus
+
+    Each histogram is only observed from one thread, so no locking is done.
+    A concurrent ``render()`` may see a count one observation ahead of the
+    buckets, which Prometheus tolerates.
+
+    '''
+
+    buckets = (1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 0.01, 0.025, 0.05, 0.1,
+        0.25, 0.5, 1., 2.5, 5., 10.)
+
+    def __init__(self, buckets=None):
+        if buckets is not None:
+            self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.
+        self.last = 0.
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.last = value
+
+    def render(self, name, labels):
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            le = '+Inf' if bound == float('inf') else '{:g}'.format(bound)
+            lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, le, total))
+        lines.append('{}_sum{{{}}} {!r}'.format(name, labels, self.sum))
+        lines.append('{}_count{{{}}} {}'.format(name, labels, self.count))
+        return lines
+
+class LoggerMetrics(object):
+    '''
+    Health metrics of a running ``DataLogger``: samples taken and skipped,
+    achieved and configured sample rate, histograms of ``read()`` latency,
+    scheduling lateness and flush latency, buffer fill, writer queue depth,
+    dropped buffers, output file size and alert events
+
+    The sampling loop calls ``sample()`` and the writer calls ``flush()``,
+    everything else is read from the logger when rendered. The achieved rate
+    is measured over windows of ``rate_window`` seconds.
+
+    '''
+
+    rate_window = 1.
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.samples = 0
+        self.skipped = 0
+        self.read_seconds = Histogram()
+        self.lateness_seconds = Histogram()
+        self.flush_seconds = Histogram()
+        self.rate = 0.
+        self.window_start = time.monotonic()
+        self.window_samples = 0
+        self.alert_events = 0
+
+    def sample(self, read_time, lateness, skipped):
+        self.samples += 1
+        self.skipped += skipped
+        self.read_seconds.observe(read_time)
+        self.lateness_seconds.observe(lateness)
+        now = time.monotonic()
+        if now - self.window_start >= self.rate_window:
+            self.rate = (self.samples - self.window_samples) / (now - self.window_start)
+            self.window_start = now
+            self.window_samples = self.samples
+
+    def flush(self, flush_time):
+        self.flush_seconds.observe(flush_time)
+
+    def alert(self, event):
+        self.alert_events += 1
+
+    def writer_thread(self):
+        if self.logger.shared_writer is not None:
+            return self.logger.shared_writer
+        return self.logger.writer_thread
+
+    def gauges(self):
+        '''
+        Returns a dict of the current value of each gauge
+
+        '''
+        logger = self.logger
+        writer_thread = self.writer_thread()
+        buffer = logger.buffer
+        try:
+            file_size = os.path.getsize(logger.filename)
+        except OSError:
+            file_size = 0
+        return dict(
+            sample_rate_hz=self.rate,
+            configured_sample_rate_hz=logger.sample_rate,
+            buffer_fill_ratio=len(buffer) / buffer.size if buffer is not None else 0.,
+            writer_queue_depth=writer_thread.queue.qsize() if writer_thread is not None else 0,
+            file_size_bytes=file_size,
+            active_alerts=len(logger.alert_engine.active()) if logger.alert_engine is not None else 0,
+        )
+
+    def families(self):
+        '''
+        Returns a list of (name, type, help, sample lines) of each metric
+
+        '''
+        labels = 'logger="{}"'.format(self.logger.name)
+        families = []
+        writer_thread = self.writer_thread()
+        counters = [
+            ('samples_total', 'Samples taken', self.samples),
+            ('skipped_samples_total', 'Sample slots skipped after an overrun', self.skipped),
+            ('dropped_buffers_total', 'Buffers dropped by the writer thread',
+                writer_thread.dropped if writer_thread is not None else 0),
+            ('alert_events_total', 'Alert rules activated or cleared', self.alert_events),
+        ]
+        for name, help, value in counters:
+            families.append((name, 'counter', help, ['larbo_{}{{{}}} {}'.format(name, labels, value)]))
+        helps = dict(
+            sample_rate_hz='Achieved sample rate',
+            configured_sample_rate_hz='Configured sample rate',
+            buffer_fill_ratio='Fraction of the sample buffer filled',
+            writer_queue_depth='Buffers waiting for the writer thread',
+            file_size_bytes='Size of the output file',
+            active_alerts='Alert rules currently active',
+        )
+        for name, value in sorted(self.gauges().items()):
+            families.append((name, 'gauge', helps[name], ['larbo_{}{{{}}} {!r}'.format(name, labels, value)]))
+        histograms = [
+            ('read_seconds', 'Time taken by read()', self.read_seconds),
+            ('lateness_seconds', 'Time samples were taken after their deadline', self.lateness_seconds),
+            ('flush_seconds', 'Time taken to write a buffer', self.flush_seconds),
+        ]
+        for name, help, histogram in histograms:
+            families.append((name, 'histogram', help, histogram.render('larbo_' + name, labels)))
+        return families
+
+    def render(self):
+        '''
+        Returns the metrics in the Prometheus text exposition format
+
+        '''
+        return render_metrics([self])
+
+    def status(self):
+        '''
+        Returns a one line summary
+
+        '''
+        gauges = self.gauges()
+        writer_thread = self.writer_thread()
+        return ('{}: {} samples, {:.1f}/{:g} Hz, read {:.1f} ms, flush {:.1f} ms, '
+            'buffer {:.0%}, {} skipped, {} dropped, {:.1f} MB').format(
+            self.logger.name, self.samples, self.rate, self.logger.sample_rate,
+            1e3 * self.read_seconds.last, 1e3 * self.flush_seconds.last,
+            gauges['buffer_fill_ratio'], self.skipped,
+            writer_thread.dropped if writer_thread is not None else 0,
+            gauges['file_size_bytes'] / 1e6)
+
+def render_metrics(metrics):
+    '''
+    Returns the metrics of several ``LoggerMetrics`` in the Prometheus text
+    exposition format, with the samples of each metric grouped together
+
+    '''
+    families = OrderedDict()
+    for logger_metrics in metrics:
+        for name, kind, help, lines in logger_metrics.families():
+            families.setdefault(name, (kind, help, []))[2].extend(lines)
+    lines = []
+    for name, (kind, help, samples) in families.items():
+        lines.append('# HELP larbo_{} {}'.format(name, help))
+        lines.append('# TYPE larbo_{} {}'.format(name, kind))
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+class StatusLine(object):
+    '''
+    Prints a status line at most once per ``interval`` seconds, overwriting
+    the previous one if ``stream`` is a terminal
+
+    '''
+
+    def __init__(self, interval=5., stream=None):
+        self.interval = interval
+        self.stream = stream or sys.stdout
+        self.tty = self.stream.isatty()
+        self.next_update = time.monotonic()
+
+    def update(self, status):
+        '''
+        Print ``status()`` if the interval has passed, ``status`` is only
+        called when needed
+
+        '''
+        if self.interval is None:
+            return
+        now = time.monotonic()
+        if now < self.next_update:
+            return
+        self.next_update = now + self.interval
+        if self.tty:
+            self.stream.write('\r\033[K' + status())
+        else:
+            self.stream.write(status() + '\n')
+        self.stream.flush()
+
+    def close(self):
+        if self.tty and self.interval is not None:
+            self.stream.write('\n')
+            self.stream.flush()
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def is_socket(path):
+    try:
+        return stat.S_ISSOCK(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return False
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class MetricsServer(object):
+    '''
+    Serves ``metrics.render()`` at ``/metrics`` over HTTP from a background
+    thread. ``address`` is either ``[host]:port`` (host defaults to
+    localhost) or the path of a unix socket. A socket left at that path by a
+    previous run is replaced, anything else there raises ``ValueError``.
+    ``handler`` can be a subclass of ``MetricsHandler`` serving more paths
+
+    '''
+
+    def __init__(self, metrics, address, handler=None):
+        handler = handler or MetricsHandler
+        self.address = address
+        if ':' in address and not address.startswith(('/', '.')):
+            host, port = address.rsplit(':', 1)
+            self.server = ThreadingHTTPServer((host or 'localhost', int(port)), handler)
+            self.server.daemon_threads = True
+            self.path = None
+        else:
+            self.path = address
+            if is_socket(self.path):
+                os.unlink(self.path)
+            elif os.path.lexists(self.path):
+                raise ValueError('metrics address {} exists and is not a socket'.format(self.path))
+            self.server = UnixHTTPServer(self.path, handler)
+        self.server.metrics = metrics
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        print('serving at {}'.format(self.address))
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.path is not None and is_socket(self.path):
+            os.unlink(self.path)
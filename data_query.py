@@ -0,0 +1,287 @@
+
+import os
+import json
+import argparse
+from glob import glob
+from datetime import datetime
+
+# numpy and filelock are imported where they are first needed, see data_logging
+from data_logging import open_swmr, get_n_rows, read_rows, Columns
+
+def default_data_dir():
+    return os.path.join(os.environ.get('LARBO_DIR', './'), 'data')
+
+class FileIndex(object):
+    '''
+    Index of the logger files in one data directory, with the first and last
+    timestamp and number of rows of each file
+
+    The index is kept in ``index.json`` in the directory. An entry is only
+    re-read from its file when the file's size or modification time has
+    changed since it was indexed, so files that are no longer being written
+    are never reopened. Loggers add each file to the index as they finalize
+    it (see ``add()``), and entries of finalized files are read from their
+    attributes.
+
+    Changed entries are merged into the file on disk by ``save()`` while
+    holding ``index.json.lock``, so loggers and readers sharing a directory
+    don't lose each other's updates.
+
+    '''
+
+    filename = 'index.json'
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, self.filename)
+        self.entries = self.load()
+        self.changed = set()
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return dict()
+        try:
+            with open(self.path, 'r') as infile:
+                return json.load(infile)
+        except ValueError:
+            return dict()
+
+    def update(self, name):
+        '''
+        Bring the entries of all ``<name>_*.h5`` files up to date
+        Returns a list of (filename, entry) sorted by first timestamp
+
+        '''
+        files = []
+        for path in glob(os.path.join(self.directory, '{}_*.h5'.format(name))):
+            filename = os.path.basename(path)
+            stat = os.stat(path)
+            entry = self.entries.get(filename)
+            if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+                entry = self.read_entry(path, stat)
+                if entry is None:
+                    continue
+                self.entries[filename] = entry
+                self.changed.add(filename)
+            if entry['n_rows']:
+                files.append((path, entry))
+        return sorted(files, key=lambda item: item[1]['first'])
+
+    def add(self, path):
+        '''
+        Add or update the entry of the file at ``path``
+        Returns the entry, or None if the file could not be read
+
+        '''
+        entry = self.read_entry(path, os.stat(path))
+        if entry is not None:
+            filename = os.path.basename(path)
+            self.entries[filename] = entry
+            self.changed.add(filename)
+        return entry
+
+    def read_entry(self, path, stat):
+        try:
+            with open_swmr(path) as infile:
+                if infile.attrs.get('finalized', False):
+                    n = int(infile.attrs['n_rows'])
+                    first, last = infile.attrs['first_timestamp'], infile.attrs['last_timestamp']
+                    first, last = (float(first), float(last)) if n else (None, None)
+                else:
+                    n = get_n_rows(infile)
+                    timestamps = Columns(infile)['timestamp']
+                    first, last = (float(timestamps[0:1][0]), float(timestamps[n-1:n][0])) if n else (None, None)
+        except (OSError, KeyError):
+            # file is still being created or is not a logger file
+            return None
+        return dict(first=first, last=last, n_rows=n, size=stat.st_size, mtime=stat.st_mtime)
+
+    def save(self):
+        if not self.changed:
+            return
+        import filelock
+        try:
+            with filelock.FileLock(self.path + '.lock', timeout=10):
+                # merge with changes saved by other processes since loading
+                entries = self.load()
+                for filename in self.changed:
+                    entries[filename] = self.entries[filename]
+                tmp = self.path + '.tmp.{}'.format(os.getpid())
+                with open(tmp, 'w') as outfile:
+                    json.dump(entries, outfile, indent=1, sort_keys=True)
+                os.replace(tmp, self.path)
+            self.entries.update(entries)
+        except (OSError, filelock.Timeout):
+            # read-only data directory, index is only kept in memory
+            pass
+        self.changed = set()
+
+def find_files(name, t0, t1, data_dir=None):
+    '''
+    Returns a list of (filename, index entry) of ``<name>_*.h5`` files in
+    the daily ``YYYY_MM_DD`` directories of ``data_dir`` with data between
+    ``t0`` and ``t1``, sorted by first timestamp
+
+    '''
+    data_dir = data_dir or default_data_dir()
+    last_day = datetime.fromtimestamp(t1).strftime('%Y_%m_%d')
+    files = []
+    for directory in sorted(glob(os.path.join(data_dir, '[0-9]'*4 + '_[0-9][0-9]_[0-9][0-9]'))):
+        # files are named by start time, so later directories can't have
+        # any earlier data
+        if os.path.basename(directory) > last_day:
+            break
+        index = FileIndex(directory)
+        for filename, entry in index.update(name):
+            if entry['last'] >= t0 and entry['first'] <= t1:
+                files.append((filename, entry))
+        index.save()
+    return sorted(files, key=lambda item: item[1]['first'])
+
+def search_timestamps(timestamps, value, n, side='left', chunk_size=4096, index=None):
+    '''
+    Binary search of the first ``n`` rows of a sorted on-disk timestamp
+    dataset, reading single values until the range fits in ``chunk_size``
+    rows. ``index`` is the ``timestamp_index`` dataset of compacted files
+    (see ``data_compact``), the timestamp of every ``step`` rows, which
+    narrows the search to a single step
+    Returns the index as ``np.searchsorted`` would
+
+    '''
+    import numpy as np
+    lo, hi = 0, n
+    if index is not None:
+        step = int(index.attrs['step'])
+        i = int(np.searchsorted(index[:], value, side=side))
+        lo, hi = min(n, max(0, i - 1) * step), min(n, i * step)
+    while hi - lo > chunk_size:
+        mid = (lo + hi) // 2
+        mid_value = timestamps[mid:mid+1][0]
+        if mid_value < value or (side == 'right' and mid_value == value):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo + int(np.searchsorted(timestamps[lo:hi], value, side=side))
+
+def query(name, t0, t1, fields=None, data_dir=None, resolution=None):
+    '''
+    Read data of logger ``name`` (e.g. ``'RTD'``) with ``t0 <= timestamp <=
+    t1`` (unix timestamps) from all files in ``data_dir`` (default is
+    ``$LARBO_DIR/data``). Only files overlapping the time range are opened,
+    and only the matching rows of ``fields`` (default is all datasets of any
+    of the files) are read from them. Rows of files without one of the
+    datasets (e.g. written by an older version) are nan for it, or 0 for
+    integer datasets
+    Returns a dict of dataset_name:array, always including ``timestamp``
+    and ``fields``, which are empty if no rows match
+
+    With ``resolution`` (in seconds) the stored summaries are read instead,
+    see ``query_summary``
+
+    '''
+    if resolution is not None:
+        return query_summary(name, t0, t1, resolution, fields=fields, data_dir=data_dir)
+    import numpy as np
+    blocks = []
+    datasets = ['timestamp'] + [dataset for dataset in fields or [] if dataset != 'timestamp']
+    for filename, entry in find_files(name, t0, t1, data_dir=data_dir):
+        with open_swmr(filename) as infile:
+            columns = Columns(infile)
+            keys = columns.keys()
+            if fields is None:
+                datasets += [dataset for dataset in keys if dataset not in datasets]
+            n = get_n_rows(infile)
+            index = infile['timestamp_index'] if 'timestamp_index' in infile else None
+            start = search_timestamps(columns['timestamp'], t0, n, side='left', index=index)
+            stop = search_timestamps(columns['timestamp'], t1, n, side='right', index=index)
+            # files without matching rows still give the dtypes of empty arrays
+            blocks.append(read_rows(infile, [dataset for dataset in datasets if dataset in keys],
+                start=start, stop=max(start, stop)))
+    data = dict()
+    for dataset in datasets:
+        dtypes = [block[dataset].dtype for block in blocks if dataset in block]
+        shapes = [block[dataset].shape[1:] for block in blocks if dataset in block]
+        if not dtypes:
+            if blocks and fields is not None:
+                raise ValueError('{} files have no dataset {}'.format(name, dataset))
+            data[dataset] = np.empty(0)
+            continue
+        fill = np.nan if dtypes[0].kind in 'fc' else 0
+        data[dataset] = np.concatenate([block[dataset] if dataset in block else
+            np.full((len(block['timestamp']),) + shapes[0], fill, dtype=dtypes[0])
+            for block in blocks])
+    return data
+
+def query_summary(name, t0, t1, resolution, fields=None, data_dir=None):
+    '''
+    Read the summary bins (see ``data_summary.SummaryPyramid``) of logger
+    ``name`` overlapping ``t0`` to ``t1`` from all files in ``data_dir``, at
+    the coarsest stored bin width of at most ``resolution`` seconds (the
+    finest if there is none). Bins split between files are merged, and files
+    summarized at finer widths than the others are merged into the widest
+    bins. Files without a summary are skipped
+    Returns a dict of ``timestamp`` (bin start), ``count`` (rows per bin)
+    and ``<field>_count`` (finite values), ``<field>_mean``, ``<field>_min``,
+    ``<field>_max`` and ``<field>_std`` arrays of each of ``fields``
+    (default is all summarized datasets)
+
+    '''
+    import numpy as np
+    from data_summary import STATS, read_summary, merge_summaries, summary_datasets
+    summaries = []
+    for filename, entry in find_files(name, t0, t1, data_dir=data_dir):
+        with open_swmr(filename) as infile:
+            datasets = fields or summary_datasets(infile)
+            if fields is None:
+                fields = datasets
+            width, summary = read_summary(infile, datasets, t0, t1, width=resolution)
+            if summary is not None:
+                summaries.append((width, summary))
+    if not summaries:
+        data = dict(timestamp=np.empty(0), count=np.empty(0, dtype='i8'))
+        for field in fields or []:
+            for stat in STATS:
+                data[field + '_' + stat] = np.empty(0, dtype='i8' if stat == 'count' else 'f8')
+        return data
+    width = max(width for width, _ in summaries)
+    for _, summary in summaries:
+        summary['timestamp'] = np.floor(summary['timestamp'] / width) * width
+    return merge_summaries([summary for _, summary in summaries], fields)
+
+def parse_time(value):
+    '''
+    Parse a unix timestamp or a local ``YYYY-mm-dd HH:MM:SS`` / ``YYYY-mm-dd`` time
+
+    '''
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d_%H-%M-%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            pass
+    raise ValueError('could not parse time {}'.format(value))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print logged data between two times')
+    parser.add_argument('name', help='''logger name, e.g. RTD, PG, ADC''')
+    parser.add_argument('t0', type=parse_time,
+        help='''start time (unix timestamp or "YYYY-mm-dd HH:MM:SS")''')
+    parser.add_argument('t1', type=parse_time,
+        help='''end time (unix timestamp or "YYYY-mm-dd HH:MM:SS")''')
+    parser.add_argument('--fields', nargs='+', default=None,
+        help='''datasets to read (default is all)''')
+    parser.add_argument('--data_dir', default=None,
+        help='''directory containing the daily data directories (default is $LARBO_DIR/data)''')
+    parser.add_argument('--resolution', type=float, default=None,
+        help='''print the count, mean, min, max and std of bins of up to this many seconds from the stored summaries instead of every row, e.g. 60 or 3600 (optional)''')
+    args = parser.parse_args()
+
+    data = query(args.name, args.t0, args.t1, fields=args.fields, data_dir=args.data_dir,
+        resolution=args.resolution)
+    if data:
+        print('\t'.join(data.keys()))
+        for row in zip(*data.values()):
+            print('\t'.join(['{}']*len(row)).format(*row))
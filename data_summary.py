@@ -0,0 +1,349 @@
+
+import numpy as np
+
+def summary_dtype(fields):
+    '''
+    Returns the numpy dtype of a summary row for ``fields``
+
+    '''
+    dtype = [('timestamp', 'f8'), ('count', 'i8')]
+    for field in fields:
+        dtype += [(field + '_count', 'i8')]
+        dtype += [(field + '_' + stat, 'f8') for stat in ('mean', 'min', 'max', 'std')]
+    return np.dtype(dtype)
+
+STATS = ('count', 'mean', 'min', 'max', 'std')
+
+class SummaryLevel(object):
+    '''
+    Running count, mean, min, max and standard deviation of each field in
+    consecutive ``width`` second bins of ``timestamp``
+
+    Bins are merged using the pairwise update of count, mean and sum of
+    squared deviations, so batches can be added in any size. All bins but
+    the last are complete, the last one is updated by the next batch if it
+    falls in the same bin.
+
+    ``count`` is the number of rows in a bin, and ``<field>_count`` the
+    number of finite values of the field the statistics are of, so nan
+    samples (e.g. failed reads) are skipped. The statistics of a field
+    without any finite values in a bin are nan.
+
+    '''
+
+    def __init__(self, width, fields):
+        self.width = width
+        self.fields = list(fields)
+        self.dtype = summary_dtype(self.fields)
+        self.n_complete = 0
+        self.bin = None
+        self.count = 0
+        # empty bins have a mean and m2 of 0 and min/max of +/-inf, so they
+        # merge like any other
+        self.counts = np.zeros(len(self.fields), dtype='i8')
+        self.mean = np.zeros(len(self.fields))
+        self.m2 = np.zeros(len(self.fields))
+        self.min = np.full(len(self.fields), np.inf)
+        self.max = np.full(len(self.fields), -np.inf)
+
+    @property
+    def name(self):
+        return 'summary/{:g}s'.format(self.width)
+
+    def load(self, row, n_complete):
+        '''
+        Resume from the last (possibly incomplete) row of a stored summary
+
+        '''
+        self.n_complete = n_complete
+        self.bin = int(row['timestamp'] // self.width)
+        self.count = int(row['count'])
+        self.counts = np.array([row[field + '_count'] for field in self.fields], dtype='i8')
+        empty = self.counts == 0
+        self.mean = np.where(empty, 0., [row[field + '_mean'] for field in self.fields])
+        self.m2 = np.where(empty, 0., np.array([row[field + '_std'] for field in self.fields])**2 * self.counts)
+        self.min = np.where(empty, np.inf, [row[field + '_min'] for field in self.fields])
+        self.max = np.where(empty, -np.inf, [row[field + '_max'] for field in self.fields])
+
+    def update(self, data_dict):
+        '''
+        Add a batch of rows (dict of dataset_name:array, sorted by timestamp)
+        Returns the statistics of the bins that were changed, all complete
+        but the last, as a tuple of ``(bins, count, counts, mean, m2, min,
+        max)`` arrays, see ``rows()``
+
+        '''
+        bins = np.floor(np.asarray(data_dict['timestamp']) / self.width).astype('i8')
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(bins)) + 1])
+        count = np.diff(np.append(starts, len(bins)))
+        values = np.column_stack([np.asarray(data_dict[field], dtype='f8') for field in self.fields])
+        valid = np.isfinite(values)
+        counts = np.add.reduceat(valid.astype('i8'), starts, axis=0)
+        mean = np.add.reduceat(np.where(valid, values, 0.), starts, axis=0) / np.maximum(counts, 1)
+        m2 = np.add.reduceat(np.where(valid, values - np.repeat(mean, count, axis=0), 0.)**2,
+            starts, axis=0)
+        vmin = np.minimum.reduceat(np.where(valid, values, np.inf), starts, axis=0)
+        vmax = np.maximum.reduceat(np.where(valid, values, -np.inf), starts, axis=0)
+        bins = bins[starts]
+
+        if self.bin is not None and bins[0] == self.bin:
+            # merge first bin of batch into the current bin
+            counts[0], mean[0], m2[0], vmin[0], vmax[0] = merge_stats(
+                (self.counts, self.mean, self.m2, self.min, self.max),
+                (counts[0], mean[0], m2[0], vmin[0], vmax[0]))
+            count[0] += self.count
+        elif self.bin is not None:
+            # current bin is complete, rewrite it along with the new bins
+            bins = np.append(self.bin, bins)
+            count = np.append(self.count, count)
+            counts = np.vstack([self.counts, counts])
+            mean = np.vstack([self.mean, mean])
+            m2 = np.vstack([self.m2, m2])
+            vmin = np.vstack([self.min, vmin])
+            vmax = np.vstack([self.max, vmax])
+
+        self.bin = bins[-1]
+        self.count = count[-1]
+        self.counts = counts[-1]
+        self.mean = mean[-1]
+        self.m2 = m2[-1]
+        self.min = vmin[-1]
+        self.max = vmax[-1]
+        return bins, count, counts, mean, m2, vmin, vmax
+
+    def rows(self, stats):
+        '''
+        Returns the record array of summary rows of the bin statistics
+        returned by ``update()``
+
+        '''
+        bins, count, counts, mean, m2, vmin, vmax = stats
+        rows = np.zeros(len(bins), dtype=self.dtype)
+        rows['timestamp'] = bins * self.width
+        rows['count'] = count
+        empty = counts == 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(m2 / counts)
+        for i, field in enumerate(self.fields):
+            rows[field + '_count'] = counts[:,i]
+            rows[field + '_mean'] = np.where(empty[:,i], np.nan, mean[:,i])
+            rows[field + '_min'] = np.where(empty[:,i], np.nan, vmin[:,i])
+            rows[field + '_max'] = np.where(empty[:,i], np.nan, vmax[:,i])
+            rows[field + '_std'] = std[:,i]
+        return rows
+
+def merge_stats(a, b):
+    '''
+    Returns the ``(count, mean, m2, min, max)`` of the union of two sets of
+    values from theirs, where ``m2`` is the sum of squared deviations from
+    the mean and empty sets have a mean and ``m2`` of 0
+
+    '''
+    count_a, mean_a, m2_a, min_a, max_a = a
+    count_b, mean_b, m2_b, min_b, max_b = b
+    n = count_a + count_b
+    delta = mean_b - mean_a
+    mean = mean_a + delta * count_b / np.maximum(n, 1)
+    m2 = m2_a + m2_b + delta**2 * count_a * count_b / np.maximum(n, 1)
+    return n, mean, m2, np.minimum(min_a, min_b), np.maximum(max_a, max_b)
+
+class SummaryPyramid(object):
+    '''
+    Summaries of a logger's data at several bin widths (``levels``, in
+    seconds), stored in the ``summary/`` group of the output file as one
+    record dataset per level, e.g. ``summary/60s``, with fields
+    ``timestamp`` (bin start), ``count`` and ``<field>_mean``,
+    ``<field>_min``, ``<field>_max``, ``<field>_std`` for each field
+
+    Each ``append()`` updates the last bin of each level and adds any new
+    ones. The changed bins are held back and written together once a bin of
+    the finest level is complete (and by ``trim()``), so the stored summary
+    is at most one finest bin behind the raw data and most appends don't
+    write to it at all. Like the raw datasets, the summary datasets are
+    grown a chunk at a time, the rows past the last bin have a nan
+    ``timestamp`` (see ``summary_rows``) until ``trim()`` removes them.
+    Datasets are created by ``create()``, which must be called before the
+    file is switched to SWMR mode. Use ``read_summary`` to read them.
+
+    '''
+
+    def __init__(self, levels, fields):
+        self.levels = [SummaryLevel(width, fields) for width in sorted(levels)]
+        self.datasets = []
+        self.held = []
+
+    def create(self, file):
+        levels = []
+        self.datasets = []
+        for level in self.levels:
+            if level.name in file:
+                dset = file[level.name]
+                if dset.dtype != level.dtype:
+                    # written by an older version, the level is not continued
+                    continue
+                n = summary_rows(dset)
+                if n:
+                    level.load(dset[n-1], n - 1)
+            else:
+                fill = np.zeros((), dtype=level.dtype)
+                fill['timestamp'] = np.nan
+                dset = file.create_dataset(level.name, shape=(0,), maxshape=(None,),
+                    chunks=(128,), dtype=level.dtype, fillvalue=fill)
+            levels.append(level)
+            self.datasets.append(dset)
+        self.levels = levels
+        # (first row, statistics) of the bins of each level changed since the
+        # last write
+        self.held = [None] * len(self.levels)
+
+    def append(self, data_dict):
+        if not len(data_dict['timestamp']):
+            return
+        for i, level in enumerate(self.levels):
+            start = level.n_complete
+            stats = level.update(data_dict)
+            level.n_complete = start + len(stats[0]) - 1
+            if self.held[i] is not None and self.held[i][0] < start:
+                held_start, held = self.held[i]
+                stats = tuple(np.concatenate([a[:start - held_start], b]) for a, b in zip(held, stats))
+                start = held_start
+            self.held[i] = (start, stats)
+        if self.levels and len(self.held[0][1][0]) > 1:
+            self.write()
+
+    def write(self):
+        '''
+        Write the held back bins
+
+        '''
+        for level, dset, held in zip(self.levels, self.datasets, self.held):
+            if held is None:
+                continue
+            start, stats = held
+            rows = level.rows(stats)
+            stop = start + len(rows)
+            if len(dset) < stop:
+                dset.resize(((stop // dset.chunks[0] + 1) * dset.chunks[0],))
+            dset[start:stop] = rows
+        self.held = [None] * len(self.levels)
+
+    def trim(self):
+        '''
+        Write the held back bins and resize the datasets to the number of
+        bins
+
+        '''
+        self.write()
+        for level, dset in zip(self.levels, self.datasets):
+            dset.resize((level.n_complete + 1 if level.bin is not None else 0,))
+
+def summary_rows(dset):
+    '''
+    Returns the number of bins of a summary dataset, the rows after them
+    (allocated ahead of the bins) have a nan ``timestamp``
+
+    '''
+    lo, hi = 0, len(dset)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if np.isnan(dset[mid]['timestamp']):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+def summary_datasets(file):
+    '''
+    Returns the datasets summarized in ``file``
+
+    '''
+    if 'summary' not in file or not len(file['summary']):
+        return []
+    names = file['summary'][next(iter(file['summary']))].dtype.names
+    return [name[:-len('_mean')] for name in names if name.endswith('_mean')]
+
+def read_summary(file, datasets, t0=None, t1=None, max_rows=2000, width=None):
+    '''
+    Read the summary of ``datasets`` between ``t0`` and ``t1`` (unix
+    timestamps, default is all data) at the finest level with at most
+    ``max_rows`` bins in that span, falling back to the coarsest level. If
+    ``width`` is given, the coarsest level with bins of at most ``width``
+    seconds is read instead (the finest level if there is none)
+    Returns the bin width and a dict of ``<dataset>_<stat>:array`` including
+    ``timestamp`` and ``count``, or ``None, None`` if there is no summary
+
+    '''
+    if 'summary' not in file:
+        return None, None
+    levels = sorted(file['summary'], key=lambda name: float(name[:-1]))
+    if width is not None:
+        levels = [name for name in levels if float(name[:-1]) <= width][-1:] or levels[:1]
+    for name in levels:
+        dset = file['summary'][name]
+        dset.refresh()
+        n = summary_rows(dset)
+        if not n:
+            continue
+        first, last = (t0, t1)
+        if first is None:
+            first = dset[0]['timestamp']
+        if last is None:
+            last = dset[n-1]['timestamp']
+        width = float(name[:-1])
+        if (last - first) / width <= max_rows or name == levels[-1]:
+            break
+    else:
+        return None, None
+    timestamps = dset.fields('timestamp')[:n]
+    start = np.searchsorted(timestamps, first - width, side='right')
+    stop = np.searchsorted(timestamps, last, side='right')
+    # summaries written before the per dataset counts have no <dataset>_count
+    fields = ['timestamp', 'count'] + [dataset + '_' + stat for dataset in datasets
+        for stat in STATS if dataset + '_' + stat in dset.dtype.names]
+    rows = dset.fields(fields)[start:stop]
+    return width, dict((field, rows[field]) for field in fields)
+
+def merge_summaries(summaries, datasets):
+    '''
+    Concatenate summaries of ``datasets`` at the same bin width (dicts as
+    returned by ``read_summary``, e.g. of consecutive files), sorted by bin,
+    merging the statistics of bins that are split between them
+    Returns a dict of ``<dataset>_<stat>:array`` including ``timestamp``
+    and ``count``
+
+    '''
+    fields = ['timestamp', 'count'] + [dataset + '_' + stat for dataset in datasets
+        for stat in STATS]
+    # summaries without per dataset counts count every row
+    data = dict((field, np.concatenate([summary.get(field, summary['count']) if field.endswith('_count')
+        else summary[field] for summary in summaries])) for field in fields)
+    order = np.argsort(data['timestamp'], kind='stable')
+    data = dict((field, values[order]) for field, values in data.items())
+    split = np.flatnonzero(np.diff(data['timestamp']) == 0) + 1
+    if not len(split):
+        return data
+    for dataset in datasets:
+        count, mean, std, vmin, vmax = (data[dataset + '_' + stat]
+            for stat in ('count', 'mean', 'std', 'min', 'max'))
+        empty = count == 0
+        stats = [count, np.where(empty, 0., mean), np.where(empty, 0., std**2 * count),
+            np.where(empty, np.inf, vmin), np.where(empty, -np.inf, vmax)]
+        # merge each bin into the first row of its run, from the last
+        for i in split[::-1]:
+            j = i - 1
+            merged = merge_stats([values[j] for values in stats], [values[i] for values in stats])
+            for values, value in zip(stats, merged):
+                values[j] = value
+        count, mean, m2, vmin, vmax = stats
+        empty = count == 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            data[dataset + '_std'] = np.sqrt(m2 / count)
+        data[dataset + '_count'] = count
+        data[dataset + '_mean'] = np.where(empty, np.nan, mean)
+        data[dataset + '_min'] = np.where(empty, np.nan, vmin)
+        data[dataset + '_max'] = np.where(empty, np.nan, vmax)
+    for i in split[::-1]:
+        data['count'][i - 1] += data['count'][i]
+    keep = np.ones(len(data['timestamp']), dtype=bool)
+    keep[split] = False
+    return dict((field, values[keep]) for field, values in data.items())
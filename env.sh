@@ -1,5 +1,6 @@
 #!/bin/bash
-# Aliases for LArBo system commands
+# Aliases for LArBo system commands, the larbo command is installed by
+# pip3 install -e . (see README.md)
 # Usage:
 #   source env.sh
 
@@ -15,13 +16,18 @@ alias camera-preview=". ${LARBO_DIR}/larbo-cam/preview.sh"
 # LEDs
 # alias front-led=". ${LARBO_DIR}/larbo-led/front_led.sh"
 # Pressure gauge
-alias pg-run="python3 ${LARBO_DIR}/larbo-pressure/collect-data.py ${LARBO_DATA_DIR}"
+alias pg-run="larbo pg ${LARBO_DATA_DIR}"
 # RTDs
-alias rtd-run="python3 ${LARBO_DIR}/larbo-rtd/collect-data.py ${LARBO_DATA_DIR}"
+alias rtd-run="larbo rtd ${LARBO_DATA_DIR}"
 # Level sensor
 alias levelsensor-run='python3 ${LARBO_DIR}/levelsensor/log_arduino.py -o $LARBO_DATA_DIR/LS_$(date +%Y-%m-%d_%H-%M-%S).h5'
 # ADC
-alias adc-run='python3 ${LARBO_DIR}/larbo-adc/collect-data.py ${LARBO_DATA_DIR}'
+alias adc-run='larbo adc ${LARBO_DATA_DIR}'
 
-# Monitor
-alias monitor-run='python3 ${LARBO_DIR}/larbo-monitor/monitor.py ${LARBO_DATA_DIR}'
+# All loggers in one process
+alias daemon-run='larbo daemon run ${LARBO_DIR}/larbo-daemon/config.json --outdir ${LARBO_DATA_DIR}'
+
+# Monitor, served on the Pi only unless LARBO_MONITOR_ADDRESS is set (e.g.
+# to 0.0.0.0:8080 to serve every network the Pi is on, without authentication)
+alias monitor-run='larbo monitor ${LARBO_DATA_DIR}'
+alias monitor-serve='larbo monitor ${LARBO_DATA_DIR} --serve ${LARBO_MONITOR_ADDRESS:-127.0.0.1:8080}'
@@ -4,13 +4,34 @@ import json
 import time
 from collections import OrderedDict
 
-from data_logging import DataLogger
+from data_logging import DataLogger, add_logger_arguments, logger_kwargs
 
 class ADCLogger(DataLogger):
+    '''
+    Logs each channel's raw code and voltage, averaged over ``smoothing``
+    conversions
+
+    By default each conversion is a single-shot conversion and the channels
+    are read in turn. With ``burst=True`` the ADC converts continuously and
+    the ``smoothing`` conversions of each channel are read back to back, one
+    per conversion period (``data_rate`` samples per second, default 860).
+    With ``store_raw=True`` every conversion's code and time (relative to
+    the sample's timestamp) is stored as well, in the ``<channel>_raw`` and
+    ``<channel>_raw_t`` datasets.
+
+    '''
+
     dtypes = {
         'timestamp': 'f8',
         'gain': 'f8'
     }
+    smoothing = 1
+    burst = False
+    data_rate = None
+    store_raw = False
+
+    # full scale range in V of the ADS1115 at each gain
+    pga_range = {2/3: 6.144, 1: 4.096, 2: 2.048, 4: 1.024, 8: 0.512, 16: 0.256}
 
     def init(self):
         '''
@@ -26,10 +47,17 @@ class ADCLogger(DataLogger):
 
             {'differential': ['<+ pin name>', '<- pin name>']}
 
-        Valid pin names are 'P0', 'P1', 'P2', or 'P3'
+        Valid pin names are 'P0', 'P1', 'P2', or 'P3'. A differential
+        channel measures the pins it names (earlier versions always measured
+        P0 - P1, whatever the spec), the ADS1115 can only measure P0 - P1,
+        P0 - P3, P1 - P3 and P2 - P3
 
         '''
         print('initializing ADC...')
+        if self.device != 'hardware':
+            self.init_simulated()
+            return
+
         import board
         import busio
         import adafruit_ads1x15.ads1115 as ADS
@@ -41,6 +69,14 @@ class ADCLogger(DataLogger):
 
         self.ads.gain = self.gain
         print('gain set to {}...'.format(self.ads.gain))
+        if self.burst and self.data_rate is None:
+            self.data_rate = 860
+        if self.data_rate is not None:
+            self.ads.data_rate = self.data_rate
+        if self.burst:
+            from adafruit_ads1x15.ads1x15 import Mode
+            self.ads.mode = Mode.CONTINUOUS
+            print('continuous conversion at {} SPS...'.format(self.data_rate))
 
         self.channels = OrderedDict()
         for spec in self.channel_spec:
@@ -51,36 +87,104 @@ class ADCLogger(DataLogger):
             elif 'differential' in spec:
                 print('declaring differential channel on {}, {}...'.format(*spec['differential']))
                 pins = [getattr(ADS, pin) for pin in spec['differential']]
-                self.channels['d{}{}'.format(*spec['differential'])] = AnalogIn(self.ads, ADS.P0, ADS.P1)
+                self.channels['d{}{}'.format(*spec['differential'])] = AnalogIn(self.ads, *pins)
+
+        self.init_dtypes()
 
+    def init_simulated(self):
+        '''
+        Declares simulated channels, each channel's voltage is given by the
+        ``<channel>_v`` signal (see ``DataLogger.signal``)
+
+        '''
+        from data_devices import SimulatedAnalogIn
+
+        self.channels = OrderedDict()
+        for spec in self.channel_spec:
+            if 'single' in spec:
+                channel = 's{}'.format(spec['single'])
+            elif 'differential' in spec:
+                channel = 'd{}{}'.format(*spec['differential'])
+            print('declaring simulated channel {}...'.format(channel))
+            self.channels[channel] = SimulatedAnalogIn(self.signal(channel+'_v', offset=0.5, noise=1e-3),
+                gain=self.gain, **self.device_options())
+        if self.burst and self.data_rate is None:
+            self.data_rate = 860
+        self.init_dtypes()
+
+    def init_dtypes(self):
+        # datasets in the order they are returned by read()
+        self.dtypes = OrderedDict([('timestamp', 'f8')])
         for channel in self.channels:
             self.dtypes[channel] = 'f8'
             self.dtypes[channel+'_v'] = 'f8'
+        self.dtypes['gain'] = 'f8'
+        if self.store_raw:
+            import numpy as np
+            for channel in self.channels:
+                self.dtypes[channel+'_raw'] = np.dtype(('i2', (self.smoothing,)))
+                self.dtypes[channel+'_raw_t'] = np.dtype(('f4', (self.smoothing,)))
+        self.channel_list = list(self.channels.values())
+        self.volts_per_code = self.pga_range[self.gain] / 32767
+
+    def read_single(self):
+        '''
+        Returns arrays of the codes and times of ``smoothing`` single-shot
+        conversions of each channel, shape ``(n channels, smoothing)``
+
+        '''
+        import numpy as np
+        codes = np.empty((len(self.channel_list), self.smoothing), dtype='i2')
+        times = np.empty(codes.shape)
+        for j in range(self.smoothing):
+            for i, channel in enumerate(self.channel_list):
+                codes[i, j] = channel.value
+                times[i, j] = time.time()
+        return codes, times
+
+    def read_burst(self):
+        '''
+        Returns arrays of the codes and times of ``smoothing`` consecutive
+        conversions of each channel, shape ``(n channels, smoothing)``
+
+        In continuous mode reading the same channel again returns the last
+        conversion without waiting for a new one, so reads are spaced by the
+        conversion period (plus the 10% tolerance of the ADC's clock). Reads
+        are timed by the host clock rather than by the ALERT/RDY pin, which
+        would need a GPIO wired to it, so a conversion can still be read
+        twice (or skipped) if the host falls behind.
+
+        '''
+        import numpy as np
+        codes = np.empty((len(self.channel_list), self.smoothing), dtype='i2')
+        times = np.empty(codes.shape)
+        period = 1.1 / self.data_rate
+        for i, channel in enumerate(self.channel_list):
+            # the first read after switching channels waits for a conversion
+            codes[i, 0] = channel.value
+            times[i, 0] = time.time()
+            next_read = time.monotonic() + period
+            for j in range(1, self.smoothing):
+                wait = next_read - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                codes[i, j] = channel.value
+                times[i, j] = time.time()
+                next_read = time.monotonic() + period
+        return codes, times
 
     def read(self):
-        data = [0] * 2 * len(self.channels)
-        for sample in range(self.smoothing):
-            for i in range(2 * len(self.channels)):
-                channel = list(self.channels.keys())[i//2]
-                if i%2 == 0:
-                    data[i] += self.channels[channel].value / self.smoothing
-                elif i%2 == 1:
-                    data[i] += self.channels[channel].voltage / self.smoothing
-        return tuple([time.time()] + data + [self.gain])
-
-    def parse(self, data):
-        channel_data = list(zip(*data))
-        return_dict = dict()
-        return_dict['timestamp'] = channel_data[0]
-        for i in range(2 * len(self.channels)):
-            if i%2 == 0:
-                channel = list(self.channels.keys())[i//2]
-                return_dict[channel] = channel_data[i+1]
-            elif i%2 == 1:
-                channel = list(self.channels.keys())[i//2]+'_v'
-                return_dict[channel] = channel_data[i+1]
-        return_dict['gain'] = channel_data[-1]
-        return return_dict
+        codes, times = self.read_burst() if self.burst else self.read_single()
+        t = time.time()
+        means = codes.mean(axis=1)
+        data = [t]
+        for mean in means:
+            data += [mean, mean * self.volts_per_code]
+        data.append(self.gain)
+        if self.store_raw:
+            for i in range(len(self.channel_list)):
+                data += [codes[i], times[i] - t]
+        return tuple(data)
 
     def close(self):
         print('closing...')
@@ -97,18 +201,18 @@ if __name__ == '__main__':
         help='''gain setting for adc''')
     parser.add_argument('--smoothing', type=int, default=10,
         help='''number of samples to average together''')
+    parser.add_argument('--burst', action='store_true',
+        help='''convert continuously and read the smoothing conversions of each channel back to back''')
+    parser.add_argument('--data_rate', type=int, default=None, choices=[8, 16, 32, 64, 128, 250, 475, 860],
+        help='''ADC conversions per second (default is 860 with --burst, otherwise the driver default)''')
+    parser.add_argument('--store_raw', action='store_true',
+        help='''also store the code and time of every conversion''')
     parser.add_argument('--channel_spec', type=json.loads, default='''[{"differential":["P0","P1"]}, {"single":"P2"}, {"single":"P3"}]''',
         help='''channel specification as formatted as json string, see ADCLogger.init for more details''')
+    add_logger_arguments(parser)
     args = parser.parse_args()
 
-    outdir = args.outdir
-    sample_rate = args.sample_rate
-    buffer_size = args.buffer_size
-    gain = args.gain
-    smoothing = args.smoothing
-    channel_spec = args.channel_spec
-
-    adc_logger = ADCLogger('ADC', outdir=outdir, buffer_size=buffer_size, sample_rate=sample_rate, channel_spec=channel_spec, gain=gain, smoothing=smoothing)
+    adc_logger = ADCLogger('ADC', **logger_kwargs(args, parser))
     adc_logger.init()
     adc_logger.run()
 
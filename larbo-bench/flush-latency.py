@@ -0,0 +1,66 @@
+
+import argparse
+import tempfile
+import time
+
+from data_logging import DataLogger
+
+class BenchLogger(DataLogger):
+    dtypes = {
+        'timestamp': 'f8',
+        'pressure': 'f8',
+        'temperature': 'f8',
+        'pressure_max': 'f8',
+        'pressure_min': 'f8'
+    }
+
+    def init(self):
+        self.i = 0
+
+    def read(self):
+        self.i += 1
+        return time.time(), self.i, 20., self.i + 1, self.i - 1
+
+    def close(self):
+        pass
+
+def bench(outdir, persistent, n_flushes, buffer_size, report_every, summary_levels=None):
+    logger = BenchLogger('BENCH{}'.format(int(persistent)), outdir=outdir,
+        buffer_size=buffer_size, persistent=persistent, background_writer=False,
+        summary_levels=summary_levels)
+    logger.init()
+    logger.buffer = logger.new_buffer()
+    results = []
+    for i in range(n_flushes):
+        for _ in range(buffer_size):
+            logger.buffer.append(logger.read() + (0., 0))
+        logger.flush()
+        if (i + 1) % report_every == 0:
+            recent = logger.flush_times[-report_every:]
+            results.append(((i + 1) * buffer_size, 1e3 * sum(recent) / len(recent)))
+    logger.close_file()
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare flush latency of the '
+        'reopening and persistent hdf5 writers as a file grows')
+    parser.add_argument('--outdir', default=None,
+        help='''directory for temporary data files (default is a new temp dir)''')
+    parser.add_argument('--n_flushes', type=int, default=2000,
+        help='''number of flushes per writer (default=%(default)s)''')
+    parser.add_argument('--buffer_size', type=int, default=20,
+        help='''samples per flush (default=%(default)s)''')
+    parser.add_argument('--report_every', type=int, default=200,
+        help='''flushes per reported point (default=%(default)s)''')
+    args = parser.parse_args()
+
+    outdir = args.outdir or tempfile.mkdtemp()
+    reopen = bench(outdir, False, args.n_flushes, args.buffer_size, args.report_every)
+    persistent = bench(outdir, True, args.n_flushes, args.buffer_size, args.report_every)
+    # the reopening writer doesn't keep summaries
+    summary = bench(outdir, True, args.n_flushes, args.buffer_size, args.report_every,
+        summary_levels=DataLogger.summary_levels)
+
+    print('\nrows\treopen [ms]\tpersistent [ms]\twith summaries [ms]')
+    for (rows, t_reopen), (_, t_persistent), (_, t_summary) in zip(reopen, persistent, summary):
+        print('{}\t{:.2f}\t\t{:.2f}\t\t{:.2f}'.format(rows, t_reopen, t_persistent, t_summary))
@@ -0,0 +1,62 @@
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from data_logging import H5Writer, open_swmr, read_rows
+
+def make_dtypes(n_fields):
+    dtypes = {'timestamp': 'f8'}
+    for i in range(n_fields - 1):
+        dtypes['field{}'.format(i)] = 'f8'
+    return dtypes
+
+def write_file(filename, dtypes, layout, n_rows, buffer_size):
+    '''
+    Returns the time taken by each append
+
+    '''
+    writer = H5Writer(filename, dtypes, layout=layout).open()
+    data_dict = dict((dataset, np.random.normal(size=buffer_size)) for dataset in dtypes)
+    flush_times = []
+    for i in range(n_rows // buffer_size):
+        data_dict['timestamp'] = i * buffer_size + np.arange(buffer_size, dtype='f8')
+        start = time.perf_counter()
+        writer.append(data_dict)
+        flush_times.append(time.perf_counter() - start)
+    writer.close()
+    return np.array(flush_times)
+
+def read_file(filename, datasets):
+    start = time.perf_counter()
+    with open_swmr(filename) as infile:
+        read_rows(infile, datasets)
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare flush and read cost of '
+        'the one-dataset-per-field and compound hdf5 layouts')
+    parser.add_argument('--outdir', default=None,
+        help='''directory for temporary data files (default is a new temp dir)''')
+    parser.add_argument('--n_rows', type=int, default=2000000,
+        help='''rows per file (default=%(default)s)''')
+    parser.add_argument('--buffer_size', type=int, default=100,
+        help='''rows per flush (default=%(default)s)''')
+    parser.add_argument('--n_fields', type=int, default=8,
+        help='''number of fields (default=%(default)s)''')
+    args = parser.parse_args()
+
+    outdir = args.outdir or tempfile.mkdtemp()
+    dtypes = make_dtypes(args.n_fields)
+    print('layout\t\tflush p50 [ms]\tflush p99 [ms]\tread 2 fields [s]\tread all [s]\tsize [MB]')
+    for layout in ('columns', 'compound'):
+        filename = os.path.join(outdir, 'LAYOUT_{}.h5'.format(layout))
+        flush_times = write_file(filename, dtypes, layout, args.n_rows, args.buffer_size)
+        read_two = read_file(filename, ['timestamp', 'field0'])
+        read_all = read_file(filename, list(dtypes))
+        print('{:10s}\t{:.3f}\t\t{:.3f}\t\t{:.3f}\t\t\t{:.3f}\t\t{:.1f}'.format(
+            layout, 1e3 * np.percentile(flush_times, 50), 1e3 * np.percentile(flush_times, 99),
+            read_two, read_all, os.path.getsize(filename) / 1e6))
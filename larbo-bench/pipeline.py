@@ -0,0 +1,261 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from data_logging import DataLogger, H5Writer, open_swmr, read_rows
+from data_devices import Signal
+
+class SimLogger(DataLogger):
+    '''
+    Logger of ``n_fields`` simulated signals, which stops after ``duration``
+    seconds
+
+    '''
+
+    n_fields = 4
+    duration = 10.
+
+    def init(self):
+        self.dtypes = OrderedDict([('timestamp', 'f8')])
+        for i in range(self.n_fields):
+            self.dtypes['field{}'.format(i)] = 'f8'
+        self.signals = [Signal(offset=i, amplitude=1., noise=0.1) for i in range(self.n_fields)]
+        self.stop_time = None
+
+    def read(self):
+        if self.stop_time is None:
+            self.stop_time = time.monotonic() + self.duration
+        elif time.monotonic() >= self.stop_time:
+            raise KeyboardInterrupt
+        t = time.time()
+        return tuple([t] + [signal(t) for signal in self.signals])
+
+    def close(self):
+        pass
+
+def prefill(filename, dtypes, n_rows, block=65536):
+    '''
+    Write ``n_rows`` rows of fake data, one per second up to now, to a new
+    logger file
+    Returns the open ``H5Writer``
+
+    '''
+    writer = H5Writer(filename, dtypes).open()
+    t0 = time.time() - n_rows
+    for start in range(0, n_rows, block):
+        n = min(block, n_rows - start)
+        data = dict((name, np.zeros(n, dtype=dtype)) for name, dtype in dtypes.items())
+        for name in dtypes:
+            if name.startswith('field') or name == 'temperature':
+                data[name] = np.random.normal(size=n)
+        data['timestamp'] = t0 + np.arange(start, start + n, dtype='f8')
+        writer.append(data)
+    return writer
+
+def bench_logger(outdir, sample_rate, buffer_size, n_fields, file_rows, duration):
+    '''
+    Run a ``SimLogger`` for ``duration`` seconds, appending to a file already
+    holding ``file_rows`` rows
+    Returns a dict of results
+
+    '''
+    logger = SimLogger('SIM', outdir=outdir, buffer_size=buffer_size, sample_rate=sample_rate,
+        n_fields=n_fields, duration=duration)
+    logger.init()
+    if file_rows:
+        prefill(logger.filename, logger.all_dtypes(), file_rows).close()
+    size = os.path.getsize(logger.filename) if file_rows else 0
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.monotonic()
+    try:
+        logger.run()
+    except KeyboardInterrupt:
+        pass
+    elapsed = time.monotonic() - start
+    end_usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    # only the rows written by the logger
+    with open_swmr(logger.filename) as infile:
+        data = read_rows(infile, ['lateness', 'skipped'], start=file_rows)
+    flush_times = np.array(logger.flush_times) * 1e3
+    n_samples = len(data['lateness'])
+    return OrderedDict([
+        ('samples', n_samples),
+        ('rate', n_samples / elapsed),
+        ('skipped', int(np.sum(data['skipped']))),
+        ('lateness_p99_ms', float(np.percentile(data['lateness'], 99)) * 1e3 if n_samples else 0.),
+        ('flush_p50_ms', float(np.percentile(flush_times, 50)) if len(flush_times) else 0.),
+        ('flush_p99_ms', float(np.percentile(flush_times, 99)) if len(flush_times) else 0.),
+        ('bytes_written', os.path.getsize(logger.filename) - size),
+        ('cpu_fraction', (end_usage.ru_utime + end_usage.ru_stime
+            - usage.ru_utime - usage.ru_stime) / elapsed),
+        ('max_rss_mb', end_usage.ru_maxrss / 1024.),
+    ])
+
+def bench_monitor(outdir, file_rows, buffer_size, n_refresh):
+    '''
+    Time the monitor's RTD plot opening a file of ``file_rows`` rows, and
+    refreshing it after each of ``n_refresh`` appends of ``buffer_size`` rows
+    Returns a dict of results
+
+    '''
+    import matplotlib
+    matplotlib.use('Agg')
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'larbo-monitor'))
+    import monitor
+
+    dtypes = OrderedDict([('timestamp', 'f8'), ('temperature', 'f8')])
+    filename = os.path.join(outdir, 'RTD_monitor_{}.h5'.format(file_rows))
+    # the writer has to be in SWMR mode before the monitor opens the file
+    writer = prefill(filename, dtypes, file_rows)
+
+    start = time.perf_counter()
+    fig = monitor.plot_rtd(filename)
+    fig.canvas.draw()
+    open_time = time.perf_counter() - start
+
+    refresh_times = []
+    t = time.time()
+    for i in range(n_refresh):
+        writer.append({'timestamp': t + np.arange(i * buffer_size, (i + 1) * buffer_size) / buffer_size,
+            'temperature': np.random.normal(size=buffer_size)})
+        start = time.perf_counter()
+        fig = monitor.plot_rtd(filename)
+        fig.canvas.draw()
+        refresh_times.append(time.perf_counter() - start)
+    writer.close()
+    monitor.live_plots.pop('RTD').reader.close()
+    refresh_times = np.array(refresh_times) * 1e3
+    return OrderedDict([
+        ('open_ms', open_time * 1e3),
+        ('refresh_p50_ms', float(np.percentile(refresh_times, 50))),
+        ('refresh_p99_ms', float(np.percentile(refresh_times, 99))),
+    ])
+
+def run_isolated(function, *args):
+    '''
+    Run ``function(*args)`` in a fresh process, so CPU and RSS are its own
+    Returns its result
+
+    '''
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        return pool.apply(function, args)
+
+def environment():
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.check_output(['git', 'describe', '--always', '--dirty'],
+            cwd=here, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import h5py
+    return OrderedDict([
+        ('time', time.time()),
+        ('commit', commit),
+        ('host', platform.node()),
+        ('machine', platform.machine()),
+        ('python', platform.python_version()),
+        ('numpy', np.__version__),
+        ('h5py', h5py.__version__),
+        ('hdf5', h5py.version.hdf5_version),
+    ])
+
+def compare(results, baseline, threshold):
+    '''
+    Print the metrics that got worse by more than ``threshold`` (fractional)
+    relative to a previous results file
+    Returns the number of regressions
+
+    '''
+    worse_if_higher = ('flush_p50_ms', 'flush_p99_ms', 'lateness_p99_ms', 'cpu_fraction',
+        'max_rss_mb', 'bytes_written', 'open_ms', 'refresh_p50_ms', 'refresh_p99_ms', 'skipped',
+        'help_p50_ms', 'help_max_ms', 'first_sample_ms', 'bytes_on_disk', 'bytes_per_row',
+        'flush_cpu_p50_ms', 'flush_cpu_p99_ms', 'flush_cpu_s', 'read_all_ms', 'read_tail_ms',
+        'max_abs_error')
+    worse_if_lower = ('rate',)
+    old = dict((json.dumps(result['config'], sort_keys=True), result)
+        for result in baseline['results'])
+    n = 0
+    for result in results:
+        previous = old.get(json.dumps(result['config'], sort_keys=True))
+        if previous is None:
+            continue
+        for key, value in result['metrics'].items():
+            before = previous['metrics'].get(key)
+            if not before:
+                continue
+            change = (value - before) / abs(before)
+            if (key in worse_if_higher and change > threshold) or (key in worse_if_lower and change < -threshold):
+                print('REGRESSION {} {}: {:g} -> {:g} ({:+.0%})'.format(
+                    result['config'], key, before, value, change))
+                n += 1
+    return n
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the logging pipeline '
+        'from simulated device to disk to monitor, no hardware needed')
+    parser.add_argument('--sample_rate', type=float, nargs='+', default=[10, 100, 1000],
+        help='''sample rates to sweep in Hz (default=%(default)s)''')
+    parser.add_argument('--buffer_size', type=int, nargs='+', default=[10, 100],
+        help='''samples per flush to sweep (default=%(default)s)''')
+    parser.add_argument('--n_fields', type=int, nargs='+', default=[4, 32],
+        help='''numbers of fields per sample to sweep (default=%(default)s)''')
+    parser.add_argument('--file_rows', type=int, nargs='+', default=[0, 1000000],
+        help='''rows already in the file when logging or monitoring starts (default=%(default)s)''')
+    parser.add_argument('--duration', type=float, default=5,
+        help='''seconds to log for per configuration (default=%(default)s)''')
+    parser.add_argument('--n_refresh', type=int, default=20,
+        help='''monitor refreshes per file size (default=%(default)s)''')
+    parser.add_argument('--outdir', default=None,
+        help='''directory for temporary data files (default is a new temp dir)''')
+    parser.add_argument('--output', default='pipeline-results.json',
+        help='''file to write the results to as json (default=%(default)s)''')
+    parser.add_argument('--baseline', default=None,
+        help='''previous results file to compare against''')
+    parser.add_argument('--threshold', type=float, default=0.2,
+        help='''fractional change reported as a regression (default=%(default)s)''')
+    args = parser.parse_args()
+
+    outdir = args.outdir or tempfile.mkdtemp()
+    results = []
+    for sample_rate, buffer_size, n_fields, file_rows in itertools.product(
+            args.sample_rate, args.buffer_size, args.n_fields, args.file_rows):
+        config = OrderedDict([('bench', 'logger'), ('sample_rate', sample_rate),
+            ('buffer_size', buffer_size), ('n_fields', n_fields), ('file_rows', file_rows)])
+        print('logger {}'.format(dict(config)))
+        metrics = run_isolated(bench_logger, outdir, sample_rate, buffer_size, n_fields,
+            file_rows, args.duration)
+        print('\t' + ', '.join('{}={:.4g}'.format(key, value) for key, value in metrics.items()))
+        results.append(dict(config=config, metrics=metrics))
+
+    for file_rows in args.file_rows:
+        config = OrderedDict([('bench', 'monitor'), ('file_rows', file_rows),
+            ('buffer_size', args.buffer_size[0])])
+        print('monitor {}'.format(dict(config)))
+        metrics = run_isolated(bench_monitor, outdir, file_rows, args.buffer_size[0],
+            args.n_refresh)
+        print('\t' + ', '.join('{}={:.4g}'.format(key, value) for key, value in metrics.items()))
+        results.append(dict(config=config, metrics=metrics))
+
+    with open(args.output, 'w') as outfile:
+        json.dump(dict(environment=environment(), results=results), outfile, indent=1)
+    print('results written to {}'.format(args.output))
+
+    if args.baseline:
+        with open(args.baseline, 'r') as infile:
+            baseline = json.load(infile)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
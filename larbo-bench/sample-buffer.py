@@ -0,0 +1,103 @@
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from data_logging import SampleBuffer, Journal
+
+class ListBuffer(object):
+    '''
+    The original buffering: a list of tuples transposed with ``zip(*data)``
+    at flush time, which h5py then converts to arrays when writing
+
+    '''
+
+    def __init__(self, dtypes, size, n_segments=1):
+        self.dtypes = dtypes
+        self.size = size
+        self.data = []
+
+    def append(self, row):
+        self.data += [row]
+
+    def full(self):
+        return len(self.data) >= self.size
+
+    def take(self):
+        data_dict = dict(zip(self.dtypes.keys(), zip(*self.data)))
+        self.data = []
+        return data_dict
+
+class JournalBuffer(SampleBuffer):
+    '''
+    ``SampleBuffer`` backed by a memory-mapped ``Journal`` in a temp dir, as
+    used by ``DataLogger``, committing each segment as soon as it is taken
+
+    '''
+
+    def __init__(self, dtypes, size, n_segments=1):
+        path = os.path.join(tempfile.mkdtemp(), '.bench.journal')
+        journal = Journal(path, 'bench.h5', dtypes, size, n_segments)
+        super(JournalBuffer, self).__init__(dtypes, size, n_segments, journal=journal)
+
+    def take(self):
+        segment = self.segment
+        data = super(JournalBuffer, self).take()
+        self.journal.commit(segment)
+        return data
+
+def make_dtypes(n_fields):
+    dtypes = {'timestamp': 'f8'}
+    for i in range(n_fields - 1):
+        dtypes['field{}'.format(i)] = 'f8'
+    return dtypes
+
+def fill_and_flush(buffer, dtypes, rows):
+    for row in rows:
+        buffer.append(row)
+        if buffer.full():
+            for dataset, values in buffer.take().items():
+                # the conversion h5py does before writing
+                np.asarray(values, dtype=dtypes[dataset])
+
+def bench(buffer_class, dtypes, n_samples, buffer_size):
+    '''
+    Returns samples/sec and peak bytes allocated per flush once the buffer
+    exists
+
+    '''
+    rows = [tuple(float(i + j) for j in range(len(dtypes))) for i in range(n_samples)]
+    buffer = buffer_class(dtypes, buffer_size, n_segments=6)
+    start = time.perf_counter()
+    fill_and_flush(buffer, dtypes, rows)
+    rate = n_samples / (time.perf_counter() - start)
+
+    flush_rows = rows[:buffer_size]
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    fill_and_flush(buffer, dtypes, flush_rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return rate, peak - baseline
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare samples/sec and memory '
+        'allocated per flush of the list-of-tuples, SampleBuffer and journaled SampleBuffer paths')
+    parser.add_argument('--n_samples', type=int, default=200000,
+        help='''number of samples per run (default=%(default)s)''')
+    parser.add_argument('--buffer_size', type=int, default=100,
+        help='''samples per flush (default=%(default)s)''')
+    parser.add_argument('--n_fields', type=int, nargs='+', default=[3, 5, 10],
+        help='''number of fields per sample (default=%(default)s)''')
+    args = parser.parse_args()
+
+    print('fields\tbuffer\t\tsamples/sec\tbytes allocated per flush')
+    for n_fields in args.n_fields:
+        dtypes = make_dtypes(n_fields)
+        for buffer_class in (ListBuffer, SampleBuffer, JournalBuffer):
+            rate, allocated = bench(buffer_class, dtypes, args.n_samples, args.buffer_size)
+            print('{}\t{:12s}\t{:.0f}\t\t{}'.format(n_fields, buffer_class.__name__, rate, allocated))
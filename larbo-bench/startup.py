@@ -0,0 +1,142 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from pipeline import environment, compare
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+# modules that must not be imported to print --help
+HEAVY = {
+    'adc': ('numpy', 'h5py', 'matplotlib'),
+    'rtd': ('numpy', 'h5py', 'matplotlib'),
+    'pg': ('numpy', 'h5py', 'matplotlib'),
+    'daemon': ('numpy', 'h5py', 'matplotlib'),
+    'query': ('numpy', 'h5py', 'matplotlib'),
+    'compact': ('numpy', 'h5py', 'matplotlib'),
+    'monitor': ('numpy', 'h5py', 'matplotlib'),
+}
+
+# arguments of each logger to start logging from a simulated device, after
+# the output directory
+LOGGERS = {
+    'adc': ['--device', 'sim', '--sample_rate', '100', '--buffer_size', '1'],
+    'rtd': ['--device', 'sim', '--sample_rate', '100', '--buffer_size', '1'],
+    'pg': ['--device', 'sim', '--sample_rate', '100', '--buffer_size', '1'],
+}
+
+def command(args):
+    return [sys.executable, os.path.join(ROOT, 'larbo.py')] + args
+
+def run_env():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([ROOT] + env.get('PYTHONPATH', '').split(os.pathsep)).rstrip(os.pathsep)
+    return env
+
+def bench_help(name, n_runs):
+    '''
+    Time ``larbo <name> --help`` in fresh processes, and list the heavy
+    modules it imported
+
+    '''
+    times = []
+    for i in range(n_runs):
+        start = time.perf_counter()
+        subprocess.check_call(command([name, '--help']), env=run_env(), stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    # imports are listed on stderr by -X importtime
+    output = subprocess.run([sys.executable, '-X', 'importtime'] + command([name, '--help'])[1:],
+        env=run_env(), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE).stderr.decode()
+    imported = set(line.split('|')[-1].strip() for line in output.splitlines() if '|' in line)
+    times = np.array(times) * 1e3
+    metrics = OrderedDict([
+        ('help_p50_ms', float(np.percentile(times, 50))),
+        ('help_max_ms', float(times.max())),
+    ])
+    return metrics, sorted(imported.intersection(HEAVY[name]))
+
+def bench_first_sample(name, outdir, timeout=60):
+    '''
+    Time from starting ``larbo <name>`` with a simulated device until its
+    first sample is written to disk
+
+    '''
+    outdir = tempfile.mkdtemp(dir=outdir)
+    start = time.perf_counter()
+    process = subprocess.Popen(command([name, outdir] + LOGGERS[name]), env=run_env(),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        from data_logging import open_swmr, get_n_rows
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError('larbo {} exited with status {}'.format(name, process.returncode))
+            for filename in os.listdir(outdir):
+                if not filename.endswith('.h5'):
+                    continue
+                try:
+                    with open_swmr(os.path.join(outdir, filename)) as infile:
+                        if get_n_rows(infile):
+                            return OrderedDict([('first_sample_ms', (time.perf_counter() - start) * 1e3)])
+                except (OSError, KeyError):
+                    # file is still being created
+                    pass
+            time.sleep(0.005)
+        raise RuntimeError('no sample written by larbo {} in {}s'.format(name, timeout))
+    finally:
+        process.send_signal(2)
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark how long the larbo commands take '
+        'to print --help and to log their first sample, no hardware needed')
+    parser.add_argument('--commands', nargs='+', default=list(HEAVY), choices=list(HEAVY),
+        help='''commands to benchmark (default=%(default)s)''')
+    parser.add_argument('--n_runs', type=int, default=5,
+        help='''runs of each --help (default=%(default)s)''')
+    parser.add_argument('--outdir', default=None,
+        help='''directory for temporary data files (default is a new temp dir)''')
+    parser.add_argument('--output', default='startup-results.json',
+        help='''file to write the results to as json (default=%(default)s)''')
+    parser.add_argument('--baseline', default=None,
+        help='''previous results file to compare against''')
+    parser.add_argument('--threshold', type=float, default=0.2,
+        help='''fractional change reported as a regression (default=%(default)s)''')
+    args = parser.parse_args()
+
+    outdir = args.outdir or tempfile.mkdtemp()
+    results = []
+    failed = False
+    for name in args.commands:
+        config = OrderedDict([('bench', 'startup'), ('command', name)])
+        metrics, imported = bench_help(name, args.n_runs)
+        if imported:
+            print('FAILED larbo {} --help imported {}'.format(name, ', '.join(imported)))
+            failed = True
+        if name in LOGGERS:
+            metrics.update(bench_first_sample(name, outdir))
+        print('larbo {}\n\t{}'.format(name,
+            ', '.join('{}={:.4g}'.format(key, value) for key, value in metrics.items())))
+        results.append(dict(config=config, metrics=metrics, heavy_imports=imported))
+
+    with open(args.output, 'w') as outfile:
+        json.dump(dict(environment=environment(), results=results), outfile, indent=1)
+    print('results written to {}'.format(args.output))
+
+    if args.baseline:
+        with open(args.baseline, 'r') as infile:
+            baseline = json.load(infile)
+        if compare(results, baseline, args.threshold):
+            failed = True
+    if failed:
+        sys.exit(1)
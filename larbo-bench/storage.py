@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from data_logging import DataLogger, H5Writer, TailReader, open_swmr, read_rows, storage_profile
+from data_devices import Signal
+from pipeline import environment, compare
+
+# datasets of each sensor: (sample rate in Hz, {dataset: (Signal kwargs, quantum, decimal places
+# kept by the scale-offset profiles)}), quantum is the resolution of the readout
+SENSORS = OrderedDict([
+    ('rtd', (5., OrderedDict([
+        ('resistance', (dict(offset=107.8, amplitude=0.2, period=3600., noise=0.008), 0., 4)),
+        ('temperature', (dict(offset=20., amplitude=0.5, period=3600., noise=0.02), 0., 3)),
+    ]))),
+    ('pg', (10., OrderedDict([
+        ('pressure', (dict(offset=14.7, amplitude=0.05, period=600., noise=0.005), 0.001, 3)),
+        ('temperature', (dict(offset=22., amplitude=0.2, period=3600., noise=0.05), 0.01, 2)),
+        ('pressure_max', (dict(offset=14.71, amplitude=0.05, period=600., noise=0.005), 0.001, 3)),
+        ('pressure_min', (dict(offset=14.69, amplitude=0.05, period=600., noise=0.005), 0.001, 3)),
+    ]))),
+    ('adc', (2., OrderedDict([
+        # mean of 10 codes of 4.096 V / 32767
+        ('dP0P1_v', (dict(offset=0.0, amplitude=0.01, period=600., noise=0.0005), 4.096 / 32767 / 10, 6)),
+        ('sP2_v', (dict(offset=1.5, amplitude=0.01, period=600., noise=0.0005), 4.096 / 32767 / 10, 6)),
+        ('sP3_v', (dict(offset=1.2, amplitude=0.01, period=600., noise=0.0005), 4.096 / 32767 / 10, 6)),
+    ]))),
+])
+
+def generate(sensor, n_rows):
+    '''
+    Returns the dtypes and ``n_rows`` rows of simulated data of ``sensor``,
+    as logged, ending now
+
+    '''
+    rate, datasets = SENSORS[sensor]
+    t = time.time() - n_rows / rate + np.arange(n_rows) / rate
+    t += np.random.exponential(1e-4, n_rows)
+    dtypes = OrderedDict([('timestamp', 'f8')])
+    data = OrderedDict([('timestamp', t)])
+    for dataset, (kwargs, quantum, _) in datasets.items():
+        signal = Signal(**kwargs)
+        values = np.array([signal(ti) for ti in t])
+        if quantum:
+            values = np.round(values / quantum) * quantum
+        dtypes[dataset] = 'f8'
+        data[dataset] = values
+    dtypes.update(DataLogger.schedule_dtypes)
+    data['lateness'] = np.random.exponential(2e-4, n_rows)
+    data['skipped'] = (np.random.random(n_rows) < 1e-4).astype('i8')
+    return dtypes, data
+
+def bench_storage(filename, dtypes, data, buffer_size, storage, dataset_storage, offset=0):
+    '''
+    Append ``data`` ``buffer_size`` rows at a time to a new file with the
+    given storage profiles, then read it back as the monitor does. A first
+    append of ``offset`` rows misaligns the later appends with the chunks,
+    as after a rollover split or a journal replay
+    Returns a dict of results
+
+    '''
+    writer = H5Writer(filename, dtypes, storage=storage, dataset_storage=dataset_storage,
+        append_rows=buffer_size, summary_levels=None).open()
+    n_rows = len(data['timestamp'])
+    cpu_times = []
+    starts = list(range(offset, n_rows, buffer_size))
+    if offset:
+        starts.insert(0, 0)
+    for start, stop in zip(starts, starts[1:] + [n_rows]):
+        block = OrderedDict((dataset, values[start:stop])
+            for dataset, values in data.items())
+        cpu = time.process_time()
+        writer.append(block)
+        cpu_times.append(time.process_time() - cpu)
+    writer.close()
+
+    # the monitor reads the whole file when it is opened, then only new rows
+    start = time.perf_counter()
+    reader = TailReader(filename, list(dtypes))
+    read = reader.read()
+    read_all = time.perf_counter() - start
+    reader.close()
+    start = time.perf_counter()
+    with open_swmr(filename) as infile:
+        read_rows(infile, list(dtypes), start=n_rows - 10 * buffer_size)
+    read_tail = time.perf_counter() - start
+
+    cpu_times = np.array(cpu_times) * 1e3
+    return OrderedDict([
+        ('bytes_on_disk', os.path.getsize(filename)),
+        ('bytes_per_row', os.path.getsize(filename) / n_rows),
+        ('flush_cpu_p50_ms', float(np.percentile(cpu_times, 50))),
+        ('flush_cpu_p99_ms', float(np.percentile(cpu_times, 99))),
+        ('flush_cpu_s', float(cpu_times.sum() / 1e3)),
+        ('read_all_ms', read_all * 1e3),
+        ('read_tail_ms', read_tail * 1e3),
+        ('max_abs_error', max(float(np.max(np.abs(read[dataset] - data[dataset])))
+            for dataset in dtypes)),
+    ])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the bytes on disk, flush CPU time '
+        'and monitor read time of the storage profiles for simulated sensor data')
+    parser.add_argument('--sensors', nargs='+', default=list(SENSORS), choices=list(SENSORS),
+        help='''sensors to simulate (default=%(default)s)''')
+    parser.add_argument('--profiles', type=storage_profile, nargs='+',
+        default=['none', 'lzf', 'gzip', 'archive'],
+        help='''storage profiles to compare, names or json dicts (default=%(default)s)''')
+    parser.add_argument('--buffer_size', type=int, nargs='+', default=[10, 100],
+        help='''rows per flush to sweep (default=%(default)s)''')
+    parser.add_argument('--no_misaligned', action='store_true',
+        help='''don't also run each buffer size with appends misaligned by a third of a buffer''')
+    parser.add_argument('--n_rows', type=int, default=20000,
+        help='''rows per file (default=%(default)s)''')
+    parser.add_argument('--no_scaleoffset', action='store_true',
+        help='''don't also run each compressed profile with the scale-offset filter on the bounded precision datasets''')
+    parser.add_argument('--outdir', default=None,
+        help='''directory for temporary data files (default is a new temp dir)''')
+    parser.add_argument('--output', default='storage-results.json',
+        help='''file to write the results to as json (default=%(default)s)''')
+    parser.add_argument('--baseline', default=None,
+        help='''previous results file to compare against''')
+    parser.add_argument('--threshold', type=float, default=0.2,
+        help='''fractional change reported as a regression (default=%(default)s)''')
+    args = parser.parse_args()
+
+    outdir = args.outdir or tempfile.mkdtemp()
+    results = []
+    for sensor in args.sensors:
+        dtypes, data = generate(sensor, args.n_rows)
+        for profile in args.profiles:
+            variants = [(profile, {})]
+            if not args.no_scaleoffset and profile not in (None, 'none', {}):
+                variants.append((profile, OrderedDict((dataset, {'profile': profile, 'scaleoffset': digits})
+                    for dataset, (_, _, digits) in SENSORS[sensor][1].items())))
+            for storage, dataset_storage in variants:
+                for buffer_size in args.buffer_size:
+                    offsets = [0] if args.no_misaligned or buffer_size < 3 else [0, buffer_size // 3]
+                    for offset in offsets:
+                        config = OrderedDict([('bench', 'storage'), ('sensor', sensor),
+                            ('storage', storage), ('dataset_storage', dataset_storage),
+                            ('buffer_size', buffer_size), ('offset', offset)])
+                        filename = os.path.join(outdir, 'storage.h5')
+                        if os.path.exists(filename):
+                            os.remove(filename)
+                        metrics = bench_storage(filename, dtypes, data, buffer_size, storage,
+                            dataset_storage, offset)
+                        print('{} {}{} buffer_size={}{}'.format(sensor, json.dumps(storage),
+                            ' +scaleoffset' if dataset_storage else '', buffer_size,
+                            ' offset={}'.format(offset) if offset else ''))
+                        print('\t' + ', '.join('{}={:.4g}'.format(key, value) for key, value in metrics.items()))
+                        results.append(dict(config=config, metrics=metrics))
+
+    with open(args.output, 'w') as outfile:
+        json.dump(dict(environment=environment(), results=results), outfile, indent=1)
+    print('results written to {}'.format(args.output))
+
+    if args.baseline:
+        with open(args.baseline, 'r') as infile:
+            baseline = json.load(infile)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
@@ -0,0 +1,83 @@
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from data_logging import H5Writer, open_swmr, read_rows
+
+DTYPES = {
+    'timestamp': 'f8',
+    'index': 'i8'
+}
+
+def writer(filename, n_flushes, buffer_size, sample_rate, ready):
+    writer = H5Writer(filename, DTYPES, chunk_size=256).open()
+    ready.set()
+    for i in range(n_flushes):
+        index = np.arange(i * buffer_size, (i + 1) * buffer_size)
+        writer.append({'timestamp': time.time() + np.zeros(buffer_size), 'index': index})
+        time.sleep(buffer_size / sample_rate)
+    writer.close()
+
+def reader(filename, duration, errors):
+    last_n = 0
+    n_reads = 0
+    start = time.time()
+    with open_swmr(filename) as infile:
+        while time.time() - start < duration:
+            data = read_rows(infile, list(DTYPES.keys()))
+            n = len(data['index'])
+            if n < last_n:
+                errors.put('row count went backwards {} -> {}'.format(last_n, n))
+            if not np.array_equal(data['index'], np.arange(n)):
+                errors.put('inconsistent data at {} rows'.format(n))
+            if np.any(data['timestamp'] == 0):
+                errors.put('unwritten timestamps read at {} rows'.format(n))
+            last_n = n
+            n_reads += 1
+    print('reader {} finished after {} reads of up to {} rows'.format(os.getpid(), n_reads, last_n))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check concurrent reads of a file '
+        'while it is being written in SWMR mode, exits with status 1 on any inconsistency')
+    parser.add_argument('--outdir', default=None,
+        help='''directory for the temporary data file (default is a new temp dir)''')
+    parser.add_argument('--n_readers', type=int, default=4,
+        help='''number of reader processes (default=%(default)s)''')
+    parser.add_argument('--n_flushes', type=int, default=200,
+        help='''number of writer flushes (default=%(default)s)''')
+    parser.add_argument('--buffer_size', type=int, default=50,
+        help='''rows per flush (default=%(default)s)''')
+    parser.add_argument('--sample_rate', type=float, default=5000,
+        help='''simulated sample rate in Hz (default=%(default)s)''')
+    args = parser.parse_args()
+
+    filename = os.path.join(args.outdir or tempfile.mkdtemp(), 'SWMR.h5')
+    duration = args.n_flushes * args.buffer_size / args.sample_rate
+
+    errors = multiprocessing.Queue()
+    ready = multiprocessing.Event()
+    readers = [multiprocessing.Process(target=reader, args=(filename, duration, errors))
+        for _ in range(args.n_readers)]
+    write = multiprocessing.Process(target=writer,
+        args=(filename, args.n_flushes, args.buffer_size, args.sample_rate, ready))
+    # readers can only open the file once the writer has switched to SWMR mode
+    write.start()
+    ready.wait()
+    for proc in readers:
+        proc.start()
+    for proc in [write] + readers:
+        proc.join()
+
+    failed = not errors.empty() or any(proc.exitcode for proc in [write] + readers)
+    while not errors.empty():
+        print(errors.get())
+    with open_swmr(filename) as infile:
+        n = len(read_rows(infile, ['index'])['index'])
+    print('{} rows written, {}'.format(n, 'FAILED' if failed else 'OK'))
+    sys.exit(int(failed))
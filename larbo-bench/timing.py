@@ -0,0 +1,41 @@
+
+import argparse
+
+import numpy as np
+
+from data_logging import open_swmr, read_rows, Columns
+
+def timing_stats(filename):
+    '''
+    Returns a dict of sample timing statistics for a logger file
+
+    '''
+    with open_swmr(filename) as infile:
+        columns = Columns(infile)
+        datasets = [dataset for dataset in ('timestamp', 'lateness', 'skipped') if dataset in columns]
+        data = read_rows(infile, datasets)
+    interval = np.diff(data['timestamp'])
+    stats = {
+        'samples': len(data['timestamp']),
+        'rate': 1. / np.mean(interval) if len(interval) else 0.,
+        'interval_mean': np.mean(interval) if len(interval) else 0.,
+        'interval_std': np.std(interval) if len(interval) else 0.,
+    }
+    if 'lateness' in data and len(data['lateness']):
+        stats['lateness_p50'] = np.percentile(data['lateness'], 50)
+        stats['lateness_p99'] = np.percentile(data['lateness'], 99)
+        stats['lateness_max'] = np.max(data['lateness'])
+    if 'skipped' in data:
+        stats['skipped'] = int(np.sum(data['skipped']))
+    return stats
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print sample timing statistics '
+        'of logger files')
+    parser.add_argument('files', nargs='+', help='''logger data files''')
+    args = parser.parse_args()
+
+    for filename in args.files:
+        print(filename)
+        for key, value in timing_stats(filename).items():
+            print('\t{} = {:g}'.format(key, value))
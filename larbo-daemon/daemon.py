@@ -0,0 +1,266 @@
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import traceback
+from collections import OrderedDict
+
+from data_logging import WriterThread
+from data_metrics import MetricsHandler, MetricsServer, render_metrics
+
+LARBO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# scripts defining the standard loggers, relative to LARBO_DIR
+LOGGER_SCRIPTS = {
+    'ADCLogger': 'larbo-adc/collect-data.py',
+    'PGLogger': 'larbo-pressure/collect-data.py',
+    'RTDLogger': 'larbo-rtd/collect-data.py',
+}
+
+modules = dict()
+
+def load_logger_class(class_name, script=None):
+    '''
+    Returns the ``DataLogger`` subclass ``class_name`` defined in ``script``
+    (default is the script of a standard logger), a path relative to the
+    larbo directory. Each script is only loaded once
+
+    '''
+    script = script or LOGGER_SCRIPTS[class_name]
+    path = os.path.join(LARBO_DIR, script)
+    if path not in modules:
+        module_name = 'larbo_' + os.path.basename(os.path.dirname(path)).replace('-', '_')
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        modules[path] = module
+    return getattr(modules[path], class_name)
+
+class LoggerRunner(object):
+    '''
+    Runs one logger of the daemon in its own thread
+
+    ``config`` is the logger's entry in the config file: ``class`` (e.g.
+    ``"RTDLogger"``), optionally ``script`` (see ``load_logger_class``) and
+    ``autostart`` (default true), and any other keys are passed to the
+    logger as keyword arguments. Each ``start()`` creates a new logger, so
+    a restarted logger writes to a new file.
+
+    '''
+
+    def __init__(self, name, config, outdir, shared_writer):
+        self.name = name
+        self.config = dict(config)
+        self.class_name = self.config.pop('class')
+        self.script = self.config.pop('script', None)
+        self.autostart = self.config.pop('autostart', True)
+        self.outdir = outdir
+        self.shared_writer = shared_writer
+        self.logger = None
+        self.thread = None
+        self.state = 'stopped'
+        self.error = None
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        logger_class = load_logger_class(self.class_name, self.script)
+        kwargs = dict(self.config)
+        kwargs.setdefault('outdir', self.outdir)
+        kwargs.setdefault('status_interval', None)
+        self.logger = logger_class(self.name, shared_writer=self.shared_writer, **kwargs)
+        self.error = None
+        self.state = 'starting'
+        self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            self.logger.init()
+            self.state = 'running'
+            self.logger.run()
+            self.state = 'stopped'
+        except Exception as e:
+            self.state = 'failed'
+            self.error = '{}: {}'.format(type(e).__name__, e)
+            print('{} failed:'.format(self.name))
+            traceback.print_exc()
+
+    def stop(self):
+        if self.logger is not None:
+            self.logger.stop()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def status(self):
+        status = OrderedDict([('state', self.state), ('class', self.class_name)])
+        if self.logger is not None:
+            status['filename'] = self.logger.filename
+            status['samples'] = self.logger.metrics.samples
+            status['sample_rate'] = self.logger.metrics.rate
+        if self.error is not None:
+            status['error'] = self.error
+        return status
+
+class Daemon(object):
+    '''
+    Runs the loggers listed in a config file in one process, each logger's
+    ``read()`` loop in its own thread and all of their writes through a
+    single shared ``WriterThread`` of ``queue_size`` buffers
+
+    The config file is json::
+
+        {"outdir": <output directory, optional>,
+         "control": <[host]:port or unix socket path, optional>,
+         "queue_size": <buffers queued for the writer, optional>,
+         "loggers": {<name>: {"class": <logger class>, <logger kwargs>...}, ...}}
+
+    '''
+
+    def __init__(self, config, outdir, queue_size=8):
+        self.writer = WriterThread(queue_size=queue_size)
+        self.runners = OrderedDict((name, LoggerRunner(name, logger_config, outdir, self.writer))
+            for name, logger_config in config['loggers'].items())
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+
+    def start(self, name):
+        with self.lock:
+            self.runners[name].start()
+
+    def stop(self, name):
+        with self.lock:
+            self.runners[name].stop()
+
+    def status(self):
+        return OrderedDict((name, runner.status()) for name, runner in self.runners.items())
+
+    def render(self):
+        return render_metrics([runner.logger.metrics for runner in self.runners.values()
+            if runner.logger is not None])
+
+    def run(self, status_interval=10):
+        self.writer.start()
+        for name, runner in self.runners.items():
+            if runner.autostart:
+                self.start(name)
+        try:
+            while not self.stopping.wait(status_interval):
+                for runner in self.runners.values():
+                    if runner.state == 'running':
+                        print(runner.logger.metrics.status())
+        finally:
+            for name in self.runners:
+                self.stop(name)
+            self.writer.stop()
+
+    def shutdown(self, *args):
+        self.stopping.set()
+
+class ControlHandler(MetricsHandler):
+    '''
+    ``GET /status`` returns the state of each logger as json, ``POST
+    /start/<name>`` and ``POST /stop/<name>`` start and stop a logger, and
+    ``GET /metrics`` returns the metrics of all loggers
+
+    '''
+
+    def send_json(self, code, data):
+        body = json.dumps(data, indent=1).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/status':
+            self.send_json(200, self.server.metrics.status())
+        else:
+            super(ControlHandler, self).do_GET()
+
+    def do_POST(self):
+        daemon = self.server.metrics
+        parts = self.path.strip('/').split('/')
+        if len(parts) != 2 or parts[0] not in ('start', 'stop'):
+            self.send_error(404)
+            return
+        action, name = parts
+        if name not in daemon.runners:
+            self.send_json(404, dict(error='no logger {}'.format(name)))
+            return
+        try:
+            getattr(daemon, action)(name)
+        except Exception as e:
+            self.send_json(500, dict(error='{}: {}'.format(type(e).__name__, e)))
+            return
+        self.send_json(200, daemon.runners[name].status())
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super(UnixHTTPConnection, self).__init__('localhost')
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+def request(address, method, path):
+    '''
+    Send a request to a running daemon's control ``address``
+    Returns the decoded json response
+
+    '''
+    if ':' in address and not address.startswith(('/', '.')):
+        host, port = address.rsplit(':', 1)
+        connection = http.client.HTTPConnection(host or 'localhost', int(port))
+    else:
+        connection = UnixHTTPConnection(address)
+    connection.request(method, path)
+    response = connection.getresponse()
+    return json.loads(response.read().decode('utf-8'))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run several loggers in one process, '
+        'or control a running daemon')
+    parser.add_argument('command', choices=['run', 'status', 'start', 'stop'],
+        help='''run the daemon, or query/start/stop a logger of a running daemon''')
+    parser.add_argument('arg', nargs='?', default=None,
+        help='''config file (run) or logger name (start, stop)''')
+    parser.add_argument('--outdir', default=None,
+        help='''output directory for created datafiles (default is "outdir" in the config, then $LARBO_DATA_DIR)''')
+    parser.add_argument('--control', default=None,
+        help='''[host]:port or unix socket path of the control endpoint (default is "control" in the config, then localhost:9100)''')
+    parser.add_argument('--status_interval', type=float, default=10,
+        help='''sec between printing the status of each logger (default=%(default)s)''')
+    args = parser.parse_args()
+
+    if args.command != 'run':
+        if args.command != 'status' and args.arg is None:
+            parser.error('a logger name is required')
+        path = '/status' if args.command == 'status' else '/{}/{}'.format(args.command, args.arg)
+        method = 'GET' if args.command == 'status' else 'POST'
+        print(json.dumps(request(args.control or 'localhost:9100', method, path), indent=1))
+        sys.exit(0)
+
+    if args.arg is None:
+        parser.error('a config file is required')
+    with open(args.arg, 'r') as infile:
+        config = json.load(infile)
+    outdir = args.outdir or os.path.expandvars(config.get('outdir') or os.environ.get('LARBO_DATA_DIR', './'))
+    control = args.control or config.get('control', 'localhost:9100')
+
+    daemon = Daemon(config, outdir, queue_size=config.get('queue_size', 8))
+    server = MetricsServer(daemon, control, handler=ControlHandler).start()
+    signal.signal(signal.SIGTERM, daemon.shutdown)
+    signal.signal(signal.SIGINT, daemon.shutdown)
+    try:
+        daemon.run(args.status_interval)
+    finally:
+        server.stop()
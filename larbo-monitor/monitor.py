@@ -1,169 +1,492 @@
 
-from h5py import File
-import matplotlib
-import matplotlib.pyplot as plt
-import matplotlib.dates as md
-from glob import glob
 import os
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
 import datetime
 import time
 import json
-import numpy as np
+import math
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
 from fnmatch import fnmatch
 
-from data_logging import file_locking
+from data_logging import TailReader
+from data_metrics import MetricsHandler, MetricsServer
 
-def get_most_recent(directory, matching='*'):
-    files = glob(os.path.join(directory, matching))
-    if files:
-        modified = list(map(os.path.getmtime, files))
-        recent_file = max(enumerate(files), key=lambda x: modified[x[0]])
-        return recent_file[1]
-    return None
+# matplotlib and h5py are only imported when drawing plots or reading level
+# sensor files, so the headless server and --help start quickly
+
+def to_datenum(timestamps):
+    '''
+    Convert unix timestamps to matplotlib dates in local time, vectorized
+    equivalent of ``md.date2num(map(datetime.datetime.fromtimestamp, timestamps))``
+
+    '''
+    import numpy as np
+    import matplotlib.dates as md
+    timestamps = np.asarray(timestamps, dtype='f8')
+    if not len(timestamps):
+        return timestamps
+    local = datetime.datetime.fromtimestamp(timestamps[-1])
+    utc = datetime.datetime.fromtimestamp(timestamps[-1], datetime.timezone.utc).replace(tzinfo=None)
+    offset = (local - utc).total_seconds()
+    return md.date2num(datetime.datetime(1970, 1, 1)) + (timestamps + offset) / 86400.
+
+def bin_edges(x, xlim, n_bins):
+    '''
+    Split sorted ``x`` into ``n_bins`` equal width bins across ``xlim``, with
+    the points just outside of ``xlim`` included so lines reach the edges
+    Returns the start index of each non-empty bin and the end index of the
+    last bin
+
+    '''
+    import numpy as np
+    lo, hi = np.searchsorted(x, xlim)
+    lo, hi = max(lo - 1, 0), min(hi + 1, len(x))
+    edges = np.linspace(xlim[0], xlim[1], n_bins + 1)[1:-1]
+    starts = np.unique(np.concatenate([[lo], np.searchsorted(x[lo:hi], edges) + lo, [hi - 1]]))
+    return starts[(starts >= lo) & (starts < hi)], hi
+
+def minmax_indices(x, ys, xlim, n_bins):
+    '''
+    Min/max decimation of sorted ``x`` and each of ``ys`` over the visible
+    ``xlim``. Keeps the first, last, minimum and maximum point of every one
+    of ``n_bins`` bins for every ``y``, so spikes are never hidden
+    Returns sorted indices of the points to plot
+
+    '''
+    import numpy as np
+    starts, end = bin_edges(x, xlim, n_bins)
+    if not len(starts):
+        return np.zeros(0, dtype=int)
+    if end - starts[0] <= 4 * n_bins:
+        return np.arange(starts[0], end)
+    counts = np.diff(np.append(starts, end))
+    index = np.arange(starts[0], end)
+    keep = [starts, starts + counts - 1]
+    for y in ys:
+        y = y[starts[0]:end]
+        offset = starts - starts[0]
+        for reduce in (np.fmin, np.fmax):
+            extreme = np.repeat(reduce.reduceat(y, offset), counts)
+            first = np.minimum.reduceat(np.where(y == extreme, index, end), offset)
+            keep += [np.where(first < end, first, starts)]
+    return np.unique(np.concatenate(keep))
+
+def errorbar_segments(x, y, yerr, xlim, n_bins):
+    '''
+    Returns an errorbar line segment for each point in the visible ``xlim``,
+    or if there are more than ``n_bins`` points, one segment per bin at the
+    mean ``x`` spanning the full range of ``y +/- yerr`` within the bin
+
+    '''
+    import numpy as np
+    starts, end = bin_edges(x, xlim, n_bins)
+    if not len(starts):
+        return np.zeros((0, 2, 2))
+    if end - starts[0] <= 4 * n_bins:
+        x, low, high = x[starts[0]:end], (y - yerr)[starts[0]:end], (y + yerr)[starts[0]:end]
+    else:
+        offset = starts - starts[0]
+        counts = np.diff(np.append(starts, end))
+        x = np.add.reduceat(x[starts[0]:end], offset) / counts
+        low = np.fmin.reduceat((y - yerr)[starts[0]:end], offset)
+        high = np.fmax.reduceat((y + yerr)[starts[0]:end], offset)
+    return np.stack([np.column_stack([x, low]), np.column_stack([x, high])], axis=1)
+
+class Series(object):
+    '''
+    Append-only set of named columns with amortized growth
+
+    '''
+
+    def __init__(self, names, capacity=1024):
+        import numpy as np
+        self.columns = dict((name, np.zeros(capacity)) for name in names)
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def append(self, data):
+        import numpy as np
+        n_new = len(next(iter(data.values())))
+        if self.n + n_new > len(next(iter(self.columns.values()))):
+            capacity = max(2 * (self.n + n_new), 1024)
+            for name, column in self.columns.items():
+                self.columns[name] = np.zeros(capacity)
+                self.columns[name][:self.n] = column[:self.n]
+        for name, values in data.items():
+            self.columns[name][self.n:self.n + n_new] = values
+        self.n += n_new
+
+    def __getitem__(self, name):
+        return self.columns[name][:self.n]
+
+class LivePlot(object):
+    '''
+    A figure that is updated in place with the rows appended to a file since
+    the last update, rather than re-reading the file and rebuilding the
+    figure
+
+    ``lines`` maps series names to the ``Line2D`` plotting them against
+    ``timestamp`` and ``errorbars`` maps series names to a pair of the
+    series holding their errors and the ``LineCollection`` drawing them.
+    Lines are min/max decimated (see ``minmax_indices``) to about one point
+    per pixel across the visible x range, and are re-decimated whenever the
+    x range changes so that zooming in shows the full detail. While
+    autoscaling the view follows new data, once zoomed or panned it stays
+    put until the view is returned to cover all of the data.
+
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.filename = None
+        self.reader = None
+        self.fig = None
+        self.ax = None
+        self.series = None
+        self.lines = dict()
+        self.errorbars = dict()
+        self.decimating = False
+
+    def reset(self, filename, names):
+        '''
+        Start a new figure for ``filename``, storing columns ``names``
+        Returns the new axes
+
+        '''
+        import matplotlib.pyplot as plt
+        import matplotlib.dates as md
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+        self.filename = filename
+        self.series = Series(names)
+        self.lines = dict()
+        self.errorbars = dict()
+        self.fig = plt.figure(self.name)
+        self.fig.clf()
+        self.ax = self.fig.add_subplot(1,1,1)
+        self.ax.callbacks.connect('xlim_changed', self.on_xlim_changed)
+        loc = md.AutoDateLocator()
+        fmt = md.AutoDateFormatter(loc)
+        self.ax.xaxis.set_major_locator(loc)
+        self.ax.xaxis.set_major_formatter(fmt)
+        self.ax.xaxis_date()
+        self.ax.grid(True, which='major', alpha=0.75)
+        self.ax.grid(True, which='minor', alpha=0.25)
+        return self.ax
+
+    def update(self, data):
+        '''
+        Append new rows (dict of name:array), timestamps are converted to
+        matplotlib dates
+        Returns the number of new rows
+
+        '''
+        data = dict(data)
+        data['timestamp'] = to_datenum(data['timestamp'])
+        self.series.append(data)
+        return len(data['timestamp'])
+
+    def decimate(self, xlim):
+        '''
+        Set the data of all lines and errorbars to their decimated values
+        within ``xlim``
+
+        '''
+        x = self.series['timestamp']
+        n_bins = max(int(self.ax.get_window_extent().width), 100)
+        index = minmax_indices(x, [self.series[name] for name in self.lines], xlim, n_bins)
+        for name, line in self.lines.items():
+            line.set_data(x[index], self.series[name][index])
+        for name, (err_name, collection) in self.errorbars.items():
+            collection.set_segments(errorbar_segments(x, self.series[name],
+                self.series[err_name], xlim, n_bins))
+
+    def on_xlim_changed(self, ax):
+        if self.decimating or not len(self.series):
+            return
+        x = self.series['timestamp']
+        xlim = ax.get_xlim()
+        if xlim[0] <= x[0] and xlim[1] >= x[-1]:
+            ax.set_autoscalex_on(True)
+        self.decimating = True
+        try:
+            self.decimate(xlim)
+        finally:
+            self.decimating = False
+        self.fig.canvas.draw_idle()
+
+    def draw(self):
+        import numpy as np
+        self.decimating = True
+        try:
+            if self.ax.get_autoscalex_on():
+                x = self.series['timestamp']
+                self.decimate((x[0], x[-1]))
+                self.ax.relim()
+                for _, collection in self.errorbars.values():
+                    segments = collection.get_segments()
+                    if len(segments):
+                        self.ax.update_datalim(np.concatenate(segments))
+                self.ax.autoscale_view()
+            else:
+                self.decimate(self.ax.get_xlim())
+            self.fig.tight_layout()
+        finally:
+            self.decimating = False
+        self.fig.canvas.draw_idle()
+
+live_plots = dict()
+
+def get_live_plot(name, filename, datasets):
+    '''
+    Returns the ``LivePlot`` for figure ``name``, and whether it was reset to
+    read a new file
+
+    '''
+    plot = live_plots.setdefault(name, LivePlot(name))
+    if plot.filename == filename:
+        return plot, False
+    reader = TailReader(filename, datasets)
+    plot.reset(filename, datasets)
+    plot.reader = reader
+    return plot, True
 
-@file_locking
 def plot_ls_disc(filename, thresholds=None):
-    x = []
-    y = []
-    with File(filename,'r') as infile:
-        x = infile['timestamp'][:]
-        y = infile['dP0P1_v'][:]
-    fig = plt.figure('Discrete LS')
-    if not len(x) or not len(y):
-        return fig
-    fig.clf()
-
-    fig, ax = plt.subplots(1,1,num='Discrete LS')
-    loc = md.AutoDateLocator()
-    fmt = md.AutoDateFormatter(loc)
-    ax.xaxis.set_major_locator(loc)
-    ax.xaxis.set_major_formatter(fmt)
-
-    x = list(map(datetime.datetime.fromtimestamp, x))
-    ax.plot(x, y, 'b.')
-    ax.grid(b=True, which='major', alpha=0.75)
-    ax.grid(b=True, which='minor', alpha=0.25)
-    ax.set_ylabel('Bias voltage [V]')
-    fig.tight_layout()
-
-    if thresholds:
-        for threshold in thresholds:
-            ax.plot(x, [threshold]*len(x), 'r--')
-
-    plt.draw()
-    return fig
-
-@file_locking
+    plot, new = get_live_plot('Discrete LS', filename, ['timestamp', 'dP0P1_v'])
+    if new:
+        plot.lines['dP0P1_v'], = plot.ax.plot([], [], 'b.')
+        plot.ax.set_ylabel('Bias voltage [V]')
+        if thresholds:
+            for threshold in thresholds:
+                plot.ax.axhline(threshold, color='r', linestyle='--')
+    if not plot.update(plot.reader.read()):
+        return plot.fig
+
+    plot.draw()
+    return plot.fig
+
 def plot_pg(filename):
-    x = []
-    y = []
-    y_max = []
-    y_min = []
-    with File(filename,'r') as infile:
-        x = infile['timestamp'][:]
-        y = infile['pressure'][:]
-        y_max = infile['pressure_max'][:]
-        y_min = infile['pressure_min'][:]
-    fig = plt.figure('Pressure gauge')
-    fig.clf()
-    if not len(x) or not len(y):
-        return fig
-    fig, ax = plt.subplots(1,1,num='Pressure gauge')
-    loc = md.AutoDateLocator()
-    fmt = md.AutoDateFormatter(loc)
-    ax.xaxis.set_major_locator(loc)
-    ax.xaxis.set_major_formatter(fmt)
-
-    x = list(map(datetime.datetime.fromtimestamp, x))
-    ax.plot(x, y, 'b.')
-    ax.plot(x, y_max, 'b--', alpha=0.2)
-    ax.plot(x, y_min, 'b--', alpha=0.2)
-    ax.grid(b=True, which='major', alpha=0.75)
-    ax.grid(b=True, which='minor', alpha=0.25)
-    ax.set_ylabel('Chamber pressure [psi]')
-    fig.tight_layout()
-
-    plt.draw()
-    return fig
-
-@file_locking
+    datasets = ['timestamp', 'pressure', 'pressure_max', 'pressure_min']
+    plot, new = get_live_plot('Pressure gauge', filename, datasets)
+    if new:
+        plot.lines['pressure'], = plot.ax.plot([], [], 'b.')
+        plot.lines['pressure_max'], = plot.ax.plot([], [], 'b--', alpha=0.2)
+        plot.lines['pressure_min'], = plot.ax.plot([], [], 'b--', alpha=0.2)
+        plot.ax.set_ylabel('Chamber pressure [psi]')
+    if not plot.update(plot.reader.read()):
+        return plot.fig
+
+    plot.draw()
+    return plot.fig
+
 def plot_rtd(filename):
-    x = []
-    y = []
-    with File(filename,'r') as infile:
-        x = infile['timestamp'][:]
-        y = infile['temperature'][:]
-    fig = plt.figure('RTD')
-    fig.clf()
-    if not len(x) or not len(y):
-        return fig
-    fig, ax = plt.subplots(1,1,num='RTD')
-    loc = md.AutoDateLocator()
-    fmt = md.AutoDateFormatter(loc)
-    ax.xaxis.set_major_locator(loc)
-    ax.xaxis.set_major_formatter(fmt)
-
-    x = list(map(datetime.datetime.fromtimestamp, x))
-    ax.plot(x, y, 'r.')
-    ax.grid(b=True, which='major', alpha=0.75)
-    ax.grid(b=True, which='minor', alpha=0.25)
-    ax.set_ylabel('RTD temperature [C]')
-    fig.tight_layout()
-
-    plt.draw()
-    return fig
+    plot, new = get_live_plot('RTD', filename, ['timestamp', 'temperature'])
+    if new:
+        plot.lines['temperature'], = plot.ax.plot([], [], 'r.')
+        plot.ax.set_ylabel('RTD temperature [C]')
+    if not plot.update(plot.reader.read()):
+        return plot.fig
+
+    plot.draw()
+    return plot.fig
 
 def plot_ls(filename, filter=1100, calib=None):
-    x = []
-    y = []
-    yerr = []
+    import numpy as np
+    from h5py import File
+    from matplotlib.collections import LineCollection
+    plot = live_plots.setdefault('Level sensor', LivePlot('Level sensor'))
+    if plot.filename != filename:
+        plot.reset(filename, ['timestamp', 'rise_time', 'rise_time_err'])
+        plot.n_read = 0
+        plot.lines['rise_time'], = plot.ax.plot([], [], 'g.')
+        plot.errorbars['rise_time'] = ('rise_time_err',
+            plot.ax.add_collection(LineCollection([], colors='g')))
+        plot.ax.set_ylabel('RC rise time [$\mu$s]')
+        plot.ax2 = None
+        if calib:
+            plot.ax2 = plot.ax.twinx()
+            plot.ax2.set_ylabel('Liquid level [cm]')
+    # level sensor files are written by an external logger, so are read
+    # without SWMR
     with File(filename,'r') as infile:
-        x = infile['measurements'][:,0]
-        y = infile['measurements'][:,1]
-        yerr = infile['measurements'][:,2]
+        measurements = infile['measurements'][plot.n_read:]
+    plot.n_read += len(measurements)
+    x = measurements[:,0]
+    y = measurements[:,1]
+    yerr = measurements[:,2]
     if filter:
         good_data = (y < filter)
         x = x[good_data]
         y = y[good_data]
         yerr = yerr[good_data]
-    fig = plt.figure('Level sensor')
-    fig.clf()
-    if not len(x) or not len(y) or not len(yerr):
-        return fig
-    fig, ax = plt.subplots(1,1,num='Level sensor')
-    loc = md.AutoDateLocator()
-    fmt = md.AutoDateFormatter(loc)
-    ax.xaxis.set_major_locator(loc)
-    ax.xaxis.set_major_formatter(fmt)
-
-    x = list(map(datetime.datetime.fromtimestamp, x))
-    ax.errorbar(x, y, yerr, fmt='g.')
-    ax.grid(b=True, which='major', alpha=0.75)
-    ax.grid(b=True, which='minor', alpha=0.25)
-    ax.set_ylabel('RC rise time [$\mu$s]')
-
-    if calib:
-        ax2 = ax.twinx()
-        ax2.set_ylabel('Liquid level [cm]')
-        ax2.plot(x, list(map(lambda x: (x - calib[0])*calib[1], y)), alpha=0)
-
-    fig.tight_layout()
-    plt.draw()
-    return fig
-
-def update_plot(directory, matches, last_updated, plot_method, filename=None, **kwargs):
+    if not plot.update({'timestamp': x, 'rise_time': y, 'rise_time_err': yerr}):
+        return plot.fig
+
+    plot.draw()
+    if plot.ax2 is not None:
+        ylim = np.array(plot.ax.get_ylim())
+        plot.ax2.set_ylim((ylim - calib[0])*calib[1])
+    return plot.fig
+
+class Inotify(object):
+    '''
+    Minimal inotify watch on a single directory, using libc through ctypes
+    Raises ``OSError`` if inotify is not available
+
+    '''
+
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self, directory):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            init, add_watch = libc.inotify_init1, libc.inotify_add_watch
+        except (OSError, AttributeError, TypeError):
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self.fd = init(os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch failed on {}'.format(directory))
+
+    def read(self, timeout):
+        '''
+        Wait up to ``timeout`` sec for events
+        Returns the set of names of files created or modified
+
+        '''
+        names = set()
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return names
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return names
+            i = 0
+            while i < len(data):
+                _, _, _, length = self.EVENT.unpack_from(data, i)
+                i += self.EVENT.size
+                names.add(os.fsdecode(data[i:i+length].rstrip(b'\0')))
+                i += length
+
+class FileWatcher(object):
+    '''
+    Keeps track of the most recently modified file matching each of
+    ``patterns`` in ``directory``
+
+    Uses inotify where available, so changes are seen as soon as they happen
+    and nothing is done while the directory is idle. Otherwise the directory
+    is scanned once per ``poll_interval``.
+
+    '''
+
+    def __init__(self, directory, patterns, poll_interval=5):
+        self.directory = directory
+        self.patterns = list(patterns)
+        self.poll_interval = poll_interval
+        self.newest = dict()
+        self.mtimes = dict()
+        try:
+            self.inotify = Inotify(directory)
+        except OSError as e:
+            print('{}, polling {} every {}s'.format(e, directory, poll_interval))
+            self.inotify = None
+        self.last_scan = 0
+        self.scan()
+
+    def match(self, name):
+        for pattern in self.patterns:
+            if fnmatch(name, pattern):
+                return pattern
+        return None
+
+    def scan(self):
+        '''
+        Update the newest file for each pattern from a single directory scan
+        Returns the set of patterns whose newest file was modified
+
+        '''
+        changed = set()
+        mtimes = dict()
+        newest = dict()
+        for entry in os.scandir(self.directory):
+            pattern = self.match(entry.name)
+            if pattern is None:
+                continue
+            mtime = entry.stat().st_mtime
+            mtimes[entry.name] = mtime
+            if mtime != self.mtimes.get(entry.name):
+                changed.add(pattern)
+            if pattern not in newest or mtime > newest[pattern][0]:
+                newest[pattern] = (mtime, entry.name)
+        self.mtimes = mtimes
+        self.newest = dict((pattern, name) for pattern, (_, name) in newest.items())
+        self.last_scan = time.monotonic()
+        return changed
+
+    def poll(self, timeout=0):
+        '''
+        Wait up to ``timeout`` sec for a matching file to change
+        Returns the set of patterns with a changed file
+
+        '''
+        if self.inotify is None:
+            wait = self.last_scan + self.poll_interval - time.monotonic()
+            if wait > timeout:
+                time.sleep(timeout)
+                return set()
+            time.sleep(max(wait, 0))
+            return self.scan()
+        changed = set()
+        for name in self.inotify.read(timeout):
+            pattern = self.match(name)
+            if pattern is not None:
+                # just modified, so is now the most recently modified
+                self.newest[pattern] = name
+                changed.add(pattern)
+        return changed
+
+    def get_file(self, pattern):
+        if pattern not in self.newest:
+            return None
+        return os.path.join(self.directory, self.newest[pattern])
+
+def select_file(watcher, matches, filename=None):
+    '''
+    Returns the path of ``filename`` if it matches, otherwise of the newest
+    file matching ``matches``
+
+    '''
     if not filename or not fnmatch(filename, matches):
-        filename = get_most_recent(directory, matches)
-    else:
-        filename = os.path.join(directory, filename)
+        return watcher.get_file(matches)
+    return os.path.join(watcher.directory, filename)
+
+def update_plot(watcher, matches, plot_method, filename=None, **kwargs):
+    filename = select_file(watcher, matches, filename)
     if not filename:
         return None
-    if not last_updated or last_updated < os.path.getmtime(filename):
-        print('Updating from {}...'.format(filename))
-        plot_method(filename=filename, **kwargs)
-    return os.path.getmtime(filename)
+    print('Updating from {}...'.format(filename))
+    plot_method(filename=filename, **kwargs)
+    return filename
 
 def refresh_plots(interval):
+    import matplotlib.pyplot as plt
     manager = plt._pylab_helpers.Gcf.get_active()
     if manager is not None:
         canvas = manager.canvas
@@ -173,37 +496,428 @@ def refresh_plots(interval):
     else:
         time.sleep(interval)
 
+def wait_for_changes(watcher, timeout, interval=0.1):
+    '''
+    Keep the plots responsive until a watched file changes, or ``timeout``
+    sec have passed
+    Returns the set of patterns with a changed file
+
+    '''
+    import matplotlib.pyplot as plt
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if plt._pylab_helpers.Gcf.get_active() is None:
+            # nothing to keep responsive, just wait on the watcher
+            changed = watcher.poll(max(remaining, 0))
+        else:
+            changed = watcher.poll(0)
+            if not changed and remaining > 0:
+                refresh_plots(min(interval, remaining))
+        if changed or time.monotonic() >= deadline:
+            return changed
+
+class SensorView(object):
+    '''
+    In-memory copy of ``datasets`` of the newest file matching ``matches``,
+    for the headless server
+
+    ``update(filename)`` reads only the rows appended since the last update,
+    or starts over if ``filename`` is a new file. Reads and updates are done
+    under ``lock``. Decimated responses are cached per data version, so any
+    number of clients asking for the same window cost one decimation.
+
+    If ``data_dir`` (the directory of the daily data directories) is given,
+    windows starting before the newest file are filled in from the stored
+    summaries of the earlier files of the logger (``matches`` up to the
+    first ``*``), see ``history``.
+
+    '''
+
+    cache_size = 32
+
+    def __init__(self, name, title, matches, datasets, options=None, data_dir=None):
+        self.name = name
+        self.title = title
+        self.matches = matches
+        self.datasets = list(datasets)
+        self.options = options or dict()
+        self.data_dir = data_dir
+        self.logger = matches.split('*')[0]
+        self.filename = None
+        self.reader = None
+        self.series = Series(self.datasets)
+        self.version = 0
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+
+    def read(self):
+        '''
+        Returns a dict of dataset_name:array of the new rows of the file
+
+        '''
+        return self.reader.read()
+
+    def open(self, filename):
+        if self.reader is not None:
+            self.reader.close()
+        self.reader = TailReader(filename, self.datasets)
+
+    def update(self, filename):
+        '''
+        Read the new rows of ``filename``
+        Returns the number of new rows
+
+        '''
+        with self.lock:
+            if filename != self.filename:
+                self.open(filename)
+                self.filename = filename
+                self.series = Series(self.datasets)
+                self.version += 1
+            data = self.read()
+            n = len(data['timestamp'])
+            if n:
+                self.series.append(data)
+                self.version += 1
+            return n
+
+    def info(self):
+        with self.lock:
+            x = self.series['timestamp']
+            return OrderedDict([('name', self.name), ('title', self.title),
+                ('file', os.path.basename(self.filename) if self.filename else None),
+                ('columns', self.datasets), ('n_rows', len(x)),
+                ('first', float(x[0]) if len(x) else None),
+                ('last', float(x[-1]) if len(x) else None),
+                ('version', self.version), ('options', self.options)])
+
+    def decimated(self, t0=None, t1=None, window=None, n_bins=1000):
+        '''
+        Returns the rows between unix times ``t0`` and ``t1``, or in the last
+        ``window`` seconds of data, min/max decimated to ``n_bins`` bins (see
+        ``minmax_indices``), as a dict of dataset_name:array. Rows before the
+        newest file are read from the summaries of earlier files, if any
+
+        '''
+        import numpy as np
+        x = self.series['timestamp']
+        if not len(x):
+            return OrderedDict((name, np.zeros(0)) for name in self.datasets)
+        if window is not None:
+            t1 = x[-1]
+            t0 = t1 - window
+        xlim = (x[0] if t0 is None else t0, x[-1] if t1 is None else t1)
+        ys = [self.series[name] for name in self.datasets if name != 'timestamp'
+            and not name.endswith('_err')]
+        index = minmax_indices(x, ys, xlim, n_bins)
+        data = OrderedDict((name, self.series[name][index]) for name in self.datasets)
+        if self.data_dir is None or xlim[0] >= min(x[0], xlim[1]):
+            return data
+        try:
+            history = self.history(xlim[0], min(x[0], xlim[1]), (xlim[1] - xlim[0]) / n_bins)
+        except (OSError, KeyError) as e:
+            print('Could not read the summaries of {}: {}'.format(self.logger, e))
+            return data
+        return OrderedDict((name, np.concatenate([history[name], data[name]])) for name in self.datasets)
+
+    def history(self, t0, t1, resolution):
+        '''
+        Returns the min and max of the summary bins of at most ``resolution``
+        seconds of this view's logger from ``t0`` up to ``t1`` (see
+        ``data_query.query_summary``), as a min row then a max row at the
+        start of each bin
+
+        '''
+        import numpy as np
+        from data_query import query
+        fields = [name for name in self.datasets if name != 'timestamp']
+        summary = query(self.logger, t0, t1, fields=fields, data_dir=self.data_dir,
+            resolution=resolution)
+        keep = summary['timestamp'] < t1
+        data = OrderedDict(timestamp=np.repeat(summary['timestamp'][keep], 2))
+        for name in fields:
+            data[name] = np.column_stack([summary[name + '_min'][keep],
+                summary[name + '_max'][keep]]).ravel()
+        return data
+
+    def response(self, fmt='json', **kwargs):
+        '''
+        Returns the content type and body of a ``decimated()`` response in
+        ``fmt``, either json or binary (each column as little endian
+        float64, one after another)
+
+        '''
+        import numpy as np
+        with self.lock:
+            key = (self.version, fmt) + tuple(sorted(kwargs.items()))
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+            data = self.decimated(**kwargs)
+            if fmt == 'binary':
+                body = np.stack([np.asarray(values, dtype='<f8') for values in data.values()]).tobytes()
+                response = ('application/octet-stream', body)
+            else:
+                body = json.dumps(dict((name, values.tolist()) for name, values in data.items()))
+                response = ('application/json', body.encode('utf-8'))
+            self.cache[key] = response
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            return response
+
+class LevelSensorView(SensorView):
+    '''
+    ``SensorView`` of the level sensor files, which are written by an
+    external logger so are reopened without SWMR for every read. Rise times
+    of ``filter`` us or more are dropped
+
+    '''
+
+    def __init__(self, name, title, matches, filter=1100, options=None):
+        super(LevelSensorView, self).__init__(name, title, matches,
+            ['timestamp', 'rise_time', 'rise_time_err'], options)
+        self.filter = filter
+
+    def open(self, filename):
+        self.n_read = 0
+
+    def read(self):
+        from h5py import File
+        with File(self.filename, 'r') as infile:
+            measurements = infile['measurements'][self.n_read:]
+        self.n_read += len(measurements)
+        if self.filter:
+            measurements = measurements[measurements[:,1] < self.filter]
+        return dict(timestamp=measurements[:,0], rise_time=measurements[:,1],
+            rise_time_err=measurements[:,2])
+
+class Monitor(object):
+    '''
+    Headless monitor, keeps the ``SensorView`` of each sensor up to date
+    with the files in ``directory`` and wakes up clients waiting on
+    ``wait()`` when one changes
+
+    '''
+
+    def __init__(self, directory, views, filename=None, poll_interval=5):
+        self.views = OrderedDict((view.name, view) for view in views)
+        self.filename = filename
+        self.watcher = FileWatcher(directory, [view.matches for view in views],
+            poll_interval=poll_interval)
+        self.condition = threading.Condition()
+        self.versions = dict((name, 0) for name in self.views)
+        self.version = 0
+        self.stopping = threading.Event()
+
+    def update(self, matches):
+        '''
+        Update the views of files matching ``matches``
+        Returns False if a file could not be read yet
+
+        '''
+        ok = True
+        for view in self.views.values():
+            if view.matches != matches:
+                continue
+            filename = select_file(self.watcher, matches, self.filename)
+            if not filename:
+                continue
+            try:
+                if not view.update(filename):
+                    continue
+            except Exception as e:
+                # file may still be being created, or not have the view's
+                # datasets yet (e.g. a level sensor file without
+                # measurements), as in the GUI a bad file must not stop the
+                # other views from being served
+                print('Could not read {}: {}'.format(filename, e))
+                ok = False
+                continue
+            with self.condition:
+                self.version += 1
+                self.versions[view.name] = self.version
+                self.condition.notify_all()
+        return ok
+
+    def wait(self, version, timeout=None):
+        '''
+        Wait up to ``timeout`` sec for a view to change after ``version``
+        Returns the names of the changed views and the current version
+
+        '''
+        with self.condition:
+            self.condition.wait_for(lambda: self.version > version or self.stopping.is_set(), timeout)
+            return [name for name, v in self.versions.items() if v > version], self.version
+
+    def run(self, interval):
+        changed = set(self.watcher.patterns)
+        while not self.stopping.is_set():
+            retry = set()
+            for matches in changed:
+                if not self.update(matches):
+                    retry.add(matches)
+            changed = self.watcher.poll(interval) | retry
+
+    def stop(self):
+        self.stopping.set()
+        with self.condition:
+            self.condition.notify_all()
+
+class MonitorHandler(MetricsHandler):
+    '''
+    ``GET /`` returns the monitor page, ``GET /api/views`` the state of each
+    view as json, ``GET /api/data/<view>?window=<sec>|t0=<unix time>&t1=<unix
+    time>&n=<bins>&format=json|binary`` decimated data (the binary columns
+    are listed in the ``X-Columns`` header) and ``GET /api/events`` a stream
+    of server-sent ``update`` events with the state of each changed view
+
+    '''
+
+    keepalive = 15
+    page = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'index.html')
+
+    def send_body(self, content_type, body, headers=None):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for header, value in (headers or dict()).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        monitor = self.server.metrics
+        url = urlsplit(self.path)
+        parts = url.path.strip('/').split('/')
+        if url.path in ('/', '/index.html'):
+            with open(self.page, 'rb') as infile:
+                self.send_body('text/html; charset=utf-8', infile.read())
+        elif parts == ['api', 'views']:
+            body = json.dumps([view.info() for view in monitor.views.values()])
+            self.send_body('application/json', body.encode('utf-8'))
+        elif len(parts) == 3 and parts[:2] == ['api', 'data'] and parts[2] in monitor.views:
+            view = monitor.views[parts[2]]
+            query = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+            try:
+                kwargs = dict(n_bins=max(1, min(int(query.get('n', 1000)), 10000)))
+                for key in ('t0', 't1', 'window'):
+                    if key in query:
+                        kwargs[key] = float(query[key])
+                        if not math.isfinite(kwargs[key]):
+                            raise ValueError('{} must be finite'.format(key))
+            except ValueError as e:
+                self.send_error(400, explain=str(e))
+                return
+            content_type, body = view.response(query.get('format', 'json'), **kwargs)
+            self.send_body(content_type, body, {'X-Columns': ','.join(view.datasets)})
+        elif parts == ['api', 'events']:
+            self.send_events(monitor)
+        else:
+            self.send_error(404)
+
+    def send_events(self, monitor):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        changed, version = list(monitor.views), 0
+        try:
+            while not monitor.stopping.is_set():
+                for name in changed:
+                    event = 'event: update\ndata: {}\n\n'.format(json.dumps(monitor.views[name].info()))
+                    self.wfile.write(event.encode('utf-8'))
+                if not changed:
+                    self.wfile.write(b': keepalive\n\n')
+                self.wfile.flush()
+                changed, version = monitor.wait(version, self.keepalive)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+def history_dir(directory):
+    '''
+    Returns the directory of the daily data directories, if ``directory``
+    is one of them, otherwise ``directory``
+
+    '''
+    directory = os.path.normpath(directory)
+    if fnmatch(os.path.basename(directory), '[0-9]'*4 + '_[0-9][0-9]_[0-9][0-9]'):
+        return os.path.dirname(directory)
+    return directory
+
+def serve(args):
+    '''
+    Run the headless monitor, serving at ``args.serve``
+
+    '''
+    data_dir = history_dir(args.dir)
+    views = [
+        SensorView('ls_disc', 'Discrete LS', 'ADC*.h5', ['timestamp', 'dP0P1_v'],
+            options=dict(ylabel='Bias voltage [V]', thresholds=args.ls_disc_thresholds),
+            data_dir=data_dir),
+        LevelSensorView('ls', 'Level sensor', 'LS*.h5',
+            options=dict(ylabel='RC rise time [us]', y2label='Liquid level [cm]',
+                calib=[args.ls_calib_0, args.ls_calib_1])),
+        SensorView('rtd', 'RTD', 'RTD*.h5', ['timestamp', 'temperature'],
+            options=dict(ylabel='RTD temperature [C]'), data_dir=data_dir),
+        SensorView('pg', 'Pressure gauge', 'PG*.h5',
+            ['timestamp', 'pressure', 'pressure_max', 'pressure_min'],
+            options=dict(ylabel='Chamber pressure [psi]'), data_dir=data_dir),
+    ]
+    monitor = Monitor(args.dir, views, filename=args.file, poll_interval=args.refresh_rate)
+    server = MetricsServer(monitor, args.serve, handler=MonitorHandler).start()
+    try:
+        monitor.run(args.refresh_rate)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        monitor.stop()
+        server.stop()
+
 if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument('dir', help='The data directory to monitor')
     parser.add_argument('--file','-f', default=None, help='''File to load within directory (optional)''')
     parser.add_argument('--refresh_rate', type=float, default=5, help='How often to check '
-        'for updated data files in sec')
+        'for updated data files in sec, if inotify is not available')
     parser.add_argument('--ls_calib_0', type=float, default=963, help='Calibration offset '
         'for level sensor')
     parser.add_argument('--ls_calib_1', type=float, default=0.153, help='Calibration scale '
         'for level sensor')
     parser.add_argument('--ls_disc_thresholds', type=json.loads, default=[1.466,1.489,1.509,1.528], help='''Thresholds for discrete level sensor (json formatted list)''')
+    parser.add_argument('--serve', default=None, help='''Run headless, serving the plots to web browsers at [host]:port or a unix socket path (optional)''')
 
     args = parser.parse_args()
+    if args.serve:
+        serve(args)
+        raise SystemExit
+    import matplotlib.pyplot as plt
     plt.ion()
 
-    last_updated = {
-        'LS': None,
-        'LS_DISC': None,
-        'RTD': None,
-        'PG': None,
-    }
+    plots = [
+        ('ADC*.h5', plot_ls_disc, dict(thresholds=args.ls_disc_thresholds)),
+        ('LS*.h5', plot_ls, dict(calib=(args.ls_calib_0, args.ls_calib_1))),
+        ('RTD*.h5', plot_rtd, dict()),
+        ('PG*.h5', plot_pg, dict()),
+    ]
+    watcher = FileWatcher(args.dir, [matches for matches, _, _ in plots],
+        poll_interval=args.refresh_rate)
+    changed = set(watcher.patterns)
     while True:
-        last_updated['LS_DISC'] = update_plot(args.dir, 'ADC*.h5', last_updated['LS_DISC'],plot_ls_disc, filename=args.file, thresholds=args.ls_disc_thresholds)
-        try:
-            last_updated['LS'] = update_plot(args.dir, 'LS*.h5', last_updated['LS'], plot_ls, filename=args.file, calib=(args.ls_calib_0, args.ls_calib_1))
-        except:
-            pass
-        last_updated['RTD'] = update_plot(args.dir, 'RTD*.h5', last_updated['RTD'], plot_rtd, filename=args.file)
-        last_updated['PG'] = update_plot(args.dir, 'PG*.h5', last_updated['PG'], plot_pg, filename=args.file)
+        retry = set()
+        for matches, plot_method, kwargs in plots:
+            if matches not in changed:
+                continue
+            try:
+                update_plot(watcher, matches, plot_method, filename=args.file, **kwargs)
+            except OSError as e:
+                # file may still be being created
+                print('Could not read {}: {}'.format(watcher.get_file(matches), e))
+                retry.add(matches)
+            except:
+                if plot_method is not plot_ls:
+                    raise
 
         print('Last checked: {}'.format(datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S")),end='\r')
-        refresh_plots(args.refresh_rate)
-
+        changed = wait_for_changes(watcher, args.refresh_rate) | retry
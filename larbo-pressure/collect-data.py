@@ -1,10 +1,116 @@
 
 import time
 import argparse
+import threading
+from collections import OrderedDict
 
-from data_logging import DataLogger
+from data_logging import DataLogger, add_logger_arguments, logger_kwargs
+
+def parse_line(line):
+    '''
+    Returns the pressure and temperature of a ``<pressure>,<unit>
+    <temperature>,<unit>`` line streamed by the gauge
+
+    '''
+    resp = line.strip(b'\r').decode('utf-8').split(' ')
+    return float(resp[0].split(',')[0]), float(resp[-1].split(',')[0])
+
+class StreamReader(object):
+    '''
+    Reads the lines streamed by the pressure gauge ``pg`` in a background
+    thread into a ring buffer of the last ``size`` readings, each timestamped
+    when its line was received
+
+    ``take(start)`` returns the readings after the ``start``-th. Readings
+    overwritten before they were taken are lost. An error reading the port
+    stops the thread and is raised by the next ``take()``.
+
+    '''
+
+    def __init__(self, pg, size=4096):
+        import numpy as np
+        self.pg = pg
+        self.size = size
+        self.times = np.zeros(size)
+        self.pressure = np.zeros(size)
+        self.temperature = np.zeros(size)
+        self.count = 0
+        self.bad_lines = 0
+        self.error = None
+        self.condition = threading.Condition()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        try:
+            while not self.stopping.is_set():
+                line = self.pg.read_until(terminator=b'\r')
+                t = time.time()
+                if not line:
+                    # timed out
+                    continue
+                try:
+                    pressure, temperature = parse_line(line)
+                except (ValueError, UnicodeDecodeError):
+                    # partial line, or a response to a command
+                    self.bad_lines += 1
+                    continue
+                with self.condition:
+                    i = self.count % self.size
+                    self.times[i] = t
+                    self.pressure[i] = pressure
+                    self.temperature[i] = temperature
+                    self.count += 1
+                    self.condition.notify_all()
+        except Exception as e:
+            with self.condition:
+                self.error = e
+                self.condition.notify_all()
+
+    def take(self, start, timeout=None):
+        '''
+        Waits up to ``timeout`` seconds for a reading after the ``start``-th
+        Returns the new count and arrays of the times, pressures and
+        temperatures of the readings since ``start``
+
+        '''
+        import numpy as np
+        with self.condition:
+            self.condition.wait_for(lambda: self.count > start or self.error is not None, timeout)
+            if self.error is not None:
+                raise self.error
+            stop = self.count
+            indices = np.arange(max(start, stop - self.size), stop) % self.size
+            return stop, self.times[indices], self.pressure[indices], self.temperature[indices]
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
 
 class PGLogger(DataLogger):
+    '''
+    Logs the pressure gauge's pressure and temperature, and the pressure
+    range since the last sample
+
+    By default each sample turns on streaming, averages ``smoothing`` lines
+    and queries the gauge's min/max. With ``streaming=True`` the gauge streams
+    continuously to a ``StreamReader`` and each sample is the mean, min and
+    max of the readings received since the previous one (``smoothing`` is
+    not used), with their number in ``n_readings``. With ``store_raw=True``
+    the first ``raw_size`` of those readings and their receive times
+    (relative to the sample's timestamp) are stored as well, in the
+    ``pressure_raw``, ``temperature_raw`` and ``raw_t`` datasets, padded
+    with nan, with the number stored in ``raw_count``. Readings beyond
+    ``raw_size`` are dropped (``raw_count < n_readings``) with a warning the
+    first time and a total on close, so ``raw_size`` should be above the
+    gauge's stream rate divided by the sample rate.
+
+    '''
+
     dtypes = {
         'timestamp': 'f8',
         'pressure': 'f8',
@@ -27,9 +133,21 @@ class PGLogger(DataLogger):
     RST_MINMAX = b'MINMAX_RST\r'
     RST_FAULT = b'*CLS\r'
 
+    smoothing = 1
+    streaming = False
+    store_raw = False
+    raw_size = 16
+    ring_size = 4096
+
     def init(self, timeout=1):
-        import serial
-        self.pg = serial.Serial(self.port, baudrate=9600)
+        if self.device == 'hardware':
+            import serial
+            self.pg = serial.Serial(self.port, baudrate=9600)
+        else:
+            from data_devices import FakeOmegaSerial
+            self.pg = FakeOmegaSerial(self.signal('pressure', offset=14.7, noise=0.005),
+                self.signal('temperature', offset=22., noise=0.05),
+                stream_rate=self.device_config.get('stream_rate', 50.), **self.device_options())
         self.pg.timeout = timeout
         if not self.pg.is_open:
             self.pg.open()
@@ -62,7 +180,30 @@ class PGLogger(DataLogger):
 
         self.pg.write(self.AUTO_SHUTDOWN_OFF)
 
+        self.stream = None
+        if self.streaming:
+            self.init_streaming()
+
+    def init_streaming(self):
+        self.dtypes = OrderedDict([(dataset, PGLogger.dtypes[dataset]) for dataset in
+            ('timestamp', 'pressure', 'temperature', 'pressure_max', 'pressure_min')])
+        self.dtypes['n_readings'] = 'i4'
+        if self.store_raw:
+            import numpy as np
+            self.dtypes['pressure_raw'] = np.dtype(('f8', (self.raw_size,)))
+            self.dtypes['temperature_raw'] = np.dtype(('f8', (self.raw_size,)))
+            self.dtypes['raw_t'] = np.dtype(('f4', (self.raw_size,)))
+            self.dtypes['raw_count'] = 'i4'
+        self.raw_dropped = 0
+        self.pg.write(self.STREAM_ON)
+        self.pg.flushInput()
+        self.stream = StreamReader(self.pg, self.ring_size).start()
+        self.stream_count = 0
+        print('streaming...')
+
     def read(self):
+        if self.stream is not None:
+            return self.read_stream()
         self.pg.write(self.STREAM_ON)
         self.pg.flushInput()
         timestamp, pressure, temperature = 0, 0, 0
@@ -81,15 +222,28 @@ class PGLogger(DataLogger):
         self.pg.write(self.RST_MINMAX)
         return timestamp, pressure, temperature, pressure_max, pressure_min
 
-    def parse(self, data):
-        timestamp, pressure, temperature, pressure_max, pressure_min = zip(*data)
-        return {
-            'timestamp': timestamp,
-            'pressure': pressure,
-            'temperature': temperature,
-            'pressure_max': pressure_max,
-            'pressure_min': pressure_min
-        }
+    def read_stream(self):
+        self.stream_count, times, pressure, temperature = self.stream.take(self.stream_count,
+            self.pg.timeout)
+        if not len(times):
+            raise RuntimeError('no readings streamed by the pressure gauge')
+        timestamp = times.mean()
+        data = [timestamp, pressure.mean(), temperature.mean(), pressure.max(), pressure.min(),
+            len(times)]
+        if self.store_raw:
+            import numpy as np
+            n = min(len(times), self.raw_size)
+            raw = np.full((3, self.raw_size), np.nan)
+            raw[0, :n] = pressure[:n]
+            raw[1, :n] = temperature[:n]
+            raw[2, :n] = times[:n] - timestamp
+            data += list(raw) + [n]
+            if n < len(times):
+                if not self.raw_dropped:
+                    print('WARNING {} readings in one sample but raw_size is {}, the rest are '
+                        'not stored (see raw_count), increase --raw_size'.format(len(times), self.raw_size))
+                self.raw_dropped += len(times) - n
+        return tuple(data)
 
     def read_resp(self):
         resp = self.pg.read_until(terminator=b'\r')
@@ -97,6 +251,11 @@ class PGLogger(DataLogger):
 
     def close(self):
         print('closing device...')
+        if self.stream is not None:
+            self.stream.stop()
+            if self.raw_dropped:
+                print('{} streamed readings were not stored, more than raw_size={} per sample'.format(
+                    self.raw_dropped, self.raw_size))
         self.pg.write(self.STREAM_OFF)
         self.pg.write(self.AUTO_SHUTDOWN_ON)
         self.pg.flushOutput()
@@ -112,17 +271,20 @@ if __name__ == '__main__':
         help='''sample rate in Hz (default=%(default)s''')
     parser.add_argument('--buffer_size', type=int, default=20,
         help='''number of samples to buffer before writing to a file''')
-    parser.add_argument('--port', type=str, required=True, help='''serial port pressure gauge is connected to''')
+    parser.add_argument('--port', type=str, default=None, help='''serial port pressure gauge is connected to (required with --device hardware)''')
     parser.add_argument('--smoothing', type=int, default=1, help='''number of samples to smooth over''')
+    parser.add_argument('--streaming', action='store_true',
+        help='''stream continuously and log the mean, min and max of the readings received in each sample interval''')
+    parser.add_argument('--store_raw', action='store_true',
+        help='''with --streaming, also store each streamed reading''')
+    parser.add_argument('--raw_size', type=int, default=16,
+        help='''max number of streamed readings stored per sample with --store_raw, the number stored is in raw_count (default=%(default)s)''')
+    add_logger_arguments(parser)
     args = parser.parse_args()
+    if args.device == 'hardware' and args.port is None:
+        parser.error('--port is required with --device hardware')
 
-    outdir = args.outdir
-    sample_rate = args.sample_rate
-    buffer_size = args.buffer_size
-    port = args.port
-    smoothing = args.smoothing
-
-    pg_logger = PGLogger('PG', outdir=outdir, buffer_size=buffer_size, sample_rate=sample_rate, port=port, smoothing=smoothing)
+    pg_logger = PGLogger('PG', **logger_kwargs(args, parser))
     pg_logger.init()
     pg_logger.run()
 
@@ -2,7 +2,7 @@
 import argparse
 import time
 
-from data_logging import DataLogger
+from data_logging import DataLogger, add_logger_arguments, logger_kwargs
 
 class RTDLogger(DataLogger):
     dtypes = {
@@ -13,6 +13,12 @@ class RTDLogger(DataLogger):
 
     def init(self):
         print('initializing RTD...')
+        if self.device != 'hardware':
+            from data_devices import SimulatedMAX31865
+            self.rtd = SimulatedMAX31865(self.signal('temperature', offset=20., noise=0.02),
+                **self.device_options())
+            return
+
         import board
         import busio
         import digitalio
@@ -33,14 +39,6 @@ class RTDLogger(DataLogger):
     def read(self):
         return time.time(), self.rtd.resistance, self.rtd.temperature
 
-    def parse(self, data):
-        timestamp, resistance, temperature = zip(*data)
-        return {
-            'timestamp': timestamp,
-            'resistance': resistance,
-            'temperature': temperature
-        }
-
     def close(self):
         print('closing...')
 
@@ -52,13 +50,10 @@ if __name__ == '__main__':
         help='''sample rate in Hz (default=%(default)s''')
     parser.add_argument('--buffer_size', type=int, default=25,
         help='''number of samples to buffer before writing to a file''')
+    add_logger_arguments(parser)
     args = parser.parse_args()
 
-    outdir = args.outdir
-    sample_rate = args.sample_rate
-    buffer_size = args.buffer_size
-
-    rtd_logger = RTDLogger('RTD', outdir=outdir, buffer_size=buffer_size, sample_rate=sample_rate)
+    rtd_logger = RTDLogger('RTD', **logger_kwargs(args, parser))
     rtd_logger.init()
     rtd_logger.run()
 
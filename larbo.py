@@ -0,0 +1,63 @@
+
+import os
+import sys
+import runpy
+from collections import OrderedDict
+
+# command: (script relative to this directory, description)
+COMMANDS = OrderedDict([
+    ('adc', ('larbo-adc/collect-data.py', 'log the ADC channels')),
+    ('rtd', ('larbo-rtd/collect-data.py', 'log the RTD temperature')),
+    ('pg', ('larbo-pressure/collect-data.py', 'log the pressure gauge')),
+    ('daemon', ('larbo-daemon/daemon.py', 'run several loggers in one process')),
+    ('monitor', ('larbo-monitor/monitor.py', 'plot or serve the latest data')),
+    ('query', ('data_query.py', 'print logged data between two times')),
+    ('compact', ('data_compact.py', 'merge, sort and export finished files')),
+])
+
+def usage():
+    lines = ['usage: larbo <command> [<args>]', '', 'commands:']
+    lines += ['  {:<10}{}'.format(command, description)
+        for command, (_, description) in COMMANDS.items()]
+    lines += ['', 'run "larbo <command> --help" for the arguments of a command']
+    return '\n'.join(lines)
+
+def script_path(command):
+    '''
+    Returns the path of the script run by ``command``
+
+    '''
+    here = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(here, *COMMANDS[command][0].split('/'))
+
+def main(argv=None):
+    '''
+    Entry point of the ``larbo`` command, runs the script of the command
+    given as the first argument with the remaining arguments
+
+    Only the script of the command is loaded, and the scripts import numpy,
+    h5py and matplotlib only once they need them, so ``larbo <command>
+    --help`` returns immediately.
+
+    '''
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        return
+    command, args = argv[0], argv[1:]
+    if command not in COMMANDS:
+        sys.stderr.write('larbo: unknown command {}\n\n{}\n'.format(command, usage()))
+        sys.exit(2)
+    script = script_path(command)
+    if not os.path.exists(script):
+        sys.stderr.write('larbo: {} not found, the larbo-* directories are needed next '
+            'to larbo.py (install with pip install -e)\n'.format(script))
+        sys.exit(1)
+    sys.argv = [script] + args
+    for path in (os.path.dirname(script_path('query')), os.path.dirname(script)):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    runpy.run_path(script, run_name='__main__')
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,8 @@ def read_req(filename):
 
 setup(
     name='data_logging',
-    py_modules=['data_logging'],
-    install_requires=read_req('requirements.txt')
+    py_modules=['data_logging', 'data_summary', 'data_query', 'data_devices', 'data_metrics', 'data_filters', 'data_alerts', 'data_compact', 'larbo'],
+    entry_points={'console_scripts': ['larbo = larbo:main']},
+    install_requires=read_req('requirements.txt'),
+    extras_require={'export': ['pyarrow']}
 )
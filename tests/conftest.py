@@ -0,0 +1,30 @@
+import os
+import sys
+
+# the data_* modules are top level modules of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_logging import DataLogger
+
+class SyntheticLogger(DataLogger):
+    '''
+    Logger of a single ``x`` dataset, for writing buffers of known rows
+    without a device or the sampling loop
+
+    '''
+    dtypes = {
+        'timestamp': 'f8',
+        'x': 'f8'
+    }
+    background_writer = False
+    status_interval = None
+
+    def __init__(self, name, **kwargs):
+        super(SyntheticLogger, self).__init__(name, **kwargs)
+        self.filter_chain = self.new_filter_chain()
+
+    def init(self):
+        pass
+
+    def close(self):
+        pass
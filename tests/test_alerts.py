@@ -0,0 +1,100 @@
+import json
+import math
+import socket
+
+import numpy as np
+import pytest
+
+from data_alerts import Threshold, Rate, Stale, AlertEngine, AlertHooks, make_rule, EVENT_DTYPE
+
+def run(rule, values, dt=1.):
+    return [rule.update(i * dt, value) for i, value in enumerate(values)]
+
+def test_threshold_hysteresis():
+    rule = Threshold('x', above=1., hysteresis=0.1)
+    assert rule.name == 'x>1'
+    assert run(rule, [0.5, 1.05, 0.95, 1.2, 0.95, 0.89, 0.95, 1.01]) == [
+        None, True, None, None, None, False, None, True]
+    assert rule.value == 1.01
+
+def test_threshold_below_and_above():
+    rule = Threshold('x', above=2., below=1., hysteresis=0.2)
+    assert run(rule, [1.5, 0.9, 1.1, 1.3, 2.1, 1.9, 1.7]) == [
+        None, True, None, False, True, None, False]
+
+def test_nan_keeps_state():
+    rule = Threshold('x', below=1.)
+    assert run(rule, [0., float('nan'), 2.]) == [True, None, False]
+
+def test_rate_ramp():
+    rule = Rate('p', window=10, above=0.5, hysteresis=0.1)
+    # flat, then a ramp of 2 per second, then flat again
+    values = np.concatenate([np.zeros(30), np.arange(30.), np.full(30, 29.)])
+    events = [(i, active) for i, active in enumerate(run(rule, values, dt=0.5)) if active is not None]
+    assert [active for i, active in events] == [True, False]
+    (start, _), (stop, _) = events
+    # active once the fit over the window is steep enough, cleared once it is flat enough
+    assert 30 < start < 40 and 60 < stop < 80
+
+def test_rate_is_not_checked_before_a_window():
+    rule = Rate('p', window=10, above=0.5)
+    assert run(rule, [i * 10. for i in range(10)]) == [None] * 10
+    assert rule.update(10., 100.) is True
+    assert math.isclose(rule.value, 10.)
+
+def test_stale():
+    rule = Stale('x', timeout=3)
+    assert run(rule, [1., 2., 2., 2., 2., 2., 3., float('nan'), float('nan'), float('nan'), float('nan')]) == [
+        None, None, None, None, None, True, False, None, None, None, True]
+    # a gap since the previous sample
+    rule = Stale('x', timeout=3)
+    assert rule.update(0., 1.) is None
+    assert rule.update(5., 2.) is True
+    assert rule.update(6., 3.) is False
+
+def test_alert_engine():
+    engine = AlertEngine([
+        {'threshold': {'dataset': 'x', 'above': 1.}},
+        {'stale': {'dataset': 'y', 'timeout': 1.5}},
+    ], ['timestamp', 'x', 'y'])
+    assert engine.update((0., 0., 1.)) == []
+    assert engine.update((1., 2., 1.)) == [(1., 'x>1', True, 2.)]
+    assert engine.active() == ['x>1']
+    assert engine.update((2., 0., 1.)) == [(2., 'x>1', False, 0.), (2., 'y stale', True, 2.)]
+    assert engine.active() == ['y stale']
+
+@pytest.mark.parametrize('specs', [
+    [{'threshold': {'dataset': 'z', 'above': 1.}}],
+    [{'threshold': {'dataset': 'x', 'above': 1.}}, {'threshold': {'dataset': 'x', 'above': 1.}}],
+    [{'threshold': {'dataset': 'x'}}],
+    [{'limit': {'dataset': 'x', 'above': 1.}}],
+    [{'threshold': {'dataset': 'x', 'above': 1., 'name': 'x' * 65}}],
+    [{'threshold': {'dataset': 'x', 'above': 1., 'name': 'x\u00b0C>1'}}],
+])
+def test_alert_engine_errors(specs):
+    with pytest.raises(ValueError):
+        AlertEngine(specs, ['timestamp', 'x'])
+
+def test_make_rule():
+    rule = make_rule({'rate': {'dataset': 'pressure', 'window': 10, 'above': 0.05}})
+    assert isinstance(rule, Rate) and rule.name == 'd(pressure)/dt>0.05'
+
+def test_rule_names_fit_the_events_dataset():
+    rule = Threshold('x', above=1., name='x' * 64)
+    assert np.array([(0., rule.name, 1, 2.)], dtype=EVENT_DTYPE)['rule'][0] == b'x' * 64
+    with pytest.raises(ValueError):
+        Rate('p' * 60, window=10, above=0.5)
+
+def test_alert_hooks_send_nan_as_null(tmp_path):
+    path = str(tmp_path / 'alerts.sock')
+    receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    receiver.bind(path)
+    receiver.settimeout(10)
+    hooks = AlertHooks('TEST', socket_path=path).start()
+    hooks.put((1., 'x stale', True, float('nan')))
+    hooks.put((2., 'x>1', False, 0.5))
+    hooks.stop()
+    messages = [json.loads(receiver.recv(4096)) for i in range(2)]
+    receiver.close()
+    assert messages[0] == dict(logger='TEST', rule='x stale', active=1, timestamp=1., value=None)
+    assert messages[1]['value'] == 0.5
@@ -0,0 +1,92 @@
+import os
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from data_logging import H5Writer, open_swmr, read_rows
+from data_compact import sorted_runs, Run, merge, rechunk, compact
+from data_query import query
+
+DTYPES = OrderedDict([('timestamp', 'f8'), ('x', 'f8')])
+
+def test_sorted_runs():
+    t = np.array([1., 2., 3., 2., 3., 4., np.nan, 5., 6., 0., 1.])
+    for block_size in (2, 3, 100):
+        runs = sorted_runs(t, len(t), -np.inf, np.inf, block_size=block_size)
+        assert runs == [[0, 3, 1., 3.], [3, 6, 2., 4.], [7, 9, 5., 6.], [9, 11, 0., 1.]]
+    # only the rows in the time range, runs without any are left out
+    assert sorted_runs(t, len(t), 2., 5., block_size=2) == [[1, 3, 2., 3.], [3, 6, 2., 4.]]
+    assert sorted_runs(t, 5, 0., 10.) == [[0, 3, 1., 3.], [3, 5, 2., 3.]]
+
+def test_rechunk():
+    blocks = [{'timestamp': np.arange(a, b)} for a, b in [(0, 3), (3, 3), (3, 10), (10, 11), (11, 25)]]
+    out = [block['timestamp'] for block in rechunk(blocks, 4)]
+    assert [len(block) for block in out] == [4] * 6 + [1]
+    assert np.array_equal(np.concatenate(out), np.arange(25))
+
+def write_file(filename, t):
+    writer = H5Writer(filename, DTYPES, summary_levels=None).open()
+    # x tells the files apart
+    writer.append({'timestamp': t, 'x': np.full(len(t), float(os.path.basename(filename)[0]))})
+    writer.close()
+
+def test_merge(tmp_path):
+    random = np.random.RandomState(0)
+    files = []
+    for i in range(4):
+        filename = str(tmp_path / '{}.h5'.format(i))
+        # overlapping runs with repeated timestamps, as after journal replays
+        t = np.concatenate([np.sort(random.randint(0, 300, size=200)),
+            np.sort(random.randint(100, 400, size=150))]).astype('f8')
+        write_file(filename, t)
+        files.append((filename, t))
+    runs = []
+    for filename, t in files:
+        runs += [Run(filename, *run, dtypes=DTYPES) for run in sorted_runs(t, len(t), 50., 350.)]
+    stats = {}
+    blocks = list(merge(runs, block_size=16, stats=stats))
+    merged = dict((dataset, np.concatenate([block[dataset] for block in blocks])) for dataset in DTYPES)
+
+    # brute force: every row of the runs in order of their first timestamps,
+    # keeping the first of each timestamp
+    rows = []
+    for run in sorted(runs, key=lambda run: run.first):
+        t = dict(files)[run.filename]
+        rows += [(t[i], float(os.path.basename(run.filename)[0])) for i in range(run.start, run.stop)]
+    t = np.array([row[0] for row in rows])
+    x = np.array([row[1] for row in rows])
+    order = np.argsort(t, kind='stable')
+    t, x = t[order], x[order]
+    keep = np.concatenate([[True], t[1:] != t[:-1]])
+    assert np.array_equal(merged['timestamp'], t[keep])
+    assert np.array_equal(merged['x'], x[keep])
+    assert stats['rows_read'] == len(t)
+    assert stats['duplicates'] == len(t) - keep.sum()
+    assert all(run.file is None for run in runs)
+
+def test_compact(tmp_path):
+    data_dir = str(tmp_path / 'data')
+    t0 = datetime(2026, 1, 1, 12).timestamp()
+    directory = os.path.join(data_dir, '2026_01_01')
+    os.makedirs(directory)
+    # a restart that replayed the last rows of the first file
+    write_file(os.path.join(directory, '1_TEST.h5'), t0 + np.arange(0., 100.))
+    write_file(os.path.join(directory, '2_TEST.h5'), t0 + np.arange(90., 200.))
+    os.rename(os.path.join(directory, '1_TEST.h5'), os.path.join(directory, 'TEST_1.h5'))
+    os.rename(os.path.join(directory, '2_TEST.h5'), os.path.join(directory, 'TEST_2.h5'))
+    outdir = str(tmp_path / 'compacted')
+    result = compact('TEST', t0 + 10, t0 + 150, outdir, data_dir=data_dir, chunk_size=16,
+        block_size=7, summary_levels=None)
+    assert result['rows'] == 140 and result['duplicates'] == 10 and result['files'] == 2
+    with open_swmr(result['path']) as infile:
+        data = read_rows(infile, ['timestamp', 'x'])
+        assert list(infile['timestamp_index']) == list(t0 + np.arange(10., 150., 16))
+    assert np.array_equal(data['timestamp'], t0 + np.arange(10., 150.))
+    assert np.array_equal(data['x'], np.where(np.arange(10., 150.) < 100, 1., 2.))
+    # read back through the index
+    assert np.array_equal(query('TEST', t0 + 20, t0 + 40, data_dir=outdir)['timestamp'],
+        t0 + np.arange(20., 41.))
+    with pytest.raises(ValueError):
+        compact('TEST', t0 + 10, t0 + 150, outdir, data_dir=data_dir, summary_levels=None)
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from data_filters import MovingAverage, Median, EMA, Polynomial, Calibration, FilterChain, make_filter
+
+def batches(values, sizes):
+    start = 0
+    for size in sizes:
+        yield values[start:start + size]
+        start += size
+
+@pytest.mark.parametrize('spec', [{'moving_average': 5}, {'median': 4}, {'ema': 0.3},
+    {'ema': 0.001}, {'polynomial': [1, 2, 3]}, {'calibration': [963, 0.153]}])
+def test_streaming_equals_batch(spec):
+    values = np.random.RandomState(0).normal(size=1000)
+    values[[10, 11, 500]] = np.nan
+    expected = make_filter(spec)(values)
+    filter = make_filter(spec)
+    streamed = np.concatenate([filter(batch) for batch in batches(values, [1, 0, 3, 96, 400, 500])])
+    assert np.allclose(streamed, expected, equal_nan=True)
+
+def test_moving_average():
+    values = np.array([1., 2., 3., 4., 5.])
+    assert np.allclose(MovingAverage(3)(values), [1., 4. / 3, 2., 3., 4.])
+
+def test_averaging_filters_skip_nan():
+    values = np.array([1., np.nan, 3., np.nan, np.nan, np.nan, 7.])
+    assert np.allclose(MovingAverage(2)(values), [1., 1., 3., 3., np.nan, np.nan, 7.], equal_nan=True)
+    assert np.allclose(Median(3)(values), [1., 1., 2., 3., 3., np.nan, 7.], equal_nan=True)
+    assert np.allclose(EMA(0.5)(values), [1., 1., 2., 2., 2., 2., 4.5])
+    assert np.all(np.isnan(EMA(0.5)(np.array([np.nan, np.nan]))))
+
+def test_ema_of_long_batches():
+    # the closed form is evaluated in blocks, so the powers of 1 - alpha don't overflow
+    values = np.random.RandomState(1).normal(size=20000)
+    ema = EMA(0.01)(values)
+    expected = np.empty(len(values))
+    last = values[0]
+    for i, x in enumerate(values):
+        last = 0.01 * x + 0.99 * last
+        expected[i] = last
+    assert np.allclose(ema, expected)
+
+def test_polynomial_and_calibration():
+    assert np.allclose(Polynomial(1, 2, 3)(np.array([0., 1., 2.])), [1., 6., 17.])
+    assert np.allclose(Calibration(1., 2.)(np.array([1., 3.])), [0., 4.])
+
+def test_make_filter_errors():
+    with pytest.raises(ValueError):
+        make_filter({'mean': 3})
+    with pytest.raises(ValueError):
+        make_filter({'median': 3, 'ema': 0.1})
+    with pytest.raises(ValueError):
+        make_filter({'median': 0})
+    with pytest.raises(ValueError):
+        make_filter({'ema': 0})
+
+def test_filter_chain_outputs():
+    chain = FilterChain([
+        {'input': 'x', 'output': 'x_cal', 'chain': [{'calibration': [1, 2]}]},
+        {'input': 'x_cal', 'output': 'x_avg', 'chain': [{'moving_average': 2}]},
+    ], columns=['timestamp', 'x'])
+    assert list(chain.dtypes()) == ['x_cal', 'x_avg']
+    out = chain({'timestamp': np.arange(3.), 'x': np.array([1., 2., 3.])})
+    assert np.allclose(out['x_cal'], [0., 2., 4.])
+    assert np.allclose(out['x_avg'], [0., 1., 3.])
+
+@pytest.mark.parametrize('specs', [
+    [{'input': 'x', 'output': 'x'}],
+    [{'input': 'x', 'output': 'y'}, {'input': 'x', 'output': 'y'}],
+    [{'input': 'z', 'output': 'y'}],
+])
+def test_filter_chain_errors(specs):
+    with pytest.raises(ValueError):
+        FilterChain(specs, columns=['timestamp', 'x'])
+
+def test_decimation_across_batches():
+    chain = FilterChain([{'input': 'x', 'output': 'x_avg', 'chain': [{'moving_average': 3}]}], decimate=4)
+    x = np.arange(50.)
+    expected = FilterChain([{'input': 'x', 'output': 'x_avg', 'chain': [{'moving_average': 3}]}])({'x': x})
+    out = [chain({'x': batch}) for batch in batches(x, [3, 5, 1, 0, 20, 21])]
+    assert np.array_equal(np.concatenate([o['x'] for o in out]), x[::4])
+    assert np.allclose(np.concatenate([o['x_avg'] for o in out]), expected['x_avg'][::4])
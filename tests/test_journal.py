@@ -0,0 +1,113 @@
+import multiprocessing
+import os
+from collections import OrderedDict
+from datetime import datetime
+
+import h5py
+import numpy as np
+import pytest
+
+from conftest import SyntheticLogger
+from data_logging import H5Writer, Journal, open_swmr, read_rows, lookup3
+
+T0 = datetime(2026, 1, 1, 12).timestamp()
+
+def log(logger, t):
+    if logger.buffer is None:
+        logger.buffer = logger.new_buffer()
+    for ti in t:
+        logger.buffer.append((ti, ti - T0, 0., 0))
+        if logger.buffer.full():
+            logger.flush()
+
+def read_x(filename):
+    with open_swmr(filename) as infile:
+        return read_rows(infile, ['x'])['x']
+
+def test_journal_keeps_uncommitted_segments(tmp_path):
+    path = str(tmp_path / 'journal')
+    journal = Journal(path, 'out.h5', OrderedDict([('timestamp', 'f8')]), 4, 3, sync_interval=None)
+    for segment, values in [(0, [1., 2., 3., 4.]), (1, [5., 6.]), (2, [7.])]:
+        journal.begin(segment)
+        journal.data['timestamp'][segment * 4:segment * 4 + len(values)] = values
+        journal.update(segment, len(values))
+    journal.commit(1)
+    journal.sync()
+    filename, pending = Journal.read(path)
+    assert filename == 'out.h5'
+    assert list(pending['timestamp']) == [1., 2., 3., 4., 7.]
+    journal.close()
+    assert os.path.exists(path)
+
+def test_replay_journal(tmp_path):
+    logger = SyntheticLogger('TEST', outdir=str(tmp_path), buffer_size=5, summary_levels=None)
+    log(logger, T0 + np.arange(12.))
+    # two buffers are written, then the logger stops with two rows buffered
+    logger.close_writer()
+    logger.journal.sync()
+
+    replayed = SyntheticLogger('TEST', outdir=str(tmp_path), buffer_size=5, summary_levels=None)
+    assert replayed.replay_journal() == 2
+    assert not os.path.exists(replayed.journal_path())
+    with open_swmr(logger.filename) as infile:
+        assert infile.attrs['finalized']
+    assert list(read_x(logger.filename)) == list(range(12))
+
+def test_lookup3():
+    # test vectors of hashlittle in lookup3.c
+    assert lookup3(b'') == 0xdeadbeef
+    assert lookup3(b'Four score and seven years ago') == 0x17770551
+    assert lookup3(b'Four score and seven years ago', 1) == 0xcd628161
+
+def crash(outdir, n):
+    '''
+    Log ``n`` samples, then die in the middle of writing the last buffer,
+    after writing the ``timestamp`` dataset but not ``x`` or ``n_rows``
+
+    '''
+    write_rows = H5Writer.write_rows
+    def write_or_crash(writer, dataset, values, stop):
+        if dataset == 'x' and stop >= n:
+            os._exit(1)
+        write_rows(writer, dataset, values, stop)
+    H5Writer.write_rows = write_or_crash
+    logger = SyntheticLogger('TEST', outdir=outdir, buffer_size=10, summary_levels=None)
+    log(logger, T0 + np.arange(n, dtype='f8'))
+
+def test_replay_journal_after_a_crash(tmp_path):
+    process = multiprocessing.Process(target=crash, args=(str(tmp_path), 50))
+    process.start()
+    process.join(60)
+    assert process.exitcode == 1
+    filename, = [str(path) for path in tmp_path.glob('TEST_*.h5')]
+    # the file is still marked as open by the dead writer
+    with pytest.raises(OSError):
+        h5py.File(filename, 'a', libver='latest').close()
+    assert list(read_x(filename)) == list(range(40))
+
+    replayed = SyntheticLogger('TEST', outdir=str(tmp_path), buffer_size=10, summary_levels=None)
+    assert replayed.replay_journal() == 10
+    assert list(read_x(filename)) == list(range(50))
+    with open_swmr(filename) as infile:
+        assert infile.attrs['finalized'] and infile.attrs['n_rows'] == 50
+        assert list(read_rows(infile, ['timestamp'])['timestamp']) == list(T0 + np.arange(50.))
+
+def test_replay_journal_of_held_back_rows(tmp_path):
+    # 100 Hz samples, every 3rd stored in lzf chunks of 3 rows
+    kwargs = dict(outdir=str(tmp_path), buffer_size=10, decimate=3, storage='lzf', summary_levels=None)
+    logger = SyntheticLogger('TEST', **kwargs)
+    t = T0 + np.arange(105) / 100.
+    log(logger, t)
+    assert logger.writer.pending()
+    # the process dies without writing the held back rows
+    logger.writer.file.close()
+    logger.journal.sync()
+
+    replayed = SyntheticLogger('TEST', **kwargs)
+    assert replayed.replay_journal()
+    with open_swmr(logger.filename) as infile:
+        stored = read_rows(infile, ['timestamp'])['timestamp']
+    # no rows are lost or repeated, only the decimation restarts
+    assert np.all(np.diff(stored) > 0)
+    assert np.max(np.diff(stored)) < 0.035
+    assert stored[-1] >= t[-3]
@@ -0,0 +1,56 @@
+import os
+import socket
+
+import pytest
+
+from data_metrics import MetricsServer, Histogram
+
+class Metrics(object):
+    def render(self):
+        return 'larbo_up 1\n'
+
+def test_histogram():
+    histogram = Histogram(buckets=[0.1, 1.])
+    for value in [0.05, 0.5, 2.]:
+        histogram.observe(value)
+    assert histogram.render('latency', 'logger="TEST"') == [
+        'latency_bucket{logger="TEST",le="0.1"} 1',
+        'latency_bucket{logger="TEST",le="1"} 2',
+        'latency_bucket{logger="TEST",le="+Inf"} 3',
+        'latency_sum{logger="TEST"} 2.55',
+        'latency_count{logger="TEST"} 3',
+    ]
+
+def test_metrics_server_keeps_other_files(tmp_path):
+    path = str(tmp_path / 'metrics')
+    with open(path, 'w') as outfile:
+        outfile.write('data')
+    with pytest.raises(ValueError):
+        MetricsServer(Metrics(), path)
+    with open(path) as infile:
+        assert infile.read() == 'data'
+
+def test_metrics_server_replaces_stale_socket(tmp_path):
+    path = str(tmp_path / 'metrics.sock')
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+    server = MetricsServer(Metrics(), path)
+    server.start()
+    try:
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.settimeout(10)
+        client.connect(path)
+        client.sendall(b'GET /metrics HTTP/1.0\r\n\r\n')
+        response = b''
+        while True:
+            data = client.recv(4096)
+            if not data:
+                break
+            response += data
+        client.close()
+        assert response.startswith(b'HTTP/1.0 200')
+        assert response.endswith(b'larbo_up 1\n')
+    finally:
+        server.stop()
+    assert not os.path.exists(path)
@@ -0,0 +1,109 @@
+import os
+from datetime import datetime
+
+import h5py
+import numpy as np
+import pytest
+
+from data_logging import H5Writer
+from data_query import search_timestamps, query, find_files
+
+def write_file(data_dir, name, t, x, **kwargs):
+    directory = os.path.join(data_dir, datetime.fromtimestamp(t[0]).strftime('%Y_%m_%d'))
+    os.makedirs(directory, exist_ok=True)
+    filename = os.path.join(directory, '{}_{}.h5'.format(name, t[0]))
+    writer = H5Writer(filename, {'timestamp': 'f8', 'x': 'f8'}, **kwargs).open()
+    writer.append({'timestamp': t, 'x': x})
+    writer.close()
+    return filename
+
+@pytest.fixture
+def timestamps(tmp_path):
+    t = np.repeat(np.arange(0., 500.), 2)
+    filename = str(tmp_path / 'timestamps.h5')
+    with h5py.File(filename, 'w') as outfile:
+        outfile.create_dataset('timestamp', data=t)
+        outfile.create_dataset('timestamp_index', data=t[::64]).attrs['step'] = 64
+    with h5py.File(filename, 'r') as infile:
+        yield t, infile['timestamp'], infile['timestamp_index']
+
+@pytest.mark.parametrize('use_index', [False, True])
+@pytest.mark.parametrize('side', ['left', 'right'])
+def test_search_timestamps(timestamps, side, use_index):
+    t, dset, index = timestamps
+    index = index if use_index else None
+    for value in [-1., 0., 0.5, 17., 63.5, 250., 499., 499.5, 1000.]:
+        for n in [len(t), 777]:
+            expected = np.searchsorted(t[:n], value, side=side)
+            assert search_timestamps(dset, value, n, side=side, chunk_size=8, index=index) == expected
+
+def test_query(tmp_path):
+    data_dir = str(tmp_path)
+    t0 = datetime(2026, 1, 1, 23, 50).timestamp()
+    # the second file is in the next day's directory
+    t = t0 + np.arange(2000.)
+    write_file(data_dir, 'TEST', t[:1000], t[:1000] - t0)
+    write_file(data_dir, 'TEST', t[1000:], t[1000:] - t0)
+    write_file(data_dir, 'OTHER', t[:10], t[:10])
+    assert len(find_files('TEST', t0, t0 + 2000, data_dir=data_dir)) == 2
+    data = query('TEST', t0 + 990.5, t0 + 1010, fields=['x'], data_dir=data_dir)
+    assert sorted(data) == ['timestamp', 'x']
+    assert list(data['x']) == list(range(991, 1011))
+    assert np.array_equal(query('TEST', t0, t0 + 2000, data_dir=data_dir)['timestamp'], t)
+
+def test_query_empty_range(tmp_path):
+    data_dir = str(tmp_path)
+    t0 = datetime(2026, 1, 1, 12).timestamp()
+    write_file(data_dir, 'TEST', t0 + np.arange(10.), np.arange(10.))
+    for t1, t2 in [(t0 + 20, t0 + 30), (t0 + 2.5, t0 + 2.6)]:
+        data = query('TEST', t1, t2, fields=['x'], data_dir=data_dir)
+        assert sorted(data) == ['timestamp', 'x']
+        assert len(data['timestamp']) == 0 and len(data['x']) == 0
+
+def test_query_resolution(tmp_path):
+    data_dir = str(tmp_path)
+    t0 = datetime(2026, 1, 1, 12).timestamp() // 60 * 60
+    t = t0 + np.arange(0., 600., 0.5)
+    x = np.sin(t)
+    # split in the middle of a minute, the second file only summarized at 1 s
+    write_file(data_dir, 'TEST', t[:500], x[:500], summary_levels=(1, 60))
+    write_file(data_dir, 'TEST', t[500:], x[500:], summary_levels=(1,))
+    data = query('TEST', t0, t0 + 600, resolution=60, data_dir=data_dir)
+    assert list(data['timestamp']) == list(t0 + np.arange(0, 600, 60))
+    assert list(data['count']) == [120] * 10
+    assert list(data['x_count']) == [120] * 10
+    bins = x.reshape(10, 120)
+    assert np.allclose(data['x_mean'], bins.mean(axis=1))
+    assert np.allclose(data['x_std'], bins.std(axis=1))
+    assert np.allclose(data['x_min'], bins.min(axis=1))
+    assert np.allclose(data['x_max'], bins.max(axis=1))
+
+def test_query_resolution_without_summaries(tmp_path):
+    data_dir = str(tmp_path)
+    t0 = datetime(2026, 1, 1, 12).timestamp()
+    write_file(data_dir, 'TEST', t0 + np.arange(10.), np.arange(10.), summary_levels=None)
+    data = query('TEST', t0, t0 + 10, fields=['x'], resolution=60, data_dir=data_dir)
+    assert len(data['timestamp']) == 0 and len(data['x_mean']) == 0
+
+def test_query_files_with_different_datasets(tmp_path):
+    data_dir = str(tmp_path)
+    t0 = datetime(2026, 1, 1, 12).timestamp()
+    t = t0 + np.arange(20.)
+    # a file of an older version without lateness, and a newer one with it
+    write_file(data_dir, 'TEST', t[:10], np.arange(10.))
+    directory = os.path.dirname(write_file(data_dir, 'TEST', t[10:15], np.arange(10., 15.)))
+    filename = os.path.join(directory, 'TEST_{}.h5'.format(t[15]))
+    writer = H5Writer(filename, {'timestamp': 'f8', 'x': 'f8', 'lateness': 'f8', 'skipped': 'i8'}).open()
+    writer.append({'timestamp': t[15:], 'x': np.arange(15., 20.), 'lateness': np.full(5, 0.5),
+        'skipped': np.ones(5, dtype='i8')})
+    writer.close()
+    for fields in (None, ['x', 'lateness', 'skipped']):
+        data = query('TEST', t0, t0 + 20, fields=fields, data_dir=data_dir)
+        assert sorted(data) == ['lateness', 'skipped', 'timestamp', 'x']
+        assert all(len(values) == 20 for values in data.values())
+        assert list(data['x']) == list(range(20))
+        assert np.array_equal(data['lateness'], np.where(np.arange(20) < 15, np.nan, 0.5), equal_nan=True)
+        assert data['skipped'].dtype == np.dtype('i8')
+        assert list(data['skipped']) == [0] * 15 + [1] * 5
+    with pytest.raises(ValueError):
+        query('TEST', t0, t0 + 20, fields=['y'], data_dir=data_dir)
@@ -0,0 +1,65 @@
+import glob
+from datetime import datetime
+
+import numpy as np
+
+from conftest import SyntheticLogger
+from data_logging import open_swmr, read_rows
+
+T0 = datetime(2026, 1, 1, 12).timestamp()
+
+def rows(t):
+    t = np.asarray(t, dtype='f8')
+    return dict(timestamp=t, x=t.copy(), lateness=np.zeros(len(t)),
+        skipped=np.zeros(len(t), dtype='i8'))
+
+def read_files(tmp_path):
+    files = []
+    for filename in glob.glob(str(tmp_path / 'TEST_*.h5')):
+        with open_swmr(filename) as infile:
+            files.append(read_rows(infile, ['timestamp'])['timestamp'])
+    return sorted(files, key=lambda t: t[0])
+
+def write(tmp_path, t, buffer_size, **kwargs):
+    logger = SyntheticLogger('TEST', outdir=str(tmp_path), summary_levels=None,
+        use_journal=False, **kwargs)
+    for start in range(0, len(t), buffer_size):
+        logger.write_buffer(rows(t[start:start + buffer_size]))
+    logger.close_writer()
+    return read_files(tmp_path)
+
+def test_rollover_splits_at_interval(tmp_path):
+    t = T0 + 1.5 * np.arange(200)
+    files = write(tmp_path, t, 25, rollover_interval=60)
+    assert len(files) == 5
+    for timestamps in files:
+        # every file is within one minute
+        assert len(set((timestamps - T0) // 60)) == 1
+    assert np.array_equal(np.concatenate(files), t)
+
+def test_rollover_rows(tmp_path):
+    t = T0 + np.arange(100)
+    files = write(tmp_path, t, 10, rollover_rows=30)
+    assert [len(timestamps) for timestamps in files] == [30, 30, 30, 10]
+    assert np.array_equal(np.concatenate(files), t)
+
+def test_rollover_rows_splits_buffers(tmp_path):
+    t = T0 + np.arange(100)
+    files = write(tmp_path, t, 25, rollover_rows=30)
+    assert [len(timestamps) for timestamps in files] == [30, 30, 30, 10]
+    assert np.array_equal(np.concatenate(files), t)
+
+def test_rollover_bytes(tmp_path):
+    t = T0 + np.arange(100)
+    # rows of timestamp, x, lateness and skipped are 32 bytes
+    files = write(tmp_path, t, 25, rollover_bytes=32 * 40)
+    assert [len(timestamps) for timestamps in files] == [40, 40, 20]
+    assert np.array_equal(np.concatenate(files), t)
+
+def test_rollover_rows_and_interval(tmp_path):
+    t = T0 + 1.5 * np.arange(200)
+    files = write(tmp_path, t, 25, rollover_interval=60, rollover_rows=30)
+    for timestamps in files:
+        assert len(timestamps) <= 30
+        assert len(set((timestamps - T0) // 60)) == 1
+    assert np.array_equal(np.concatenate(files), t)
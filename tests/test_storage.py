@@ -0,0 +1,46 @@
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from data_logging import H5Writer, open_swmr, read_rows, get_n_rows, storage_options
+
+DTYPES = OrderedDict([('timestamp', 'f8'), ('x', 'f8'), ('v', ('i4', (3,)))])
+
+def block(start, stop):
+    t = np.arange(start, stop, dtype='f8')
+    return OrderedDict([('timestamp', t), ('x', t * 2),
+        ('v', np.repeat(np.arange(start, stop, dtype='i4')[:,np.newaxis], 3, axis=1))])
+
+@pytest.mark.parametrize('layout', ['columns', 'compound'])
+def test_filtered_datasets_are_written_in_whole_chunks(tmp_path, layout):
+    filename = str(tmp_path / 'out.h5')
+    writer = H5Writer(filename, DTYPES, storage='lzf', append_rows=10, layout=layout,
+        summary_levels=None).open()
+    # misaligned by the first append, as after a rollover split
+    for start, stop in [(0, 3), (3, 13), (13, 23), (23, 30)]:
+        writer.append(block(start, stop))
+        with open_swmr(filename) as infile:
+            n = get_n_rows(infile)
+            assert n == stop // 10 * 10
+            assert np.array_equal(read_rows(infile, ['x'])['x'], block(0, n)['x'])
+        assert writer.n_rows == stop
+        assert writer.pending() == stop - n
+    writer.close()
+    with open_swmr(filename) as infile:
+        data = read_rows(infile, list(DTYPES))
+    expected = block(0, 30)
+    for dataset in DTYPES:
+        assert np.array_equal(data[dataset], expected[dataset])
+
+def test_storage_options():
+    assert storage_options(None, chunk_size=64, append_rows=10) == {'chunks': (64,)}
+    options = storage_options('lzf', chunk_size=64, append_rows=10)
+    assert options['compression'] == 'lzf' and options['chunks'] == (10,)
+    options = storage_options({'profile': 'gzip', 'scaleoffset': 3, 'chunk_size': 32})
+    assert options['scaleoffset'] == 3 and options['compression'] == 'gzip'
+    assert options['chunks'] == (32,)
+    with pytest.raises(ValueError):
+        storage_options('zip')
+    with pytest.raises(ValueError):
+        storage_options({'level': 3})
@@ -0,0 +1,118 @@
+import numpy as np
+
+from data_logging import H5Writer, open_swmr
+from data_summary import SummaryLevel, read_summary, merge_summaries, summary_datasets, summary_rows
+
+def reference(t, x, width):
+    '''
+    Returns the bins of ``t`` and count, mean, min, max and std of the
+    finite ``x`` in each
+
+    '''
+    bins = np.unique(np.floor(t / width))
+    stats = []
+    for b in bins:
+        values = x[(np.floor(t / width) == b) & np.isfinite(x)]
+        if len(values):
+            stats.append((len(values), values.mean(), values.min(), values.max(), values.std()))
+        else:
+            stats.append((0, np.nan, np.nan, np.nan, np.nan))
+    return bins * width, np.array(stats).T
+
+def samples(n, seed=0):
+    random = np.random.RandomState(seed)
+    t = 1.7e9 + np.cumsum(random.exponential(0.5, size=n))
+    x = random.normal(size=n)
+    x[random.uniform(size=n) < 0.2] = np.nan
+    # a whole bin of nan
+    x[(t > t[0] + 100) & (t < t[0] + 125)] = np.nan
+    return t, x
+
+def check(summary, t, x, width, field='x'):
+    bins, (count, mean, vmin, vmax, std) = reference(t, x, width)
+    assert np.array_equal(summary['timestamp'], bins)
+    assert np.array_equal(summary[field + '_count'], count)
+    for stat, expected in [('mean', mean), ('min', vmin), ('max', vmax), ('std', std)]:
+        assert np.allclose(summary[field + '_' + stat], expected, equal_nan=True), stat
+
+def test_summary_level_skips_nan():
+    t, x = samples(1000)
+    level = SummaryLevel(10, ['x'])
+    rows = []
+    start = 0
+    random = np.random.RandomState(1)
+    while start < len(t):
+        # as SummaryPyramid.append, the last bin is rewritten by the next batch
+        stop = start + random.randint(1, 50)
+        stats = level.update({'timestamp': t[start:stop], 'x': x[start:stop]})
+        rows = rows[:level.n_complete] + list(level.rows(stats))
+        level.n_complete = len(rows) - 1
+        start = stop
+    rows = np.array(rows, dtype=level.dtype)
+    check(rows, t, x, 10)
+    assert np.array_equal(rows['count'], np.unique(np.floor(t / 10), return_counts=True)[1])
+
+def test_summary_pyramid_in_file(tmp_path):
+    t, x = samples(2000)
+    filename = str(tmp_path / 'out.h5')
+    writer = H5Writer(filename, {'timestamp': 'f8', 'x': 'f8'}, summary_levels=(10, 60)).open()
+    for start in range(0, len(t), 37):
+        writer.append({'timestamp': t[start:start + 37], 'x': x[start:start + 37]})
+        with open_swmr(filename) as infile:
+            # bins are written once a 10 s bin is complete, ahead of the
+            # preallocated rows
+            summary = read_summary(infile, ['x'], width=10)[1]
+            if summary is not None:
+                last = t[:start + 37][-1]
+                assert last - 20 < summary['timestamp'][-1] <= last
+                assert not np.isnan(summary['timestamp']).any()
+    writer.close()
+    with open_swmr(filename) as infile:
+        assert summary_datasets(infile) == ['x']
+        for width in (10, 60):
+            read_width, summary = read_summary(infile, ['x'], width=width)
+            assert read_width == width
+            check(summary, t, x, width)
+            assert summary_rows(infile['summary/{}s'.format(width)]) == len(infile['summary/{}s'.format(width)])
+        # the coarsest level of at most 30 s
+        assert read_summary(infile, ['x'], width=30)[0] == 10
+
+def test_summary_continues_after_reopening(tmp_path):
+    t, x = samples(1000, seed=3)
+    filename = str(tmp_path / 'out.h5')
+    for start, stop in [(0, 301), (301, 1000)]:
+        writer = H5Writer(filename, {'timestamp': 'f8', 'x': 'f8'}, summary_levels=(10,)).open()
+        writer.append({'timestamp': t[start:stop], 'x': x[start:stop]})
+        writer.close()
+    with open_swmr(filename) as infile:
+        check(read_summary(infile, ['x'])[1], t, x, 10)
+
+def test_merge_summaries_of_split_files(tmp_path):
+    t, x = samples(2000, seed=2)
+    summaries = []
+    # files split in the middle of bins, as by a rollover or restart
+    for i, (start, stop) in enumerate([(0, 333), (333, 1001), (1001, 2000)]):
+        filename = str(tmp_path / '{}.h5'.format(i))
+        writer = H5Writer(filename, {'timestamp': 'f8', 'x': 'f8'}, summary_levels=(60,)).open()
+        writer.append({'timestamp': t[start:stop], 'x': x[start:stop]})
+        writer.close()
+        with open_swmr(filename) as infile:
+            summaries.append(read_summary(infile, ['x'])[1])
+    merged = merge_summaries(summaries, ['x'])
+    check(merged, t, x, 60)
+    assert merged['count'].sum() == len(t)
+
+def test_merge_summaries_without_field_counts():
+    # summaries of older files have no <field>_count, every row is counted
+    summary = dict(timestamp=np.array([0., 60.]), count=np.array([2, 2]),
+        x_mean=np.array([1., 2.]), x_min=np.array([0., 2.]), x_max=np.array([2., 2.]),
+        x_std=np.array([1., 0.]))
+    other = dict(timestamp=np.array([60.]), count=np.array([2]), x_count=np.array([2]),
+        x_mean=np.array([4.]), x_min=np.array([3.]), x_max=np.array([5.]), x_std=np.array([1.]))
+    merged = merge_summaries([summary, other], ['x'])
+    assert list(merged['timestamp']) == [0., 60.]
+    assert list(merged['count']) == [2, 4]
+    assert list(merged['x_count']) == [2, 4]
+    assert np.allclose(merged['x_mean'], [1., 3.])
+    assert np.allclose(merged['x_std'], [1., np.std([2., 2., 3., 5.])])
+    assert list(merged['x_min']) == [0., 2.] and list(merged['x_max']) == [2., 5.]
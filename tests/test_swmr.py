@@ -0,0 +1,69 @@
+import multiprocessing
+import time
+
+import numpy as np
+import pytest
+
+from data_logging import H5Writer, open_swmr, read_rows
+
+# larbo-bench/swmr-check.py with a small row count
+
+DTYPES = {
+    'timestamp': 'f8',
+    'index': 'i8'
+}
+
+def writer(filename, n_flushes, buffer_size, storage, ready):
+    writer = H5Writer(filename, DTYPES, chunk_size=64, storage=storage,
+        append_rows=buffer_size, summary_levels=None).open()
+    ready.set()
+    # a misaligned first flush, as after a rollover split
+    sizes = [buffer_size // 3] + [buffer_size] * (n_flushes - 1)
+    start = 0
+    for size in sizes:
+        index = np.arange(start, start + size)
+        writer.append({'timestamp': time.time() + np.zeros(size), 'index': index})
+        start += size
+        time.sleep(0.005)
+    writer.close()
+
+def reader(filename, duration, errors):
+    last_n = 0
+    start = time.time()
+    with open_swmr(filename) as infile:
+        while time.time() - start < duration:
+            data = read_rows(infile, list(DTYPES.keys()))
+            n = len(data['index'])
+            if n < last_n:
+                errors.put('row count went backwards {} -> {}'.format(last_n, n))
+            if not np.array_equal(data['index'], np.arange(n)):
+                errors.put('inconsistent data at {} rows'.format(n))
+            if np.any(data['timestamp'] == 0):
+                errors.put('unwritten timestamps read at {} rows'.format(n))
+            last_n = n
+
+@pytest.mark.parametrize('storage', [None, 'lzf'])
+def test_concurrent_swmr_reads(tmp_path, storage):
+    filename = str(tmp_path / 'SWMR.h5')
+    n_flushes, buffer_size = 40, 25
+    errors = multiprocessing.Queue()
+    ready = multiprocessing.Event()
+    write = multiprocessing.Process(target=writer,
+        args=(filename, n_flushes, buffer_size, storage, ready))
+    readers = [multiprocessing.Process(target=reader, args=(filename, n_flushes * 0.005, errors))
+        for _ in range(2)]
+    # readers can only open the file once the writer has switched to SWMR mode
+    write.start()
+    assert ready.wait(30)
+    for proc in readers:
+        proc.start()
+    for proc in [write] + readers:
+        proc.join(60)
+    messages = []
+    while not errors.empty():
+        messages.append(errors.get())
+    assert not messages
+    assert [proc.exitcode for proc in [write] + readers] == [0, 0, 0]
+    with open_swmr(filename) as infile:
+        index = read_rows(infile, ['index'])['index']
+    assert np.array_equal(index, np.arange(buffer_size // 3 + (n_flushes - 1) * buffer_size))
@@ -0,0 +1,42 @@
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from data_logging import H5Writer, Columns, open_swmr, read_rows
+
+DTYPES = OrderedDict([('timestamp', 'f8'), ('x', 'f8'), ('v', ('i4', (3,)))])
+
+def block(start, stop):
+    t = np.arange(start, stop, dtype='f8')
+    return OrderedDict([('timestamp', t), ('x', t * 2),
+        ('v', np.repeat(np.arange(start, stop, dtype='i4')[:,np.newaxis], 3, axis=1))])
+
+@pytest.mark.parametrize('layout', ['columns', 'compound'])
+def test_writer_round_trip(tmp_path, layout):
+    filename = str(tmp_path / 'out.h5')
+    writer = H5Writer(filename, DTYPES, chunk_size=16, layout=layout).open()
+    for start in range(0, 100, 7):
+        writer.append(block(start, min(100, start + 7)))
+    writer.close()
+    expected = block(0, 100)
+    with open_swmr(filename) as infile:
+        assert ('records' in infile) == (layout == 'compound')
+        data = read_rows(infile, list(DTYPES))
+        assert infile.attrs['finalized']
+        assert infile.attrs['n_rows'] == 100
+        assert infile.attrs['first_timestamp'] == 0 and infile.attrs['last_timestamp'] == 99
+    for dataset in DTYPES:
+        assert np.array_equal(data[dataset], expected[dataset])
+
+@pytest.mark.parametrize('layout', ['columns', 'compound'])
+def test_columns(tmp_path, layout):
+    filename = str(tmp_path / 'out.h5')
+    writer = H5Writer(filename, DTYPES, layout=layout)
+    writer.append(block(0, 5))
+    writer.close()
+    with open_swmr(filename) as infile:
+        columns = Columns(infile)
+        assert sorted(columns.keys()) == sorted(DTYPES)
+        assert list(columns['x'][1:3]) == [2., 4.]
+        assert columns['v'][4:5].tolist() == [[4, 4, 4]]
@@ -0,0 +1,37 @@
+import pytest
+
+from data_logging import WriterThread
+
+def test_writer_thread_writes_in_order():
+    written = []
+    thread = WriterThread(written.append, queue_size=2)
+    thread.start()
+    for i in range(10):
+        thread.put(i)
+    thread.sync()
+    assert written == list(range(10))
+    thread.stop()
+
+def test_writer_thread_error_is_raised():
+    def write(item):
+        raise OSError('disk full')
+    thread = WriterThread(write, queue_size=1)
+    thread.start()
+    # the producer doesn't block on the full queue once the writer has failed
+    with pytest.raises(OSError):
+        for i in range(10):
+            thread.put(i)
+    with pytest.raises(OSError):
+        thread.sync()
+    with pytest.raises(OSError):
+        thread.stop()
+
+def test_writer_thread_drop():
+    written = []
+    thread = WriterThread(written.append, queue_size=2, backpressure='drop')
+    for i in range(5):
+        thread.put(i)
+    assert thread.dropped == 3
+    thread.start()
+    thread.stop()
+    assert written == [3, 4]